@@ -0,0 +1,181 @@
+"""Almacén de contenido en memoria para menu.json.
+
+Los archivos se leen y validan una sola vez al arrancar. Después, un hilo
+revisa el mtime de cada archivo y, si cambió (o si llega SIGHUP), construye
+un contenido nuevo y lo publica con una sola asignación, de modo que el
+webhook nunca lee disco ni parsea JSON.
+
+Cada carpeta de sprint se ejecuta sola (`python main.py` desde ella) y
+tiene su propia copia de este módulo. Esta es la del Sprint 1: solo
+menu.json, un suscriptor por app y avisos con print() como el resto del
+Sprint 1. La de Sprint 2 agrega ejercicios.json, palabras_crisis, la
+recarga en dos fases y el registro estructurado.
+"""
+import json
+import os
+import signal
+import threading
+
+
+class ErrorContenido(Exception):
+    """El archivo no existe, no es JSON válido o no tiene la forma esperada."""
+
+
+# Validaciones por tipo de archivo
+def validar_menu(menu):
+    for clave in ("bienvenida", "menu_principal", "ayuda_urgente"):
+        if clave not in menu:
+            raise ErrorContenido(f"menu.json: falta la clave '{clave}'")
+    if "mensaje" not in menu["ayuda_urgente"]:
+        raise ErrorContenido("menu.json: falta ayuda_urgente.mensaje")
+    principal = menu["menu_principal"]
+    if "titulo" not in principal or "opciones" not in principal:
+        raise ErrorContenido("menu.json: menu_principal necesita 'titulo' y 'opciones'")
+    ids = set()
+    for opcion in principal["opciones"]:
+        for clave in ("id", "emoji", "nombre", "descripcion", "categoria"):
+            if clave not in opcion:
+                raise ErrorContenido(f"menu.json: opción sin '{clave}': {opcion}")
+        if opcion["id"] in ids:
+            raise ErrorContenido(f"menu.json: id de opción repetido: {opcion['id']}")
+        ids.add(opcion["id"])
+
+
+VALIDADORES = {
+    "menu": validar_menu,
+}
+
+
+class Contenido:
+    """Foto inmutable del contenido cargado, con índices precalculados."""
+
+    def __init__(self, datos, mtimes, version):
+        self.datos = datos
+        self.mtimes = mtimes
+        self.version = version
+        self.menu = datos.get("menu")
+
+        self.opciones_por_id = {}
+        self.opciones_por_categoria = {}
+        if self.menu:
+            for opcion in self.menu["menu_principal"]["opciones"]:
+                self.opciones_por_id[opcion["id"]] = opcion
+                self.opciones_por_categoria.setdefault(opcion["categoria"], []).append(opcion)
+
+
+def leer_json(archivo):
+    try:
+        with open(archivo, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise ErrorContenido(f"No se encuentra {archivo}")
+    except json.JSONDecodeError as e:
+        raise ErrorContenido(f"JSON inválido en {archivo}: {e}")
+
+
+class AlmacenContenido:
+    """Carga un conjunto de archivos JSON y los mantiene actualizados.
+
+    `archivos` es un dict nombre -> ruta, por ejemplo
+    {"menu": "menu.json"}.
+    """
+
+    def __init__(self, archivos, intervalo=2.0):
+        self.archivos = dict(archivos)
+        self.intervalo = intervalo
+        self.recargas = 0
+        self.errores_recarga = 0
+        self._contenido = None
+        self._suscriptores = []
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _mtimes(self):
+        mtimes = {}
+        for nombre, ruta in self.archivos.items():
+            try:
+                mtimes[nombre] = os.stat(ruta).st_mtime_ns
+            except OSError:
+                mtimes[nombre] = None
+        return mtimes
+
+    def _construir(self):
+        mtimes = self._mtimes()
+        datos = {}
+        for nombre, ruta in self.archivos.items():
+            datos[nombre] = leer_json(ruta)
+            validador = VALIDADORES.get(nombre)
+            if validador:
+                validador(datos[nombre])
+        version = self._contenido.version + 1 if self._contenido else 1
+        return Contenido(datos, mtimes, version)
+
+    def cargar(self):
+        """Carga (o recarga) todo el contenido. Lanza ErrorContenido si falla."""
+        with self._lock:
+            nuevo = self._construir()
+            for callback in self._suscriptores:
+                callback(nuevo)
+            self._contenido = nuevo
+            self.recargas += 1
+        return nuevo
+
+    def recargar(self):
+        """Como cargar(), pero conserva el contenido anterior si el nuevo es inválido."""
+        try:
+            contenido = self.cargar()
+            print(f"🔄 Contenido recargado (versión {contenido.version})")
+            return True
+        except Exception as e:
+            self.errores_recarga += 1
+            print(f"❌ ERROR al recargar contenido, se mantiene la versión anterior: {e}")
+            return False
+
+    def actual(self):
+        """Devuelve el contenido vigente sin tocar disco."""
+        contenido = self._contenido
+        if contenido is None:
+            contenido = self.cargar()
+        return contenido
+
+    def suscribir(self, callback):
+        """Registra una función que recibe cada Contenido nuevo antes de publicarlo.
+
+        Sirve para reconstruir cachés derivadas (textos, índices) en la misma
+        recarga. Si el contenido ya está cargado, se llama de inmediato.
+        """
+        with self._lock:
+            self._suscriptores.append(callback)
+            if self._contenido is not None:
+                callback(self._contenido)
+
+    def revisar_cambios(self):
+        contenido = self._contenido
+        if contenido is None or self._mtimes() != contenido.mtimes:
+            return self.recargar()
+        return False
+
+    def _vigilar(self):
+        while not self._detener.wait(self.intervalo):
+            self.revisar_cambios()
+
+    def iniciar(self):
+        """Carga el contenido, arranca el vigilante de mtime y escucha SIGHUP."""
+        self.actual()
+        if self._hilo is None and self.intervalo > 0:
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._vigilar, name="vigilante-contenido", daemon=True)
+            self._hilo.start()
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            # La recarga va en otro hilo: el manejador de señal no debe esperar el lock
+            signal.signal(
+                signal.SIGHUP,
+                lambda signum, frame: threading.Thread(target=self.recargar, daemon=True).start(),
+            )
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=self.intervalo + 1)
+            self._hilo = None
@@ -0,0 +1,143 @@
+"""Páginas estáticas del proyecto (index.html, Infografia.html) servidas por la API.
+
+Al arrancar se lee cada archivo una vez y se preparan sus variantes: tal
+cual, gzip y, si está instalado el paquete `brotli`, brotli. Los archivos
+con el mismo contenido comparten las variantes (index.html e
+Infografia.html son idénticos). Cada variante tiene su ETag fuerte (hash
+del contenido más la codificación), así que el cliente revalida con
+If-None-Match y recibe 304 sin cuerpo.
+
+La codificación se elige por Accept-Encoding (br, luego gzip) y la
+respuesta lleva Vary: Accept-Encoding para que los proxies guarden cada
+variante por separado. Solo se usa una variante comprimida si ocupa menos.
+
+uvicorn no tiene sendfile: el camino con menos copias es escribir los
+bytes ya comprimidos que están en memoria, sin abrir el archivo en cada
+petición.
+"""
+import gzip
+import hashlib
+import os
+
+from fastapi.responses import Response
+
+from respuestas import coincide_etag
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli se sirve gzip
+    brotli = None
+
+TIPOS = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".ico": "image/x-icon",
+}
+# Los que ya vienen comprimidos no ganan nada con gzip
+SIN_COMPRIMIR = (".png", ".jpg", ".ico")
+
+
+def comprimir(datos, extension):
+    """{codificación: bytes} con las variantes que ocupan menos que el original."""
+    variantes = {"identity": datos}
+    if extension in SIN_COMPRIMIR:
+        return variantes
+    # mtime=0: la misma entrada da los mismos bytes en cada arranque y en cada worker
+    comprimido = gzip.compress(datos, compresslevel=9, mtime=0)
+    if len(comprimido) < len(datos):
+        variantes["gzip"] = comprimido
+    if brotli is not None:
+        comprimido = brotli.compress(datos, quality=11)
+        if len(comprimido) < len(datos):
+            variantes["br"] = comprimido
+    return variantes
+
+
+def elegir_codificacion(accept_encoding, disponibles):
+    """La mejor codificación que acepta el cliente: br > gzip > identity, respetando q=0."""
+    aceptadas = {}
+    for parte in (accept_encoding or "").lower().split(","):
+        nombre, _, parametros = parte.partition(";")
+        nombre = nombre.strip()
+        if not nombre:
+            continue
+        calidad = 1.0
+        parametro, _, valor = parametros.strip().partition("=")
+        if parametro.strip() == "q":
+            try:
+                calidad = float(valor)
+            except ValueError:
+                calidad = 0.0
+        aceptadas[nombre] = calidad
+    for codificacion in ("br", "gzip"):
+        calidad = aceptadas.get(codificacion, aceptadas.get("*", 0.0))
+        if codificacion in disponibles and calidad > 0:
+            return codificacion
+    return "identity"
+
+
+class Variante:
+    __slots__ = ("cuerpo", "etag", "cabeceras", "cabeceras_304")
+
+    def __init__(self, cuerpo, etag, tipo, codificacion, cache_control):
+        self.cuerpo = cuerpo
+        self.etag = etag
+        self.cabeceras_304 = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        self.cabeceras = dict(self.cabeceras_304)
+        if codificacion != "identity":
+            self.cabeceras["Content-Encoding"] = codificacion
+        self.cabeceras["Content-Type"] = tipo
+
+
+class Estaticos:
+    """Archivos de `directorio` precomprimidos en memoria, por nombre."""
+
+    def __init__(self, directorio, nombres, max_age=86400):
+        self.directorio = directorio
+        self.nombres = list(nombres)
+        self.cache_control = f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+        self.archivos = {}  # nombre -> {codificación: Variante}
+
+    def cargar(self):
+        """Lee y comprime todos los archivos. Un archivo que falta se avisa y no se sirve."""
+        por_hash = {}  # (hash, tipo) -> variantes compartidas
+        archivos = {}
+        for nombre in self.nombres:
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                with open(ruta, "rb") as f:
+                    datos = f.read()
+            except OSError as e:
+                print(f"⚠️ Estático no disponible: {ruta} ({e})")
+                continue
+            extension = os.path.splitext(nombre)[1].lower()
+            tipo = TIPOS.get(extension, "application/octet-stream")
+            digest = hashlib.blake2b(datos, digest_size=16).hexdigest()
+            variantes = por_hash.get((digest, tipo))
+            if variantes is None:
+                variantes = {
+                    codificacion: Variante(
+                        cuerpo,
+                        f'"{digest}"' if codificacion == "identity" else f'"{digest}-{codificacion}"',
+                        tipo, codificacion, self.cache_control)
+                    for codificacion, cuerpo in comprimir(datos, extension).items()
+                }
+                por_hash[(digest, tipo)] = variantes
+            archivos[nombre] = variantes
+
+        self.archivos = archivos
+
+    def responder(self, request, nombre):
+        """200 con la variante que acepta el cliente, 304 si ya la tiene, o None si no existe."""
+        variantes = self.archivos.get(nombre)
+        if variantes is None:
+            return None
+        codificacion = elegir_codificacion(request.headers.get("accept-encoding"), variantes)
+        variante = variantes[codificacion]
+        if coincide_etag(request.headers.get("if-none-match"), variante.etag):
+            return Response(status_code=304, headers=variante.cabeceras_304)
+        return Response(content=variante.cuerpo, headers=variante.cabeceras)
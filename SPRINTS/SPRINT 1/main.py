@@ -1,7 +1,10 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
 from pydantic import BaseModel
-import json
-import uvicorn
+import os
+from contenido import AlmacenContenido
+from estaticos import Estaticos
+from respuestas import CacheRespuestas, CuerpoJSON
 
 app = FastAPI(title="AIuda API", version="1.0.0")
 
@@ -9,103 +12,102 @@ app = FastAPI(title="AIuda API", version="1.0.0")
 class SeleccionUsuario(BaseModel):
     opcion: int
 
-# Cargar configuración
-def cargar_menu():
-    with open("menu.json", "r", encoding="utf-8") as f:
-        return json.load(f)
+# Cargar configuración (una vez al arrancar; se recarga si menu.json cambia)
+almacen_contenido = AlmacenContenido(
+    {"menu": "menu.json"},
+    intervalo=float(os.getenv("CONTENIDO_INTERVALO", "2")),
+)
 
-# Formatear menú principal
-def formatear_menu_principal(menu_data):
-    mensaje = menu_data["bienvenida"] + "\n\n"
-    mensaje += menu_data["menu_principal"]["titulo"] + "\n\n"
-    
-    for opcion in menu_data["menu_principal"]["opciones"]:
-        mensaje += f"{opcion['emoji']} {opcion['id']}. {opcion['nombre']}\n"
-        mensaje += f"   {opcion['descripcion']}\n\n"
-    
-    mensaje += "Escribe el número de la opción que prefieras."
-    return mensaje
+# Respuestas serializadas una vez por versión del contenido, con ETag
+cache_respuestas = CacheRespuestas(max_age=int(os.getenv("CACHE_MAX_AGE", "60")))
+almacen_contenido.suscribir(cache_respuestas.construir)
+
+# Páginas del proyecto (raíz del repo), comprimidas una vez al arrancar
+estaticos = Estaticos(
+    os.getenv("ESTATICOS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")),
+    os.getenv("ESTATICOS_ARCHIVOS", "index.html,Infografia.html").split(","),
+    max_age=int(os.getenv("ESTATICOS_MAX_AGE", "86400")),
+)
+
+def cuerpos():
+    # Carga el contenido si todavía no se cargó (la caché se arma en esa carga)
+    almacen_contenido.actual()
+    return cache_respuestas
+
+# Ciclo de vida
+@app.on_event("startup")
+def iniciar_contenido():
+    almacen_contenido.iniciar()
+    estaticos.cargar()
+
+@app.on_event("shutdown")
+def detener_contenido():
+    almacen_contenido.detener()
 
 # Endpoints
-@app.get("/")
-def root():
-    return {
-        "status": "✅ AIuda API funcionando",
-        "version": "1.0.0",
-        "endpoints": {
-            "menu": "/menu",
-            "seleccionar": "/seleccionar (POST)",
-            "ayuda_urgente": "/urgente"
-        }
+RAIZ = CuerpoJSON({
+    "status": "✅ AIuda API funcionando",
+    "version": "1.0.0",
+    "endpoints": {
+        "menu": "/menu",
+        "seleccionar": "/seleccionar (POST)",
+        "ayuda_urgente": "/urgente",
+        "infografia": "/index.html"
     }
+})
+
+@app.get("/")
+def root(request: Request):
+    return cache_respuestas.responder(request, RAIZ)
 
 @app.get("/menu")
-def mostrar_menu():
+def mostrar_menu(request: Request):
     """Muestra el menú principal con todas las opciones"""
-    menu = cargar_menu()
-    mensaje = formatear_menu_principal(menu)
-    
-    return {
-        "message": mensaje,
-        "opciones": menu["menu_principal"]["opciones"]
-    }
+    return cache_respuestas.responder(request, cuerpos().menu)
 
 @app.post("/seleccionar")
 def seleccionar_opcion(seleccion: SeleccionUsuario):
     """Procesa la selección del usuario"""
-    menu = cargar_menu()
-    
-    # Buscar opción
-    opcion_elegida = None
-    for opcion in menu["menu_principal"]["opciones"]:
-        if opcion["id"] == seleccion.opcion:
-            opcion_elegida = opcion
-            break
+    cuerpo = cuerpos().selecciones.get(seleccion.opcion)
     
-    if not opcion_elegida:
+    if not cuerpo:
         raise HTTPException(
             status_code=400, 
             detail="Opción inválida. Por favor elige un número del 1 al 6."
         )
     
-    # Caso especial: Ayuda urgente
-    if opcion_elegida["categoria"] == "urgente":
-        return {
-            "tipo": "urgente",
-            "message": menu["ayuda_urgente"]["mensaje"],
-            "recursos": menu["ayuda_urgente"]["recursos"]
-        }
-    
-    # Respuesta para otras categorías
-    return {
-        "tipo": opcion_elegida["categoria"],
-        "message": f"✅ Has elegido: {opcion_elegida['nombre']}\n\n{opcion_elegida['descripcion']}",
-        "tecnica": opcion_elegida,
-        "siguiente_paso": f"Preparando {opcion_elegida['nombre'].lower()}..."
-    }
+    # POST: sin ETag ni 304, pero el cuerpo ya está serializado
+    return Response(content=cuerpo.cuerpo, media_type="application/json")
 
 @app.get("/urgente")
-def ayuda_urgente():
+def ayuda_urgente(request: Request):
     """Muestra recursos de ayuda inmediata"""
-    menu = cargar_menu()
-    return {
-        "message": menu["ayuda_urgente"]["mensaje"],
-        "recursos": menu["ayuda_urgente"]["recursos"]
-    }
+    return cache_respuestas.responder(request, cuerpos().urgente)
 
 @app.get("/categoria/{nombre}")
-def obtener_por_categoria(nombre: str):
+def obtener_por_categoria(nombre: str, request: Request):
     """Obtiene opciones por categoría"""
-    menu = cargar_menu()
-    opciones = [
-        op for op in menu["menu_principal"]["opciones"] 
-        if op["categoria"] == nombre
-    ]
+    cuerpo = cuerpos().categorias.get(nombre)
     
-    if not opciones:
+    if not cuerpo:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     
-    return {"categoria": nombre, "opciones": opciones}
+    return cache_respuestas.responder(request, cuerpo)
+
+@app.api_route("/{nombre}.html", methods=["GET", "HEAD"])
+def pagina_estatica(nombre: str, request: Request):
+    """index.html e Infografia.html, comprimidas según Accept-Encoding"""
+    respuesta = estaticos.responder(request, nombre + ".html")
+    
+    if respuesta is None:
+        raise HTTPException(status_code=404, detail="Página no encontrada")
+    
+    return respuesta
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="192.168.56.1", port=1234)
\ No newline at end of file
+    # La API no guarda estado entre peticiones: con WORKERS > 1 uvicorn levanta
+    # varios procesos sobre el mismo puerto (necesita la app como "main:app")
+    import uvicorn
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run("main:app" if workers > 1 else app,
+                host=os.getenv("HOST", "192.168.56.1"), port=int(os.getenv("PORT", "1234")), workers=workers)
\ No newline at end of file
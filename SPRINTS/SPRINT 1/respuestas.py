@@ -0,0 +1,109 @@
+"""Cuerpos JSON precalculados, con ETag, para las respuestas de la API.
+
+Todo lo que devuelve la API sale de menu.json, que solo cambia cuando se
+edita. Al cargar (o recargar) el contenido se serializa cada respuesta una
+vez y se calcula su ETag fuerte (hash del cuerpo). Los endpoints devuelven
+esos bytes tal cual; si el cliente manda If-None-Match con el ETag vigente
+se responde 304 sin cuerpo. Después de una recarga cambian los bytes y por
+lo tanto el ETag, así que los clientes ven el contenido nuevo al revalidar.
+
+Los cuerpos son idénticos a los que arma JSONResponse de FastAPI.
+"""
+import hashlib
+import json
+
+from fastapi.responses import Response
+
+
+def serializar(datos):
+    """Igual que JSONResponse.render de Starlette."""
+    return json.dumps(datos, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class CuerpoJSON:
+    __slots__ = ("cuerpo", "etag")
+
+    def __init__(self, datos):
+        self.cuerpo = serializar(datos)
+        self.etag = '"' + hashlib.blake2b(self.cuerpo, digest_size=16).hexdigest() + '"'
+
+
+def coincide_etag(if_none_match, etag):
+    """If-None-Match usa comparación débil: W/"x" coincide con "x"."""
+    if not if_none_match:
+        return False
+    if if_none_match == etag or if_none_match.strip() == "*":
+        return True
+    return any(candidato.strip().removeprefix("W/") == etag for candidato in if_none_match.split(","))
+
+
+def formatear_menu_principal(menu_data):
+    mensaje = menu_data["bienvenida"] + "\n\n"
+    mensaje += menu_data["menu_principal"]["titulo"] + "\n\n"
+
+    for opcion in menu_data["menu_principal"]["opciones"]:
+        mensaje += f"{opcion['emoji']} {opcion['id']}. {opcion['nombre']}\n"
+        mensaje += f"   {opcion['descripcion']}\n\n"
+
+    mensaje += "Escribe el número de la opción que prefieras."
+    return mensaje
+
+
+def armar_urgente(menu):
+    # menu.json no trae "recursos" hoy; se devuelve la lista vacía en lugar de fallar
+    return {
+        "message": menu["ayuda_urgente"]["mensaje"],
+        "recursos": menu["ayuda_urgente"].get("recursos", []),
+    }
+
+
+def armar_seleccion(menu, opcion):
+    if opcion["categoria"] == "urgente":
+        return {"tipo": "urgente", **armar_urgente(menu)}
+    return {
+        "tipo": opcion["categoria"],
+        "message": f"✅ Has elegido: {opcion['nombre']}\n\n{opcion['descripcion']}",
+        "tecnica": opcion,
+        "siguiente_paso": f"Preparando {opcion['nombre'].lower()}...",
+    }
+
+
+class CacheRespuestas:
+    """Cuerpos de /menu, /urgente, /categoria/{nombre} y /seleccionar del contenido vigente."""
+
+    def __init__(self, max_age=60):
+        self.cache_control = f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+        self.menu = None
+        self.urgente = None
+        self.categorias = {}  # categoría -> CuerpoJSON
+        self.selecciones = {}  # id de opción -> CuerpoJSON
+
+    def construir(self, contenido):
+        """Suscriptor de AlmacenContenido: serializa todo con el contenido nuevo."""
+        menu = contenido.menu
+        cuerpo_menu = CuerpoJSON({
+            "message": formatear_menu_principal(menu),
+            "opciones": menu["menu_principal"]["opciones"],
+        })
+        urgente = CuerpoJSON(armar_urgente(menu))
+        categorias = {
+            nombre: CuerpoJSON({"categoria": nombre, "opciones": opciones})
+            for nombre, opciones in contenido.opciones_por_categoria.items()
+        }
+        selecciones = {
+            id_opcion: CuerpoJSON(armar_seleccion(menu, opcion))
+            for id_opcion, opcion in contenido.opciones_por_id.items()
+        }
+
+        # Todo se arma antes de publicar; cada atributo cambia con una sola asignación
+        self.selecciones = selecciones
+        self.categorias = categorias
+        self.urgente = urgente
+        self.menu = cuerpo_menu
+
+    def responder(self, request, cuerpo):
+        """200 con el cuerpo precalculado, o 304 si el cliente ya tiene esa versión."""
+        cabeceras = {"ETag": cuerpo.etag, "Cache-Control": self.cache_control}
+        if coincide_etag(request.headers.get("if-none-match"), cuerpo.etag):
+            return Response(status_code=304, headers=cabeceras)
+        return Response(content=cuerpo.cuerpo, media_type="application/json", headers=cabeceras)
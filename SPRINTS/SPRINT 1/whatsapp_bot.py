@@ -1,21 +1,21 @@
 from fastapi import FastAPI, Form, Request
 from fastapi.responses import Response
-from twilio.twiml.messaging_response import MessagingResponse
-import json
-import uvicorn
+import os
+from contenido import AlmacenContenido, ErrorContenido
 
 app = FastAPI(title="AIuda WhatsApp Bot", version="1.0.0")
 
-# Cargar configuración del menú
+# Cargar configuración del menú (una vez al arrancar; se recarga si cambia)
+almacen_contenido = AlmacenContenido(
+    {"menu": "menu.json"},
+    intervalo=float(os.getenv("CONTENIDO_INTERVALO", "2")),
+)
+
 def cargar_menu():
     try:
-        with open("menu.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("❌ ERROR: No se encuentra menu.json")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"❌ ERROR en menu.json: {e}")
+        return almacen_contenido.actual().menu
+    except ErrorContenido as e:
+        print(f"❌ ERROR: {e}")
         return None
 
 # Formatear menú para WhatsApp
@@ -52,20 +52,19 @@ def procesar_mensaje(texto_usuario):
     # Selección por número
     try:
         opcion_num = int(texto)
-        opciones = menu["menu_principal"]["opciones"]
+        opcion = almacen_contenido.actual().opciones_por_id.get(opcion_num)
         
-        for opcion in opciones:
-            if opcion["id"] == opcion_num:
-                # Caso especial: Ayuda urgente
-                if opcion["categoria"] == "urgente":
-                    return menu["ayuda_urgente"]["mensaje"]
-                
-                # Respuesta para otras categorías
-                respuesta = f"{opcion['emoji']} *{opcion['nombre']}*\n\n"
-                respuesta += f"{opcion['descripcion']}\n\n"
-                respuesta += "_Preparando la técnica..._\n\n"
-                respuesta += "Escribe *menu* para volver al inicio."
-                return respuesta
+        if opcion:
+            # Caso especial: Ayuda urgente
+            if opcion["categoria"] == "urgente":
+                return menu["ayuda_urgente"]["mensaje"]
+            
+            # Respuesta para otras categorías
+            respuesta = f"{opcion['emoji']} *{opcion['nombre']}*\n\n"
+            respuesta += f"{opcion['descripcion']}\n\n"
+            respuesta += "_Preparando la técnica..._\n\n"
+            respuesta += "Escribe *menu* para volver al inicio."
+            return respuesta
         
         # Número fuera de rango
         return "❌ Opción no válida. Por favor elige un número del 1 al 6.\n\nEscribe *menu* para ver las opciones."
@@ -74,6 +73,22 @@ def procesar_mensaje(texto_usuario):
         # No es un número
         return "No entendí tu mensaje. 🤔\n\nEscribe *menu* para ver las opciones disponibles."
 
+# Respuesta TwiML (twilio se importa recién con el primer mensaje, no al arrancar)
+def twiml(texto):
+    from twilio.twiml.messaging_response import MessagingResponse
+    resp = MessagingResponse()
+    resp.message(texto)
+    return str(resp)
+
+# Ciclo de vida
+@app.on_event("startup")
+def iniciar_contenido():
+    almacen_contenido.iniciar()
+
+@app.on_event("shutdown")
+def detener_contenido():
+    almacen_contenido.detener()
+
 # Endpoint raíz
 @app.get("/")
 def root():
@@ -109,11 +124,7 @@ async def whatsapp_webhook(
         print(f"   {respuesta_texto[:150]}{'...' if len(respuesta_texto) > 150 else ''}")
         
         # Crear respuesta en formato TwiML
-        resp = MessagingResponse()
-        resp.message(respuesta_texto)
-        
-        # Convertir a XML
-        xml_response = str(resp)
+        xml_response = twiml(respuesta_texto)
         print(f"📋 XML enviado: {xml_response[:200]}...")
         print(f"{'='*60}\n")
         
@@ -131,9 +142,8 @@ async def whatsapp_webhook(
         print(f"{'='*60}\n")
         
         # Respuesta de error para el usuario
-        resp = MessagingResponse()
-        resp.message("Lo siento, hubo un error técnico. 😔\n\nEscribe *menu* para intentar de nuevo.")
-        return Response(content=str(resp), media_type="application/xml")
+        xml_response = twiml("Lo siento, hubo un error técnico. 😔\n\nEscribe *menu* para intentar de nuevo.")
+        return Response(content=xml_response, media_type="application/xml")
 
 # Endpoint de prueba (opcional)
 @app.get("/test")
@@ -158,4 +168,5 @@ if __name__ == "__main__":
     print("📝 Asegúrate de que menu.json esté en la misma carpeta")
     print("="*60 + "\n")
     
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
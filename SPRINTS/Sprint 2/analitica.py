@@ -0,0 +1,207 @@
+"""Eventos de los ejercicios (inicio, paso, fin, cancelación, feedback) y sus embudos.
+
+Anotar un evento es armar una tupla y agregarla a un buffer circular desde
+el hilo del event loop, sin locks ni E/S: unos pocos microsegundos por
+mensaje. Una tarea vuelca el buffer cada `intervalo` segundos en un hilo
+aparte, en una sola transacción de SQLite: los eventos crudos (tabla
+`eventos`) y, en la misma transacción, los contadores del embudo (tabla
+`embudo`, una fila por ejercicio, tipo y paso). Así /admin/analitica/embudo
+lee unas decenas de filas en lugar de recorrer los eventos.
+
+Tipos de evento:
+- inicio: empezó el ejercicio (desde el menú o una difusión)
+- paso: respondió el paso interactivo `paso` (1..n)
+- completado: recibió el último mensaje del ejercicio
+- cancelado: dejó el ejercicio a medias (menu, hola, otro ejercicio); `paso`
+  es el último paso interactivo que respondió
+- feedback: la respuesta libre después del ejercicio, en `texto`
+
+Si el buffer se llena (el disco no da abasto) se pierden los eventos más
+viejos y se cuentan en `descartados`; el webhook nunca espera. Los números
+se guardan seudonimizados como en el registro (redactar_telefono con la
+misma sal), pero los textos de feedback son del usuario tal cual.
+
+Varios workers pueden compartir el archivo (modo WAL): cada uno suma sus
+eventos a los mismos contadores.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from registro import obtener_registro, redactar_telefono
+
+registro = obtener_registro("analitica")
+
+MAX_TEXTO = 1000
+
+
+class Analitica:
+
+    def __init__(self, ruta="analitica.db", intervalo=1.0, capacidad=100_000, sal="aiuda"):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.capacidad = capacidad
+        self.sal = sal
+        self._buffer = deque(maxlen=capacidad)
+        self._lock = threading.Lock()  # la conexión se usa desde los hilos de to_thread
+        self._conexion = None
+        self._pid = None
+        self._escribiendo = asyncio.Lock()
+        self._cerrando = None
+        self._tarea = None
+
+        # Métricas (solo se modifican desde el hilo del event loop)
+        self.registrados = 0
+        self.escritos = 0
+        self.descartados = 0
+        self.lotes = 0
+        self.max_lote = 0
+        self.segundos_max = 0.0
+        self.errores = 0
+
+    # Anotar (hot path: una tupla y un append)
+
+    def registrar(self, tipo, usuario, ejercicio, paso=None, texto=None):
+        if len(self._buffer) == self.capacidad:
+            self.descartados += 1
+        self._buffer.append((time.time(), tipo, usuario, ejercicio, paso, texto))
+        self.registrados += 1
+
+    # SQLite
+
+    def _conectar(self):
+        # Una conexión por proceso: no se comparte a través de fork()
+        if self._conexion is None or self._pid != os.getpid():
+            import sqlite3
+            conexion = sqlite3.connect(self.ruta, timeout=5, check_same_thread=False, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.executescript(
+                "CREATE TABLE IF NOT EXISTS eventos ("
+                " t REAL NOT NULL, tipo TEXT NOT NULL, usuario TEXT NOT NULL, ejercicio TEXT NOT NULL,"
+                " paso INTEGER, texto TEXT);"
+                "CREATE TABLE IF NOT EXISTS embudo ("
+                " ejercicio TEXT NOT NULL, tipo TEXT NOT NULL, paso INTEGER NOT NULL, cantidad INTEGER NOT NULL,"
+                " PRIMARY KEY (ejercicio, tipo, paso));"
+            )
+            self._conexion = conexion
+            self._pid = os.getpid()
+        return self._conexion
+
+    def _escribir(self, lote):
+        """Inserta el lote y suma sus contadores en una sola transacción. Corre en un hilo."""
+        inicio = time.perf_counter()
+        filas = [
+            (t, tipo, redactar_telefono(usuario, self.sal), ejercicio, paso,
+             texto[:MAX_TEXTO] if texto is not None else None)
+            for t, tipo, usuario, ejercicio, paso, texto in lote
+        ]
+        contadores = Counter((ejercicio, tipo, paso or 0) for _, tipo, _, ejercicio, paso, _ in lote)
+        with self._lock:
+            conexion = self._conectar()
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                conexion.executemany(
+                    "INSERT INTO eventos (t, tipo, usuario, ejercicio, paso, texto) VALUES (?, ?, ?, ?, ?, ?)", filas)
+                conexion.executemany(
+                    "INSERT INTO embudo (ejercicio, tipo, paso, cantidad) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT (ejercicio, tipo, paso) DO UPDATE SET cantidad = cantidad + excluded.cantidad",
+                    ((ejercicio, tipo, paso, cantidad) for (ejercicio, tipo, paso), cantidad in contadores.items()))
+                conexion.execute("COMMIT")
+            except BaseException:
+                conexion.execute("ROLLBACK")
+                raise
+        return time.perf_counter() - inicio
+
+    def embudo(self):
+        """Embudo por ejercicio desde los contadores. Bloqueante: usar con asyncio.to_thread.
+
+        Lo anotado en el último `intervalo` todavía puede no estar sumado.
+        """
+        with self._lock:
+            filas = self._conectar().execute("SELECT ejercicio, tipo, paso, cantidad FROM embudo").fetchall()
+        resultado = {}
+        for ejercicio, tipo, paso, cantidad in sorted(filas):
+            datos = resultado.setdefault(ejercicio, {
+                "iniciados": 0, "pasos": {}, "completados": 0, "cancelados": 0,
+                "cancelados_por_paso": {}, "feedback": 0,
+            })
+            if tipo == "inicio":
+                datos["iniciados"] += cantidad
+            elif tipo == "paso":
+                datos["pasos"][paso] = cantidad
+            elif tipo == "completado":
+                datos["completados"] += cantidad
+            elif tipo == "cancelado":
+                datos["cancelados"] += cantidad
+                datos["cancelados_por_paso"][paso] = cantidad
+            elif tipo == "feedback":
+                datos["feedback"] += cantidad
+        for datos in resultado.values():
+            iniciados = datos["iniciados"]
+            datos["tasa_completado"] = round(datos["completados"] / iniciados, 3) if iniciados else None
+        return resultado
+
+    def cerrar(self):
+        with self._lock:
+            if self._conexion is not None and self._pid == os.getpid():
+                self._conexion.close()
+            self._conexion = None
+
+    # Volcar
+
+    async def iniciar(self):
+        if self._tarea is None:
+            self._cerrando = asyncio.Event()
+            self._tarea = asyncio.create_task(self._bucle(), name="analitica")
+
+    async def detener(self):
+        """Vuelca lo pendiente y cierra la base."""
+        if self._tarea is not None:
+            self._cerrando.set()
+            await self._tarea
+            self._tarea = None
+        await self.volcar()
+        self.cerrar()
+
+    async def _bucle(self):
+        while not self._cerrando.is_set():
+            try:
+                await asyncio.wait_for(self._cerrando.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            await self.volcar()
+
+    async def volcar(self):
+        async with self._escribiendo:
+            if not self._buffer:
+                return
+            lote, self._buffer = self._buffer, deque(maxlen=self.capacidad)
+            try:
+                duracion = await asyncio.to_thread(self._escribir, lote)
+            except Exception as e:
+                # sqlite3.Error u OSError: el lote vuelve al buffer (si no entra, se pierde lo más viejo)
+                self.errores += 1
+                registro.error("analitica_no_escrita", eventos=len(lote), error=str(e))
+                self.descartados += max(0, len(lote) + len(self._buffer) - self.capacidad)
+                lote.extend(self._buffer)
+                self._buffer = deque(lote, maxlen=self.capacidad)
+                return
+            self.escritos += len(lote)
+            self.lotes += 1
+            self.max_lote = max(self.max_lote, len(lote))
+            self.segundos_max = max(self.segundos_max, duracion)
+
+    def estadisticas(self):
+        return {
+            "registrados": self.registrados,
+            "escritos": self.escritos,
+            "en_buffer": len(self._buffer),
+            "descartados": self.descartados,
+            "lotes": self.lotes,
+            "max_lote": self.max_lote,
+            "escritura_max_ms": round(self.segundos_max * 1000, 2),
+            "errores": self.errores,
+        }
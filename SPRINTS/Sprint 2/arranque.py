@@ -0,0 +1,68 @@
+"""Tiempos del arranque en frío, desde el exec del proceso hasta la primera respuesta.
+
+Con escalado a cero, lo que tarda el proceso en levantar se suma a la
+respuesta del primer usuario. whatsapp_bot importa este módulo antes que
+cualquier otro y marca cada fase:
+
+- antes_del_modulo: del exec a que empieza a importarse whatsapp_bot (el
+  intérprete, site y uvicorn). Sale de /proc, con la resolución del reloj
+  del kernel (10 ms); None fuera de Linux.
+- modulo: importar whatsapp_bot (FastAPI, pydantic, los módulos propios y
+  armar la app y las rutas)
+- startup: el evento de startup (contenido, diario, trabajadores)
+- primera_respuesta: lo que tardó el primer webhook en responderse (lo
+  que se cargue recién al usarse se paga aquí); sin la espera hasta que
+  llegó
+
+Al responder el primer webhook se registra el evento "arranque" con todas
+las fases; /test las muestra. Para ver qué importación pesa, el informe de
+`python -X importtime` resumido por paquete está en
+benchmarks/arranque_frio.py.
+"""
+import os
+import time
+
+
+def segundos_desde_exec():
+    """Segundos desde que arrancó el proceso, según /proc; None si no se puede saber."""
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            # El nombre del proceso va entre paréntesis y puede tener espacios
+            campos = f.read().rsplit(b")", 1)[1].split()
+        with open("/proc/uptime", "rb") as f:
+            activo = float(f.read().split()[0])
+        # campos[0] es el campo 3 de stat; starttime es el 22, en ticks desde el boot
+        return max(0.0, activo - int(campos[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class Arranque:
+
+    def __init__(self):
+        self.antes_del_modulo = segundos_desde_exec()
+        self.fases = {}  # fase -> segundos, en orden
+        self._marca = time.perf_counter()
+        self.completo = False
+
+    def marcar(self, fase, desde=None):
+        """La fase duró desde la marca anterior (o desde `desde`, un perf_counter) hasta ahora."""
+        ahora = time.perf_counter()
+        self.fases[fase] = ahora - (self._marca if desde is None else desde)
+        self._marca = ahora
+
+    def primera_respuesta(self, registro, inicio):
+        """Lo llama el webhook con el perf_counter de cuando empezó; solo la primera vez hace algo."""
+        if self.completo:
+            return
+        self.completo = True
+        self.marcar("primera_respuesta", desde=inicio)
+        registro.info("arranque", **self.estadisticas())
+
+    def estadisticas(self):
+        fases = {"antes_del_modulo_ms": round(self.antes_del_modulo * 1000, 1)
+                 if self.antes_del_modulo is not None else None}
+        fases.update((f"{fase}_ms", round(segundos * 1000, 1)) for fase, segundos in self.fases.items())
+        conocidas = [v for v in fases.values() if v is not None]
+        fases["total_ms"] = round(sum(conocidas), 1)
+        return fases
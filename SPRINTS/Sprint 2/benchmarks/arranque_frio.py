@@ -0,0 +1,180 @@
+"""Arranque en frío: desde el exec del proceso hasta la primera respuesta de /whatsapp.
+
+Levanta el bot con uvicorn en un subproceso (como en producción, con el
+diario, las difusiones y la analítica en un directorio temporal), le manda
+un "hola" apenas acepta conexiones y mide cuánto tardó la respuesta desde
+el Popen. Lo repite --repeticiones veces y reporta p50 y máximo, junto con
+las fases que midió el propio bot (arranque.py, leídas de /test). Con
+--objetivo falla (código 1) si el p50 lo supera.
+
+Con --importaciones corre una vez más con `python -X importtime` y resume
+qué paquetes pesan más al importar (tiempo propio sumado por paquete, más
+el acumulado de cada módulo del bot).
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/arranque_frio.py --repeticiones 5 --objetivo 1500
+    python benchmarks/arranque_frio.py --importaciones 15
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(AQUI)
+sys.path.insert(0, AQUI)
+
+from carga_webhook import percentil, puerto_libre
+
+LINEA_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+MODULOS_BOT = {os.path.splitext(nombre)[0] for nombre in os.listdir(RAIZ) if nombre.endswith(".py")}
+
+
+def arrancar(puerto, directorio, perfil_importaciones=False):
+    entorno = dict(
+        os.environ,
+        TWILIO_ACCOUNT_SID="",
+        TWILIO_AUTH_TOKEN="",
+        DIARIO_RUTA=os.path.join(directorio, "diario.jsonl"),
+        DIFUSION_SQLITE=os.path.join(directorio, "difusiones.db"),
+        ANALITICA_SQLITE=os.path.join(directorio, "analitica.db"),
+        REGISTRO_CONFIG=json.dumps({"nivel": "WARNING"}),
+        PYTHONPATH=RAIZ,
+    )
+    if perfil_importaciones:
+        entorno["PYTHONPROFILEIMPORTTIME"] = "1"
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "whatsapp_bot:app", "--host", "127.0.0.1",
+         "--port", str(puerto), "--log-level", "warning", "--no-access-log"],
+        cwd=RAIZ, env=entorno, stderr=subprocess.PIPE if perfil_importaciones else None,
+    )
+
+
+def pedir(puerto, metodo, ruta, cuerpo=b""):
+    """Una petición HTTP/1.1 con Connection: close. Devuelve (estado, cuerpo)."""
+    with socket.create_connection(("127.0.0.1", puerto), timeout=30) as s:
+        s.sendall(f"{metodo} {ruta} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+                  f"Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(cuerpo)}\r\n\r\n"
+                  .encode() + cuerpo)
+        datos = b""
+        while True:
+            parte = s.recv(65536)
+            if not parte:
+                break
+            datos += parte
+    cabeza, _, cuerpo_respuesta = datos.partition(b"\r\n\r\n")
+    return int(cabeza.split(b" ", 2)[1]), cuerpo_respuesta
+
+
+def primera_respuesta(proceso, puerto, limite=60.0):
+    """Reintenta el webhook hasta que el bot conteste 200. Devuelve los segundos desde ahora."""
+    cuerpo = urlencode({"From": "whatsapp:+5491100000000", "Body": "hola", "MessageSid": "SMarranque"}).encode()
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError("el bot terminó al arrancar")
+        try:
+            estado, _ = pedir(puerto, "POST", "/whatsapp", cuerpo)
+        except OSError:
+            time.sleep(0.002)
+            continue
+        if estado == 200:
+            return
+        time.sleep(0.002)  # 503 mientras termina el startup
+    raise TimeoutError("el bot no respondió al webhook")
+
+
+def detener(proceso):
+    proceso.terminate()
+    try:
+        return proceso.communicate(timeout=30)[1]
+    except subprocess.TimeoutExpired:
+        proceso.kill()
+        return proceso.communicate()[1]
+
+
+def medir_una():
+    puerto = puerto_libre()
+    inicio = time.perf_counter()
+    proceso = arrancar(puerto, tempfile.mkdtemp(prefix="aiuda-arranque-"))
+    try:
+        primera_respuesta(proceso, puerto)
+        total = time.perf_counter() - inicio
+        _, cuerpo = pedir(puerto, "GET", "/test")
+        fases = json.loads(cuerpo)["arranque"]
+    finally:
+        detener(proceso)
+    return total, fases
+
+
+def informe_importaciones(limite):
+    puerto = puerto_libre()
+    proceso = arrancar(puerto, tempfile.mkdtemp(prefix="aiuda-arranque-"), perfil_importaciones=True)
+    try:
+        primera_respuesta(proceso, puerto)
+    finally:
+        salida = detener(proceso).decode("utf-8", "replace")
+
+    por_paquete = Counter()
+    acumulado_bot = {}
+    total = 0
+    for linea in salida.splitlines():
+        encontrada = LINEA_IMPORTTIME.match(linea)
+        if not encontrada:
+            continue
+        propio, acumulado, _, modulo = encontrada.groups()
+        por_paquete[modulo.split(".")[0]] += int(propio)
+        total += int(propio)
+        if modulo in MODULOS_BOT:
+            acumulado_bot[modulo] = int(acumulado)
+
+    print(f"\n📦 Importaciones hasta la primera respuesta: {total / 1000:.1f} ms")
+    print("  Tiempo propio por paquete:")
+    for paquete, us in por_paquete.most_common(limite):
+        print(f"    {paquete:<28} {us / 1000:8.1f} ms  {us / total:5.1%}")
+    # uvicorn carga whatsapp_bot con importlib.import_module, que -X importtime no mide:
+    # su total es la fase "modulo"; aquí van los módulos propios que importa
+    print("  Acumulado de los módulos del bot (incluye lo que importan):")
+    for modulo, us in sorted(acumulado_bot.items(), key=lambda x: -x[1])[:limite]:
+        print(f"    {modulo:<28} {us / 1000:8.1f} ms")
+    return {"total_ms": round(total / 1000, 1),
+            "por_paquete_ms": {p: round(us / 1000, 1) for p, us in por_paquete.most_common(limite)}}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arranque en frío del bot hasta la primera respuesta")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--objetivo", type=float, default=0.0, help="ms máximos para el p50 (0 = no verificar)")
+    parser.add_argument("--importaciones", type=int, default=0, metavar="N",
+                        help="mostrar los N paquetes que más tardan en importarse")
+    parser.add_argument("--salida", help="archivo JSON para guardar los resultados")
+    args = parser.parse_args()
+
+    totales, fases = [], []
+    for _ in range(args.repeticiones):
+        total, fase = medir_una()
+        totales.append(total * 1000)
+        fases.append(fase)
+        print(f"  {total * 1000:7.1f} ms  {fase}")
+    p50 = percentil(totales, 50)
+    print(f"\n⏱️  exec → primera respuesta: p50 {p50:.1f} ms, máx {max(totales):.1f} ms ({args.repeticiones} corridas)")
+    medianas = {clave: percentil([f[clave] for f in fases if f.get(clave) is not None], 50) for clave in fases[0]}
+    print("  Fases según el bot (p50):", ", ".join(f"{k[:-3]} {v:.1f}" for k, v in medianas.items()))
+
+    resultado = {"fecha": time.strftime("%Y-%m-%dT%H:%M:%S"), "p50_ms": round(p50, 1),
+                 "max_ms": round(max(totales), 1), "fases_p50_ms": medianas}
+    if args.importaciones:
+        resultado["importaciones"] = informe_importaciones(args.importaciones)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    if args.objetivo and p50 > args.objetivo:
+        print(f"❌ p50 {p50:.1f} ms supera el objetivo de {args.objetivo:.0f} ms")
+        sys.exit(1)
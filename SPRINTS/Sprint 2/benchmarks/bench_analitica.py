@@ -0,0 +1,124 @@
+"""Costo de la analítica de ejercicios: anotar en el loop, volcar en lotes y leer el embudo.
+
+Se mide:
+- lo que paga el hilo del event loop por evento (registrar: tupla + append)
+- lo que costaría escribir cada evento en SQLite en el momento (un INSERT
+  con su commit por evento, la alternativa ingenua)
+- el volcado en lotes (eventos crudos + contadores del embudo) en el hilo
+- leer el embudo desde los contadores vs. agregarlo desde los eventos crudos
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/bench_analitica.py --eventos 200000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(AQUI))
+
+from analitica import Analitica
+
+EJERCICIOS = ("respiracion", "grounding", "mindfulness")
+
+
+def eventos_simulados(n, azar):
+    """Secuencias como las del bot: inicio, pasos, y completado + feedback o cancelado."""
+    eventos = []
+    while len(eventos) < n:
+        usuario = f"whatsapp:+549{azar.randrange(10**9):09d}"
+        ejercicio = azar.choice(EJERCICIOS)
+        eventos.append(("inicio", usuario, ejercicio, None, None))
+        pasos = 5 if ejercicio == "grounding" else 0
+        respondidos = azar.randint(0, pasos)
+        for paso in range(1, respondidos + 1):
+            eventos.append(("paso", usuario, ejercicio, paso, None))
+        if respondidos == pasos and azar.random() < 0.8:
+            eventos.append(("completado", usuario, ejercicio, None, None))
+            eventos.append(("feedback", usuario, ejercicio, None, "me ayudó bastante, gracias"))
+        else:
+            eventos.append(("cancelado", usuario, ejercicio, respondidos, None))
+    return eventos[:n]
+
+
+def medir_registrar(analitica, eventos):
+    registrar = analitica.registrar
+    inicio = time.perf_counter()
+    for tipo, usuario, ejercicio, paso, texto in eventos:
+        registrar(tipo, usuario, ejercicio, paso, texto)
+    return (time.perf_counter() - inicio) / len(eventos)
+
+
+def medir_insert_directo(ruta, eventos):
+    conexion = sqlite3.connect(ruta, isolation_level=None)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    conexion.execute("CREATE TABLE eventos (t REAL, tipo TEXT, usuario TEXT, ejercicio TEXT, paso INTEGER, texto TEXT)")
+    inicio = time.perf_counter()
+    for tipo, usuario, ejercicio, paso, texto in eventos:
+        conexion.execute("INSERT INTO eventos VALUES (?, ?, ?, ?, ?, ?)",
+                         (time.time(), tipo, usuario, ejercicio, paso, texto))
+    duracion = time.perf_counter() - inicio
+    conexion.close()
+    return duracion / len(eventos)
+
+
+def embudo_crudo(ruta):
+    """El mismo embudo agregando los eventos crudos en cada consulta."""
+    conexion = sqlite3.connect(ruta)
+    filas = conexion.execute(
+        "SELECT ejercicio, tipo, COALESCE(paso, 0), COUNT(*) FROM eventos GROUP BY 1, 2, 3").fetchall()
+    conexion.close()
+    return filas
+
+
+async def correr(args):
+    azar = random.Random(7)
+    eventos = eventos_simulados(args.eventos, azar)
+    directorio = tempfile.mkdtemp(prefix="aiuda-analitica-")
+
+    analitica = Analitica(os.path.join(directorio, "analitica.db"), capacidad=args.eventos)
+    us_registrar = 1e6 * medir_registrar(analitica, eventos)
+    inicio = time.perf_counter()
+    await analitica.volcar()
+    volcado = time.perf_counter() - inicio
+
+    # Lo directo se mide con menos eventos: un commit por evento es lento
+    directos = eventos[:min(len(eventos), 5000)]
+    us_directo = 1e6 * medir_insert_directo(os.path.join(directorio, "directo.db"), directos)
+
+    inicio = time.perf_counter()
+    for _ in range(args.lecturas):
+        embudo = analitica.embudo()
+    ms_embudo = 1000 * (time.perf_counter() - inicio) / args.lecturas
+    inicio = time.perf_counter()
+    for _ in range(args.lecturas):
+        embudo_crudo(analitica.ruta)
+    ms_crudo = 1000 * (time.perf_counter() - inicio) / args.lecturas
+    analitica.cerrar()
+
+    print(f"📊 {len(eventos)} eventos")
+    print("En el hilo del event loop, por evento:")
+    print(f"  registrar (buffer circular)        {us_registrar:8.2f} µs")
+    print(f"  INSERT + commit directo            {us_directo:8.2f} µs  ({us_directo / us_registrar:.0f}x)")
+    print("En el hilo del volcado:")
+    print(f"  lote completo                      {volcado * 1000:8.1f} ms  "
+          f"({1e6 * volcado / len(eventos):.2f} µs/evento)")
+    print("Leer el embudo:")
+    print(f"  desde los contadores               {ms_embudo:8.2f} ms")
+    print(f"  agregando los eventos crudos       {ms_crudo:8.2f} ms  ({ms_crudo / ms_embudo:.0f}x)")
+    for ejercicio, datos in embudo.items():
+        print(f"  {ejercicio:<12} iniciados {datos['iniciados']:>6}  completados {datos['completados']:>6}  "
+              f"tasa {datos['tasa_completado']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eventos", type=int, default=200_000)
+    parser.add_argument("--lecturas", type=int, default=20)
+    asyncio.run(correr(parser.parse_args()))
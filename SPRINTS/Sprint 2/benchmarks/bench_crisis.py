@@ -0,0 +1,162 @@
+"""Detector de frases de crisis: autómata vs. regex con alternativas vs. `in` por frase.
+
+Genera mensajes al estilo de las respuestas libres del grounding y del
+feedback (con ~1% que contienen una frase de crisis escrita de distintas
+formas) y mide, sobre el mismo texto ya normalizado (con las letras
+repetidas colapsadas, que la regex y `in` necesitan):
+- DetectorCrisis (tabla de transiciones, una pasada)
+- una regex con todas las frases como alternativas
+- `frase in texto` para cada frase
+y además el costo completo por mensaje (normalizar + buscar, que no
+colapsa porque el autómata salta las repeticiones), comparado con el del
+clasificador de intenciones y con colapsar(). Verifica que los tres
+encuentren lo mismo.
+
+Después repite con --frases_extra frases inventadas, para ver cómo crece
+cada uno con el tamaño de la lista, y recorre un corpus grande de una
+sola pieza (--megabytes) para medir el rendimiento en MB/s.
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/bench_crisis.py --mensajes 100000 --frases_extra 500 --megabytes 20
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(AQUI))
+os.chdir(os.path.dirname(AQUI))
+
+from crisis import TABLA_SIMBOLOS, DetectorCrisis, patron
+from intenciones import ClasificadorIntenciones, colapsar, normalizar_base
+
+PALABRAS = ("veo", "una", "mesa", "silla", "ventana", "escucho", "autos", "música", "siento", "la", "ropa",
+            "huele", "a", "café", "tengo", "sabor", "menta", "me", "mejor", "gracias", "hoy", "no", "puedo",
+            "dormir", "quiero", "vivir", "tranquila", "ayudó", "bastante", "más", "😊", "😔", "...")
+VARIANTES = (str, str.upper, str.capitalize, lambda t: t + "!!!", lambda t: t.replace("a", "aaa", 1))
+
+
+class Contenido:
+    def __init__(self, menu):
+        self.menu = menu
+
+
+def leer_menu():
+    with open("menu.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def mensajes(n, frases, azar):
+    textos = []
+    for _ in range(n):
+        palabras = azar.choices(PALABRAS, k=azar.randint(2, 25))
+        if azar.random() < 0.01:
+            frase = azar.choice(VARIANTES)(azar.choice(frases).rstrip("*"))
+            palabras.insert(azar.randrange(len(palabras) + 1), frase)
+        textos.append(" ".join(palabras))
+    return textos
+
+
+def frases_inventadas(n, azar):
+    letras = "abcdefghijklmnopqrstuvwxyz"
+    return [" ".join("".join(azar.choices(letras, k=azar.randint(3, 8))) for _ in range(azar.randint(1, 3)))
+            for _ in range(n)]
+
+
+def buscadores(frases):
+    """(nombre, función sobre el texto normalizado y con espacios) para los tres métodos."""
+    detector = DetectorCrisis()
+    detector.construir(Contenido({"palabras_crisis": frases}))
+    transiciones, halladas = detector._transiciones, detector._halladas
+
+    def automata(bruto):
+        estado = 0
+        for simbolo in bruto.translate(TABLA_SIMBOLOS):
+            estado = transiciones[estado + simbolo]
+        return estado in halladas
+
+    patrones = [p for p in map(patron, frases) if p]
+    expresion = re.compile("|".join(re.escape(p) for p in sorted(patrones, key=len, reverse=True)).encode())
+
+    def regex(bruto):
+        return expresion.search(bruto) is not None
+
+    patrones_bytes = [p.encode() for p in patrones]
+
+    def en_cada_frase(bruto):
+        return any(p in bruto for p in patrones_bytes)
+
+    return detector, [("autómata", automata), ("regex", regex), ("in por frase", en_cada_frase)]
+
+
+def medir(funcion, textos):
+    inicio = time.perf_counter()
+    resultados = [funcion(t) for t in textos]
+    return time.perf_counter() - inicio, resultados
+
+
+def comparar(frases, textos, titulo):
+    normalizados = [b" " + colapsar(normalizar_base(t)).encode("ascii") + b" " for t in textos]
+    detector, metodos = buscadores(frases)
+    print(f"\n{titulo}: {len(frases)} frases, {detector.estadisticas()['estados']} estados, "
+          f"{len(textos)} mensajes ({sum(map(len, normalizados)) / len(textos):.0f} bytes normalizados en promedio)")
+    referencia = None
+    for nombre, funcion in metodos:
+        segundos, resultados = medir(funcion, normalizados)
+        if referencia is None:
+            referencia = resultados
+        coincide = "✅" if resultados == referencia else "❌ no coincide con el autómata"
+        print(f"  {nombre:<14} {1e6 * segundos / len(textos):7.2f} µs/mensaje  {coincide}")
+    return detector, sum(referencia)
+
+
+def corpus_grande(frases, megabytes, azar):
+    bloque = " ".join(mensajes(20000, frases, azar))
+    texto = (bloque + " ") * max(1, int(megabytes * 2**20 // (len(bloque) + 1)))
+    inicio = time.perf_counter()
+    bruto = b" " + normalizar_base(texto).encode("ascii") + b" "
+    normalizar_s = time.perf_counter() - inicio
+    _, metodos = buscadores(frases)
+    automata = dict(metodos)["autómata"]
+    inicio = time.perf_counter()
+    automata(bruto)
+    recorrer_s = time.perf_counter() - inicio
+    mb = len(texto.encode()) / 2**20
+    print(f"\nCorpus de {mb:.1f} MB en una pieza:")
+    print(f"  normalizar  {normalizar_s:6.2f} s  {mb / normalizar_s:7.1f} MB/s")
+    print(f"  recorrer    {recorrer_s:6.2f} s  {mb / recorrer_s:7.1f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mensajes", type=int, default=100_000)
+    parser.add_argument("--frases_extra", type=int, default=500)
+    parser.add_argument("--megabytes", type=float, default=20)
+    args = parser.parse_args()
+
+    azar = random.Random(7)
+    menu = leer_menu()
+    frases = menu["palabras_crisis"]
+    textos = mensajes(args.mensajes, frases, azar)
+    detector, con_crisis = comparar(frases, textos, "Frases de menu.json")
+    print(f"  mensajes con una frase de crisis: {con_crisis}")
+
+    # Lo que cuesta de verdad en el webhook: normalizar + buscar, al lado del clasificador
+    clasificador = ClasificadorIntenciones()
+    clasificador.construir(Contenido(menu))
+    segundos, _ = medir(detector.buscar, textos)
+    segundos_clasificar, _ = medir(clasificador.clasificar, textos)
+    segundos_colapsar, _ = medir(colapsar, [normalizar_base(t) for t in textos])
+    print(f"  buscar() completo (normalizar + autómata)  {1e6 * segundos / len(textos):7.2f} µs/mensaje")
+    print(f"  clasificar() del mismo mensaje             {1e6 * segundos_clasificar / len(textos):7.2f} µs/mensaje")
+    print(f"  colapsar() que el autómata se ahorra       {1e6 * segundos_colapsar / len(textos):7.2f} µs/mensaje")
+
+    if args.frases_extra:
+        comparar(frases + frases_inventadas(args.frases_extra, azar), textos[:max(1, len(textos) // 5)],
+                 f"Con {args.frases_extra} frases más")
+    if args.megabytes:
+        corpus_grande(frases, args.megabytes, azar)
@@ -0,0 +1,136 @@
+"""Diario de sesiones: costo de anotar y tiempo de reinicio con N sesiones.
+
+Cada fase corre en un proceso aparte, como un deploy real:
+
+1. escribir: N usuarios eligen respiración, grounding o mindfulness
+   (procesar_mensaje directo, cediendo el loop cada 1000 para que el
+   diario vuelque en paralelo). Se corre sin diario y con diario y se
+   compara el costo por mensaje.
+2. reiniciar: un proceso nuevo arranca con ese diario; se mide el startup
+   completo (lectura + sesiones + ejercicios re-programados).
+3. compactar y reiniciar otra vez, ahora desde la foto compactada.
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/bench_diario.py --sesiones 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(AQUI)
+
+
+async def fase_escribir(bot, sesiones):
+    from cliente_asgi import vida
+
+    async with vida(bot.app):
+        inicio = time.perf_counter()
+        for i in range(sesiones):
+            bot.procesar_mensaje(f"whatsapp:+51930{i:06d}", "123"[i % 3])
+            if i % 1000 == 999:
+                await asyncio.sleep(0)
+        duracion = time.perf_counter() - inicio
+        await asyncio.sleep(0.2)
+        resultado = {"us_por_mensaje": round(1e6 * duracion / sesiones, 2)}
+    if bot.diario is not None:
+        resultado.update(bot.diario.estadisticas())
+        resultado["mb_archivo"] = round(os.path.getsize(bot.DIARIO_RUTA) / 1e6, 1)
+    return resultado
+
+
+async def fase_reiniciar(bot, compactar):
+    from cliente_asgi import vida
+
+    inicio = time.perf_counter()
+    async with vida(bot.app):
+        arranque = time.perf_counter() - inicio
+        resultado = {
+            "arranque_s": round(arranque, 3),
+            "lectura_s": bot.diario.estadisticas()["segundos_carga"],
+            "sesiones": len(bot.almacen_sesiones),
+            "ejercicios_en_curso": bot.planificador.estadisticas()["ejecuciones_activas"],
+            "pasos_saltados": bot.planificador.pasos_saltados,
+            "registros_leidos": bot.diario.estadisticas()["registros_en_archivo"],
+        }
+        if compactar:
+            inicio = time.perf_counter()
+            await bot.diario.compactar()
+            resultado["compactar_s"] = round(time.perf_counter() - inicio, 3)
+            resultado["registros_tras_compactar"] = bot.diario.estadisticas()["registros_en_archivo"]
+    return resultado
+
+
+def hijo(args):
+    sys.path.insert(0, AQUI)
+    sys.path.insert(0, RAIZ)
+    os.chdir(RAIZ)
+    inicio = time.perf_counter()
+    import whatsapp_bot as bot
+    importar = time.perf_counter() - inicio
+    if args.fase == "escribir":
+        resultado = asyncio.run(fase_escribir(bot, args.sesiones))
+    else:
+        resultado = asyncio.run(fase_reiniciar(bot, args.fase == "compactar"))
+        resultado["importar_s"] = round(importar, 3)
+    print(json.dumps(resultado))
+
+
+def correr(fase, sesiones, ruta):
+    entorno = dict(
+        os.environ,
+        DIARIO_RUTA=ruta,
+        DIFUSION_SQLITE="",
+        ANALITICA_SQLITE="",
+        SESIONES_MAX=str(sesiones * 2),
+        REGISTRO_CONFIG=json.dumps({"nivel": "WARNING"}),
+        TWILIO_ACCOUNT_SID="",
+        # Envíos simulados sin límites: que el cronograma no dependa del ritmo del pipeline
+        ENVIOS_TASA_REMITENTE="0",
+        ENVIOS_TASA_DESTINO="0",
+        CONTENIDO_INTERVALO="0",
+    )
+    proceso = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--fase", fase, "--sesiones", str(sesiones)],
+        env=entorno, capture_output=True, text=True,
+    )
+    if proceso.returncode:
+        sys.exit(f"la fase {fase} falló:\n{proceso.stderr}")
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sesiones", type=int, default=100_000)
+    parser.add_argument("--fase", choices=("escribir", "reiniciar", "compactar"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.fase:
+        hijo(args)
+        sys.exit(0)
+
+    ruta = os.path.join(tempfile.mkdtemp(prefix="aiuda-diario-"), "diario.jsonl")
+    print(f"{args.sesiones} sesiones, diario en {ruta}\n")
+    sin = correr("escribir", args.sesiones, "")
+    con = correr("escribir", args.sesiones, ruta)
+    print("Anotar (procesar_mensaje, en el loop):")
+    print(f"  sin diario: {sin['us_por_mensaje']} µs/mensaje")
+    print(f"  con diario: {con['us_por_mensaje']} µs/mensaje "
+          f"(+{con['us_por_mensaje'] - sin['us_por_mensaje']:.2f} µs)")
+    print(f"  {con['registros_escritos']} registros en {con['lotes']} lotes con fsync "
+          f"(máx. {con['max_lote']} por lote, fsync máx. {con['fsync_max_ms']} ms), {con['mb_archivo']} MB")
+
+    for titulo, fase in (("Reinicio desde el diario completo", "compactar"),
+                         ("Reinicio desde el diario compactado", "reiniciar")):
+        r = correr(fase, args.sesiones, ruta)
+        print(f"\n{titulo}:")
+        print(f"  importar el módulo: {r['importar_s']} s  startup: {r['arranque_s']} s "
+              f"(lectura del diario {r['lectura_s']} s, {r['registros_leidos']} registros)")
+        print(f"  sesiones: {r['sesiones']}  ejercicios re-programados: {r['ejercicios_en_curso']}  "
+              f"pasos saltados por vencidos: {r['pasos_saltados']}")
+        if "compactar_s" in r:
+            print(f"  compactación: {r['compactar_s']} s → {r['registros_tras_compactar']} registros")
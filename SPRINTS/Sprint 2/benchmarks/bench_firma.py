@@ -0,0 +1,147 @@
+"""Costo por petición de la admisión del webhook (firma de Twilio + límites).
+
+Mide el middleware completo (AdmisionWebhook.atender con una app vacía)
+sobre formularios como los de Twilio, en cada camino:
+
+- sin validar: solo el límite por remitente (desarrollo, sin auth token)
+- firma válida (ValidadorFirma: formulario crudo + hmac.digest)
+- firma válida parseando con parse_qsl, con el HMAC de la clave
+  precalculado y copiado por petición (hmac.copy)
+- firma válida parseando con parse_qsl y hmac.new por petición, como un
+  validador ingenuo
+- firma inválida: se calcula el HMAC y se rechaza
+- IP castigada: se rechaza sin leer el cuerpo ni calcular nada
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/bench_firma.py --peticiones 50000 --rondas 5
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import time
+from urllib.parse import parse_qsl, urlencode
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(AQUI))
+os.chdir(os.path.dirname(AQUI))
+
+import registro
+from firma import AdmisionWebhook, ValidadorFirma
+
+TOKEN = "0123456789abcdef0123456789abcdef"
+URL = "https://aiuda.example.org/whatsapp"
+
+
+class ValidadorIngenuo:
+    """parse_qsl + hmac.new (la clave se procesa de nuevo) en cada petición."""
+
+    def __init__(self, token):
+        self._clave = token.encode("utf-8")
+
+    def _hmac(self):
+        return hmac.new(self._clave, digestmod=hashlib.sha1)
+
+    def valida(self, url, cuerpo, firma):
+        mac = self._hmac()
+        parametros = parse_qsl(cuerpo, keep_blank_values=True)
+        mac.update((url + "".join([k + v for k, v in sorted(parametros)])).encode("utf-8"))
+        return hmac.compare_digest(base64.b64encode(mac.digest()), firma)
+
+
+class ValidadorCopia(ValidadorIngenuo):
+    """parse_qsl + el HMAC con la clave ya cargada, copiado en cada petición."""
+
+    def __init__(self, token):
+        super().__init__(token)
+        self._base = hmac.new(self._clave, digestmod=hashlib.sha1)
+
+    def _hmac(self):
+        return self._base.copy()
+
+
+def formulario(i, firma_valida=True):
+    # Los campos que manda Twilio en un mensaje entrante de WhatsApp
+    campos = [
+        ("SmsMessageSid", f"SM{i:032x}"), ("NumMedia", "0"), ("ProfileName", "María José"),
+        ("SmsSid", f"SM{i:032x}"), ("WaId", f"5491100{i % 100000:05d}"), ("SmsStatus", "received"),
+        ("Body", "me siento un poco mejor, gracias 😊"), ("To", "whatsapp:+14155238886"),
+        ("NumSegments", "1"), ("ReferralNumMedia", "0"), ("MessageSid", f"SM{i:032x}"),
+        ("AccountSid", "AC" + "0" * 32), ("From", f"whatsapp:+5491100{i % 100000:05d}"), ("ApiVersion", "2010-04-01"),
+    ]
+    firma = ValidadorFirma(TOKEN if firma_valida else "otro").calcular(URL, campos)
+    cuerpo = urlencode(campos).encode()
+    scope = {
+        "type": "http", "method": "POST", "path": "/whatsapp", "scheme": "https", "query_string": b"",
+        "client": ("198.51.100.7", 40000),
+        "headers": [
+            (b"host", b"aiuda.example.org"), (b"content-type", b"application/x-www-form-urlencoded"),
+            (b"content-length", str(len(cuerpo)).encode()), (b"x-twilio-signature", firma.encode()),
+        ],
+    }
+    return scope, cuerpo
+
+
+async def medir(admision, peticiones):
+    """µs por petición y los rechazos por motivo."""
+    async def app(scope, receive, send):
+        await receive()
+
+    async def send(mensaje):
+        pass
+
+    inicio = time.perf_counter()
+    for scope, cuerpo in peticiones:
+        async def receive(cuerpo=cuerpo):
+            return {"type": "http.request", "body": cuerpo, "more_body": False}
+        await admision.atender(app, scope, receive, send)
+    us = 1e6 * (time.perf_counter() - inicio) / len(peticiones)
+    return us, {k: v for k, v in admision.rechazados.items() if v}
+
+
+async def correr(args):
+    validas = [formulario(i) for i in range(args.peticiones)]
+    invalidas = [formulario(i, firma_valida=False) for i in range(args.peticiones)]
+    # Sin límite por remitente ni castigo por IP: solo se mide lo que se pide en cada caso
+    sin_limites = dict(fallos_ip=0, tasa_remitente=0)
+    casos = {
+        # Cubeta por remitente que nunca se vacía: el piso del middleware
+        "sin validar (solo límites)": (lambda: AdmisionWebhook(tasa_remitente=1e9, rafaga_remitente=1e9), validas),
+        "firma válida": (lambda: AdmisionWebhook(validador=ValidadorFirma(TOKEN), **sin_limites), validas),
+        "firma válida (parse_qsl + copy)":
+            (lambda: AdmisionWebhook(validador=ValidadorCopia(TOKEN), **sin_limites), validas),
+        "firma válida (parse_qsl + new)":
+            (lambda: AdmisionWebhook(validador=ValidadorIngenuo(TOKEN), **sin_limites), validas),
+        "firma inválida": (lambda: AdmisionWebhook(validador=ValidadorFirma(TOKEN), **sin_limites), invalidas),
+        "IP castigada (sin HMAC)":
+            (lambda: AdmisionWebhook(validador=ValidadorFirma(TOKEN), fallos_ip=1e-9, rafaga_ip=1), invalidas),
+    }
+
+    # Rondas intercaladas y el mejor tiempo de cada caso: menos ruido de la máquina
+    mejores = {}
+    rechazos = {}
+    for _ in range(args.rondas):
+        for nombre, (crear, peticiones) in casos.items():
+            us, rechazos[nombre] = await medir(crear(), peticiones)
+            mejores[nombre] = min(us, mejores.get(nombre, us))
+
+    print(f"{args.peticiones} peticiones de {len(validas[0][1])} bytes, mejor de {args.rondas} rondas\n")
+    for nombre, us in mejores.items():
+        print(f"  {nombre:<34} {us:7.2f} µs/petición  rechazos: {rechazos[nombre] or '-'}")
+    actual = mejores["firma válida"]
+    copia = mejores["firma válida (parse_qsl + copy)"]
+    nueva = mejores["firma válida (parse_qsl + new)"]
+    print(f"\nhmac.copy vs. hmac.new: {copia - nueva:+.2f} µs por petición; "
+          f"formulario crudo vs. parse_qsl: {actual - copia:+.2f} µs ({(actual - copia) / copia:+.0%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peticiones", type=int, default=50_000)
+    parser.add_argument("--rondas", type=int, default=5)
+    args = parser.parse_args()
+    registro.configurar_registro({"nivel": "CRITICAL"})
+    asyncio.run(correr(args))
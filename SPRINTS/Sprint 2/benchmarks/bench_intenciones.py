@@ -0,0 +1,107 @@
+"""Clasificación de intenciones: cadena de listas + int() vs. clasificador compilado.
+
+Genera un corpus grande de mensajes al estilo de los reales (números,
+"1.", "uno", "Menú", saludos, "ayudaaa", errores de tipeo, emoji y muchas
+respuestas libres del grounding) y mide el costo por mensaje de ambas
+versiones, además de cuántos mensajes con intención reconoce cada una.
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/bench_intenciones.py --mensajes 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(AQUI))
+os.chdir(os.path.dirname(AQUI))
+
+from contenido import AlmacenContenido
+import intenciones
+from intenciones import ClasificadorIntenciones
+
+# (texto, peso, intención esperada)
+FRECUENTES = [
+    ("1", 30, intenciones.OPCION), ("2", 30, intenciones.OPCION), ("3", 15, intenciones.OPCION),
+    ("hola", 25, intenciones.SALUDO), ("Hola", 20, intenciones.SALUDO), ("menu", 15, intenciones.COMANDO),
+    ("Menú", 8, intenciones.COMANDO), ("MENU", 3, intenciones.COMANDO), ("1.", 6, intenciones.OPCION),
+    ("2 ", 4, intenciones.OPCION), ("uno", 4, intenciones.OPCION), ("Dos", 3, intenciones.OPCION),
+    ("opción 3", 2, intenciones.OPCION), ("Hola!", 6, intenciones.SALUDO), ("holaaa", 3, intenciones.SALUDO),
+    ("hola 👋", 4, intenciones.SALUDO), ("Buenas tardes", 3, intenciones.SALUDO), ("ayuda", 4, intenciones.URGENTE),
+    ("ayudaaa", 2, intenciones.URGENTE), ("AYUDA!!", 2, intenciones.URGENTE), ("auxlio", 1, intenciones.URGENTE),
+    ("emergncia", 1, intenciones.URGENTE), ("sos", 2, intenciones.URGENTE), ("ayúdame", 1, intenciones.URGENTE),
+    ("cancelar", 5, intenciones.COMANDO), ("Salir", 3, intenciones.COMANDO), ("9", 2, intenciones.NUMERO),
+    ("respiración", 2, intenciones.OPCION), ("grounding", 1, intenciones.OPCION),
+]
+PALABRAS = ("veo", "una", "mesa", "silla", "ventana", "escucho", "autos", "música", "siento", "la", "ropa",
+            "huele", "a", "café", "tengo", "sabor", "menta", "me", "siento", "mejor", "gracias", "hoy", "😊", "😔")
+
+
+def corpus(n, semilla=7):
+    rnd = random.Random(semilla)
+    textos, pesos = zip(*((t, p) for t, p, _ in FRECUENTES))
+    libres = max(1, n * 2 // 5)  # ~40% respuestas libres de los ejercicios
+    mensajes = rnd.choices(textos, pesos, k=n - libres)
+    mensajes += [" ".join(rnd.choices(PALABRAS, k=rnd.randint(2, 12))) for _ in range(libres)]
+    rnd.shuffle(mensajes)
+    return mensajes
+
+
+def clasificar_antes(texto, opciones):
+    # Copia de la cadena de procesar_mensaje antes del clasificador
+    texto = texto.strip()
+    if texto.lower() in ["menu", "salir", "cancelar", "stop"]:
+        return intenciones.COMANDO
+    if texto.lower() in ["hola", "inicio", "start", "hi", "hello"]:
+        return intenciones.SALUDO
+    if texto.lower() in ["urgente", "ayuda", "sos", "emergency", "emergencia", "auxilio"]:
+        return intenciones.URGENTE
+    try:
+        numero = int(texto)
+        for opcion in opciones:
+            if opcion["id"] == numero:
+                return intenciones.OPCION
+        return intenciones.NUMERO
+    except ValueError:
+        return intenciones.OTRO
+
+
+def medir(nombre, funcion, mensajes):
+    inicio = time.perf_counter()
+    resultados = [funcion(m) for m in mensajes]
+    ns = 1e9 * (time.perf_counter() - inicio) / len(mensajes)
+    print(f"  {nombre:<28} {ns:8.0f} ns/mensaje")
+    return ns, resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mensajes", type=int, default=200_000)
+    args = parser.parse_args()
+
+    almacen = AlmacenContenido({"menu": "menu.json"}, intervalo=0)
+    clasificador = ClasificadorIntenciones()
+    almacen.suscribir(clasificador.preparar)
+    opciones = almacen.cargar().menu["menu_principal"]["opciones"]
+    mensajes = corpus(args.mensajes)
+
+    print(f"{len(mensajes)} mensajes")
+    antes, r_antes = medir("antes (listas + int())", lambda m: clasificar_antes(m, opciones), mensajes)
+    ahora, r_ahora = medir("ahora (clasificador)", lambda m: clasificador.clasificar(m.strip())[0], mensajes)
+    print(f"  → {antes / ahora:.1f}x")
+
+    esperadas = {t: i for t, _, i in FRECUENTES}
+    print("\nMensajes con intención reconocida correctamente:")
+    for nombre, resultados in (("antes", r_antes), ("ahora", r_ahora)):
+        aciertos = sum(1 for m, r in zip(mensajes, resultados) if m in esperadas and esperadas[m] == r)
+        total = sum(1 for m in mensajes if m in esperadas)
+        print(f"  {nombre:<6} {aciertos / total:6.1%}")
+    errores = Counter(m for m, r in zip(mensajes, r_ahora) if m in esperadas and esperadas[m] != r)
+    if errores:
+        print("  no reconocidos ahora:", dict(errores))
+    libres = Counter(r for m, r in zip(mensajes, r_ahora) if m not in esperadas)
+    print("  respuestas libres clasificadas como:", dict(libres))
+    print("\nCaminos del clasificador:", clasificador.estadisticas())
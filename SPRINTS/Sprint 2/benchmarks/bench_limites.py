@@ -0,0 +1,111 @@
+"""Envíos contra un Twilio que limita por remitente: sin límites vs. con cubetas y agrupación.
+
+N usuarios arrancan respiración o mindfulness casi a la vez. El Twilio
+falso acepta --limite mensajes por segundo por remitente y responde 429 al
+resto. Antes: cada paso es una llamada y un 429 es un mensaje perdido.
+Ahora: cubeta por remitente (un poco por debajo del límite) y por
+destinatario, agrupación de lo que se acumula y reintentos con backoff.
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/bench_limites.py --usuarios 300 --limite 80 --escala 0.1
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, AQUI)
+sys.path.insert(0, os.path.dirname(AQUI))
+os.chdir(os.path.dirname(AQUI))
+
+import registro
+import twilio_falso
+from contenido import AlmacenContenido
+from envios import ClienteTwilio, PipelineEnvios
+from motor_ejercicios import MotorEjercicios
+from planificador import Planificador
+
+
+def programas():
+    almacen = AlmacenContenido({"menu": "menu.json", "ejercicios": "ejercicios.json"}, intervalo=0)
+    motor = MotorEjercicios(lambda *a: None)
+    almacen.suscribir(motor.preparar)
+    almacen.cargar()
+    return [motor.obtener("respiracion"), motor.obtener("mindfulness")]
+
+
+async def correr(args, con_limites):
+    servidor, url = twilio_falso.iniciar_en_hilo(limite=args.limite, latencia=args.latencia)
+    pipeline = PipelineEnvios(
+        ClienteTwilio("ACbench", "x", url_base=url),
+        "whatsapp:+14155238886",
+        trabajadores=8,
+        capacidad=10_000,
+        tasa_remitente=args.limite * 0.95 if con_limites else None,
+        tasa_destino=1.0 / args.escala if con_limites else None,
+        max_reintentos=6 if con_limites else 0,
+        max_caracteres=1600 if con_limites else 0,  # 0: una llamada por mensaje, como antes
+    )
+    planificador = Planificador(pipeline.encolar, escala=args.escala,
+                                ventana_agrupar=1.0 if con_limites else 0.0)
+    await pipeline.iniciar()
+    await planificador.iniciar()
+
+    rnd = random.Random(3)
+    pasos = 0
+    inicio = time.perf_counter()
+    for i in range(args.usuarios):
+        guion = rnd.choice(programas_compilados).guiones[0]
+        pasos += len(guion.pasos)
+        planificador.programar(f"whatsapp:+51920{i:06d}", guion, retraso=rnd.uniform(0, args.rampa))
+    while planificador.estadisticas()["ejecuciones_activas"]:
+        await asyncio.sleep(0.05)
+    await pipeline.detener(drenar=True)
+    duracion = time.perf_counter() - inicio
+    await planificador.detener()
+    servidor.shutdown()
+
+    # Llamadas aceptadas por décima de segundo: qué tan pareja fue la salida
+    tiempos = sorted(m["t"] for m in servidor.mensajes)
+    ventanas = {}
+    for t in tiempos:
+        ventanas[int((t - tiempos[0]) * 10)] = ventanas.get(int((t - tiempos[0]) * 10), 0) + 1
+    return {
+        "pasos": pasos,
+        "llamadas_api": servidor.contador + servidor.rechazados,
+        "aceptadas": servidor.contador,
+        "rechazadas_429": servidor.rechazados,
+        "mensajes_perdidos": pipeline.perdidos,
+        "agrupados": pipeline.agrupados + planificador.pasos_agrupados,
+        "reintentos": pipeline.reintentos,
+        "max_por_100ms": max(ventanas.values(), default=0),
+        "duracion_s": round(duracion, 2),
+    }
+
+
+def imprimir(nombre, r):
+    print(f"{nombre}:")
+    print(f"  pasos: {r['pasos']}  llamadas a la API: {r['llamadas_api']} "
+          f"(aceptadas {r['aceptadas']}, 429: {r['rechazadas_429']})")
+    print(f"  mensajes perdidos: {r['mensajes_perdidos']}  agrupados: {r['agrupados']}  "
+          f"reintentos: {r['reintentos']}")
+    print(f"  pico de llamadas aceptadas en 100 ms: {r['max_por_100ms']}  duración: {r['duracion_s']}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--usuarios", type=int, default=300)
+    parser.add_argument("--limite", type=float, default=80.0, help="mensajes/s por remitente en el Twilio falso")
+    parser.add_argument("--escala", type=float, default=0.1, help="factor de las esperas de los ejercicios")
+    parser.add_argument("--rampa", type=float, default=1.0, help="segundos (sin escalar) en que arrancan todos")
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos por llamada en el Twilio falso")
+    args = parser.parse_args()
+
+    registro.configurar_registro({"nivel": "CRITICAL"})
+    programas_compilados = programas()
+    print(f"{args.usuarios} usuarios, Twilio limitado a {args.limite:.0f} msg/s por remitente\n")
+    imprimir("Antes (sin límites ni agrupación)", asyncio.run(correr(args, con_limites=False)))
+    imprimir("Ahora (cubetas + agrupación + reintentos)", asyncio.run(correr(args, con_limites=True)))
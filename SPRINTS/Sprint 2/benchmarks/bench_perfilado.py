@@ -0,0 +1,149 @@
+"""Costo del perfilado: trazas apagadas, encendidas y con un perfil de muestreo en curso.
+
+Se mide:
+- lo que cuesta en el hot path cada `with trazas.tramo(...)` y cada
+  `trazas.anotar(...)` con las trazas apagadas y encendidas, y el paso por
+  el middleware TrazarPeticiones apagado frente a llamar a la app directo
+- el costo por webhook del bot completo (en el proceso, sin red) en tres
+  fases: trazas apagadas (lo normal), encendidas con un umbral que nada
+  alcanza, y apagadas con /admin/perfil muestreando el event loop cada
+  `--intervalo_ms`. Las fases se alternan --rondas veces y se informa la
+  mediana de cada una (en una máquina compartida el ruido es de ~10%).
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/bench_perfilado.py --mensajes 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(AQUI))
+sys.path.insert(0, AQUI)
+os.chdir(os.path.dirname(AQUI))
+
+os.environ.update(
+    TWILIO_ACCOUNT_SID="", TWILIO_AUTH_TOKEN="", DIARIO_RUTA="", DIFUSION_SQLITE="", ANALITICA_SQLITE="",
+    ADMISION_TASA_REMITENTE="0", EJERCICIOS_ESCALA_TIEMPO="0.001", REGISTRO_CONFIG=json.dumps({"nivel": "ERROR"}),
+)
+
+from perfilado import Perfilador, TrazarPeticiones, Trazas
+
+TEXTOS = ("hola", "2", "veo una mesa", "escucho autos", "siento la ropa", "huele a café", "sabor a menta",
+          "me siento mejor", "menu", "1")
+
+
+def ns_por_llamada(funcion, veces):
+    inicio = time.perf_counter()
+    funcion(veces)
+    return 1e9 * (time.perf_counter() - inicio) / veces
+
+
+def micro(veces):
+    def tramos(trazas):
+        def correr(n):
+            tramo, anotar = trazas.tramo, trazas.anotar
+            for _ in range(n):
+                with tramo("procesar_mensaje"):
+                    pass
+                anotar(rama="menu")
+        return correr
+
+    def vacio(n):
+        for _ in range(n):
+            pass
+
+    apagadas = Trazas()
+    encendidas = Trazas(activo=True, umbral=3600)
+    abierta = encendidas.iniciar("micro")
+    base = ns_por_llamada(vacio, veces)
+    ns_apagadas = ns_por_llamada(tramos(apagadas), veces) - base
+    # Con la traza abierta los tramos se acumulan: se mide en tandas para no crecer sin fin
+    ns_encendidas = sum(ns_por_llamada(tramos(encendidas), 1000) - base for _ in range(veces // 1000)) / (veces // 1000)
+    if abierta[0].tramos:
+        abierta[0].tramos.clear()
+    encendidas.terminar(abierta)
+
+    async def app_vacia(scope, receive, send):
+        return None
+
+    async def llamadas(app, n):
+        scope = {"type": "http", "path": "/whatsapp", "method": "POST"}
+        inicio = time.perf_counter()
+        for _ in range(n):
+            await app(scope, None, None)
+        return 1e9 * (time.perf_counter() - inicio) / n
+
+    directo = asyncio.run(llamadas(app_vacia, veces))
+    middleware = asyncio.run(llamadas(TrazarPeticiones(app_vacia, apagadas), veces))
+
+    print("Hot path (por llamada):")
+    print(f"  tramo + anotar, trazas apagadas     {ns_apagadas:7.0f} ns")
+    print(f"  tramo + anotar, trazas encendidas   {ns_encendidas:7.0f} ns")
+    print(f"  middleware apagado (sobre la app)   {middleware - directo:7.0f} ns")
+
+
+async def fase(bot, mensajes, perfilador=None, intervalo=0.005):
+    """µs por webhook; con `perfilador`, muestreando el event loop mientras dura la fase."""
+    from cliente_asgi import webhook
+
+    perfil = None
+    if perfilador is not None:
+        listo = threading.Event()
+        hilo_loop = threading.get_ident()
+
+        def muestrear():
+            # Perfiles de medio segundo, uno tras otro, hasta que termine la fase
+            while not listo.is_set():
+                perfilador.muestrear(0.5, intervalo, hilo_loop)
+        perfil = threading.Thread(target=muestrear)
+        perfil.start()
+    inicio = time.perf_counter()
+    for i in range(mensajes):
+        await webhook(bot.app, f"whatsapp:+5491100{i % 500:05d}", TEXTOS[i % len(TEXTOS)])
+    duracion = time.perf_counter() - inicio
+    if perfil is not None:
+        listo.set()
+        perfil.join()
+    await asyncio.sleep(0.05)
+    return 1e6 * duracion / mensajes
+
+
+async def webhooks(args):
+    import whatsapp_bot as bot
+    from cliente_asgi import vida
+
+    perfilador = Perfilador()
+    tiempos = {"apagadas": [], "encendidas": [], "perfilando": []}
+    async with vida(bot.app):
+        await fase(bot, args.mensajes // 4)  # calentamiento
+        for _ in range(args.rondas):
+            tiempos["apagadas"].append(await fase(bot, args.mensajes))
+            bot.trazas.configurar(activo=True, umbral=3600)
+            tiempos["encendidas"].append(await fase(bot, args.mensajes))
+            bot.trazas.configurar(activo=False)
+            tiempos["perfilando"].append(await fase(bot, args.mensajes, perfilador, args.intervalo_ms / 1000))
+
+    medianas = {nombre: sorted(valores)[len(valores) // 2] for nombre, valores in tiempos.items()}
+    print(f"Webhook completo en el proceso (mediana de {args.rondas} rondas de {args.mensajes}):")
+    for nombre, titulo in (("apagadas", "trazas apagadas"), ("encendidas", "trazas encendidas"),
+                           ("perfilando", f"perfil cada {args.intervalo_ms:g} ms")):
+        relativo = 100 * (medianas[nombre] / medianas["apagadas"] - 1)
+        print(f"  {titulo:<24} {medianas[nombre]:7.1f} µs/webhook  {relativo:+6.1f}%"
+              f"   rondas: {', '.join(f'{v:.0f}' for v in tiempos[nombre])}")
+    print(f"  muestras tomadas: {perfilador.muestras}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mensajes", type=int, default=10_000)
+    parser.add_argument("--rondas", type=int, default=5)
+    parser.add_argument("--micro", type=int, default=1_000_000)
+    parser.add_argument("--intervalo_ms", type=float, default=5)
+    args = parser.parse_args()
+    micro(args.micro)
+    asyncio.run(webhooks(args))
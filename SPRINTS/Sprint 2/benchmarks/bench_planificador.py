@@ -0,0 +1,87 @@
+"""Memoria y CPU de N ejercicios simultáneos: una corrutina por usuario vs. el planificador.
+
+Uso:
+    python benchmarks/bench_planificador.py --usuarios 1000 10000 50000
+
+Los guiones usan las esperas reales escaladas por --escala para que la
+prueba dure poco; lo que interesa es cómo crecen la memoria y el CPU por
+ejercicio al aumentar N.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from planificador import Guion, Planificador
+
+ESPERAS_MINDFULNESS = [0, 3, 8, 10, 8, 10, 5, 8]
+
+
+def guion_escalado(escala):
+    return Guion("mindfulness", [(e * escala, f"paso {i}") for i, e in enumerate(ESPERAS_MINDFULNESS)])
+
+
+async def enviar_nada(destinatario, mensaje):
+    return None
+
+
+async def con_corrutinas(usuarios, guion):
+    async def ejercicio(destinatario):
+        for espera, mensaje in guion.pasos:
+            await asyncio.sleep(espera)
+            await enviar_nada(destinatario, mensaje)
+
+    tareas = [asyncio.create_task(ejercicio(f"whatsapp:+{i}")) for i in range(usuarios)]
+    await asyncio.sleep(0)
+    pico = tracemalloc.get_traced_memory()[0]
+    await asyncio.gather(*tareas)
+    return pico
+
+
+async def con_planificador(usuarios, guion):
+    planificador = Planificador(enviar_nada)
+    await planificador.iniciar()
+    for i in range(usuarios):
+        planificador.programar(f"whatsapp:+{i}", guion)
+    await asyncio.sleep(0)
+    pico = tracemalloc.get_traced_memory()[0]
+    while planificador.estadisticas()["ejecuciones_activas"]:
+        await asyncio.sleep(0.01)
+    await planificador.detener()
+    return pico
+
+
+def medir(funcion, usuarios, guion):
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    cpu = time.process_time()
+    pared = time.perf_counter()
+    pico = asyncio.run(funcion(usuarios, guion))
+    cpu = time.process_time() - cpu
+    pared = time.perf_counter() - pared
+    tracemalloc.stop()
+    pasos = usuarios * len(guion.pasos)
+    return {
+        "bytes_por_ejercicio": round((pico - base) / usuarios),
+        "cpu_us_por_paso": round(1e6 * cpu / pasos, 2),
+        "segundos": round(pared, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--escala", type=float, default=0.01, help="factor sobre las esperas reales")
+    args = parser.parse_args()
+
+    guion = guion_escalado(args.escala)
+    print(f"{'usuarios':>9} | {'modo':<12} | {'bytes/ejercicio':>15} | {'CPU µs/paso':>11} | {'s':>6}")
+    for usuarios in args.usuarios:
+        for nombre, funcion in (("corrutinas", con_corrutinas), ("planificador", con_planificador)):
+            r = medir(funcion, usuarios, guion)
+            print(f"{usuarios:>9} | {nombre:<12} | {r['bytes_por_ejercicio']:>15} | "
+                  f"{r['cpu_us_por_paso']:>11} | {r['segundos']:>6}")
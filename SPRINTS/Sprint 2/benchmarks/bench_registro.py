@@ -0,0 +1,97 @@
+"""Costo por petición del registro en el hilo del webhook: print() vs. registro.
+
+Antes: ~8 print() síncronos por mensaje. Ahora: un evento JSON que se
+encola y un hilo aparte formatea, redacta y escribe. Se mide el tiempo que
+pasa el hilo del event loop registrando, con stdout hacia /dev/null y hacia
+un pipe lento (un lector que tarda en vaciarlo, como un colector de logs
+saturado).
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/bench_registro.py
+"""
+import io
+import os
+import sys
+import threading
+import time
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(AQUI))
+
+import registro as modulo_registro
+
+FROM = "whatsapp:+51987654321"
+PERFIL = "Ana"
+BODY = "veo una mesa, una taza y una ventana"
+RESPUESTA = "Muy bien 👍\n\nveo una mesa, una taza y una ventana\n\nGracias por compartir. " * 2
+
+
+def con_print(salida):
+    # Copia de los print del webhook antes del cambio
+    print(f"\n{'='*60}", file=salida)
+    print("📩 Mensaje recibido", file=salida)
+    print(f"   De: {PERFIL} ({FROM})", file=salida)
+    print(f"   Texto: {BODY}", file=salida)
+    print("   Estado: ejercicio_interactivo", file=salida)
+    print("   Ejercicio: grounding - Paso: 2", file=salida)
+    print(f"{'='*60}", file=salida)
+    print(f"📤 Respuesta: {RESPUESTA[:100]}...", file=salida)
+    print(f"{'='*60}\n", file=salida)
+
+
+def con_registro(reg):
+    reg.info("mensaje", de=FROM, perfil=PERFIL, texto=BODY, estado="ejercicio_interactivo",
+             ejercicio="grounding", paso=2, respuesta=RESPUESTA, ms=0.42)
+
+
+def pipe_lento(bytes_por_ms=2048):
+    lectura, escritura = os.pipe()
+
+    def lector():
+        while True:
+            datos = os.read(lectura, bytes_por_ms)
+            if not datos:
+                break
+            time.sleep(0.001)
+
+    threading.Thread(target=lector, daemon=True).start()
+    return io.TextIOWrapper(os.fdopen(escritura, "wb", buffering=0), encoding="utf-8", write_through=True)
+
+
+def medir(nombre, funcion, n):
+    inicio = time.perf_counter()
+    for _ in range(n):
+        funcion()
+    us = 1e6 * (time.perf_counter() - inicio) / n
+    print(f"  {nombre:<34} {us:8.2f} µs/petición")
+    return us
+
+
+def escenario(titulo, crear_salida, n, config):
+    print(titulo)
+    salida = crear_salida()
+    antes = medir("print() x9", lambda: con_print(salida), n)
+
+    salida = crear_salida()
+    modulo_registro.configurar_registro(dict(config, capacidad=n + 1), destino=salida)
+    reg = modulo_registro.obtener_registro("/bench")
+    ahora = medir("registro (cola + JSON en hilo)", lambda: con_registro(reg), n)
+    modulo_registro.detener_registro()
+    print(f"  → print / registro = {antes / ahora:.1f}x")
+    return antes, ahora
+
+
+if __name__ == "__main__":
+    n = 20000
+    escenario("stdout → /dev/null", lambda: open(os.devnull, "w", encoding="utf-8"), n, {})
+    escenario("stdout → pipe lento", pipe_lento, 2000, {})
+    escenario("Muestreo INFO al 10%", pipe_lento, 2000, {"muestreo": {"INFO": 0.1}})
+    escenario("Nivel WARNING (INFO apagado)", pipe_lento, 2000, {"nivel": "WARNING"})
+
+    # Muestra de una línea ya redactada
+    muestra = io.StringIO()
+    modulo_registro.configurar_registro({}, destino=muestra)
+    con_registro(modulo_registro.obtener_registro("/whatsapp"))
+    modulo_registro.detener_registro()
+    print("\nEjemplo de línea:")
+    print(" ", muestra.getvalue().strip())
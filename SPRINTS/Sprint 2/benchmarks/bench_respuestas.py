@@ -0,0 +1,90 @@
+"""Costo por petición de armar la respuesta TwiML: antes vs. ahora.
+
+Antes: el menú se armaba con += en cada llamada y cada respuesta creaba un
+MessagingResponse y lo serializaba a XML. Ahora: los textos fijos salen
+del caché ya en bytes y los dinámicos solo se escapan.
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/bench_respuestas.py
+"""
+import json
+import os
+import sys
+import timeit
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(AQUI))
+os.chdir(os.path.dirname(AQUI))
+
+from contenido import AlmacenContenido
+from respuestas import CacheRespuestas, twiml_mensaje
+
+try:
+    from twilio.twiml.messaging_response import MessagingResponse
+except ImportError:
+    MessagingResponse = None
+
+with open("menu.json", encoding="utf-8") as f:
+    MENU = json.load(f)
+
+TEXTO_DINAMICO = "Muy bien 👍\n\nveo una mesa, una taza & una ventana <azul>\n\nGracias por compartir."
+
+
+def menu_antes():
+    # Copia de formatear_menu_whatsapp antes del caché (sin la lectura de disco)
+    mensaje = MENU["bienvenida"] + "\n\n"
+    mensaje += MENU["menu_principal"]["titulo"] + "\n\n"
+    for opcion in MENU["menu_principal"]["opciones"]:
+        mensaje += f"{opcion['emoji']} *{opcion['id']}*. {opcion['nombre']}\n"
+    mensaje += "\n_Escribe el número de la opción que prefieras._"
+    return mensaje
+
+
+def twiml_antes(texto):
+    resp = MessagingResponse()
+    resp.message(texto)
+    return str(resp).encode()
+
+
+def medir(nombre, funcion, repeticiones=20000):
+    segundos = min(timeit.repeat(funcion, number=repeticiones, repeat=5))
+    us = 1e6 * segundos / repeticiones
+    print(f"  {nombre:<40} {us:8.2f} µs/petición")
+    return us
+
+
+if __name__ == "__main__":
+    almacen = AlmacenContenido({"menu": "menu.json", "ejercicios": "ejercicios.json"}, intervalo=0)
+    cache = CacheRespuestas()
+    almacen.suscribir(cache.preparar)
+    almacen.cargar()
+    urgente = MENU["ayuda_urgente"]["mensaje"]
+
+    print("Menú de bienvenida")
+    if MessagingResponse:
+        antes = medir("antes (+= y MessagingResponse)", lambda: twiml_antes(menu_antes()))
+    despues = medir("ahora (caché)", lambda: cache.twiml(cache.menu))
+    if MessagingResponse:
+        print(f"  → {antes / despues:.0f}x más rápido")
+
+    print("Ayuda urgente")
+    if MessagingResponse:
+        antes = medir("antes (MessagingResponse)", lambda: twiml_antes(urgente))
+    despues = medir("ahora (caché)", lambda: cache.twiml(cache.urgente))
+    if MessagingResponse:
+        print(f"  → {antes / despues:.0f}x más rápido")
+
+    print("Respuesta dinámica (eco del grounding)")
+    if MessagingResponse:
+        antes = medir("antes (MessagingResponse)", lambda: twiml_antes(TEXTO_DINAMICO))
+    despues = medir("ahora (escape + prefijo/sufijo)", lambda: twiml_mensaje(TEXTO_DINAMICO))
+    if MessagingResponse:
+        print(f"  → {antes / despues:.0f}x más rápido")
+
+    print("TwiML vacío")
+    if MessagingResponse:
+        medir("antes (MessagingResponse)", lambda: str(MessagingResponse()).encode())
+    medir("ahora (constante)", lambda: cache.twiml(None))
+
+    if not MessagingResponse:
+        print("\n(twilio no está instalado: solo se midió la versión nueva)")
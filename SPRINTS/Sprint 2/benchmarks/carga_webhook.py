@@ -0,0 +1,405 @@
+"""Prueba de carga del webhook /whatsapp con un Twilio falso.
+
+Levanta el Twilio falso en este proceso y el bot con uvicorn en un
+subproceso (como en producción), y simula N usuarios que siguen flujos
+reales por HTTP con formularios como los de Twilio:
+
+- respiracion: hola → 1 → espera todos los pasos → feedback
+- grounding:   hola → 2 → responde los 5 pasos interactivos → feedback
+- mindfulness: hola → 3 → espera todos los pasos (vuelve al menú)
+- cancelar:    hola → 1 → espera el primer paso → cancelar
+
+Cada usuario espera a "leer" los mensajes salientes (que llegue al Twilio
+falso el último paso del tramo, aunque venga agrupado con otros) antes de
+contestar. Las esperas de los ejercicios se acortan con --escala, y el
+límite por destinatario se escala igual para que agrupe como en producción.
+
+Reporta latencia p50/p90/p99 del webhook, peticiones por segundo, envíos
+por segundo, retraso del event loop y tareas vivas (muestreados de /test),
+el pico de memoria (VmHWM) del proceso del bot y el embudo de analítica
+que anotó el bot (iniciados y completados deben coincidir con los flujos). Guarda todo en JSON; con
+--comparar falla (código 1) si algo empeoró más que --tolerancia.
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/carga_webhook.py --usuarios 200 --salida carga.json
+    python benchmarks/carga_webhook.py --usuarios 200 --comparar base.json
+    python benchmarks/carga_webhook.py --usuarios 200 --ingesta  # webhook solo encola
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(AQUI)
+sys.path.insert(0, AQUI)
+sys.path.insert(0, RAIZ)
+os.chdir(RAIZ)
+
+import twilio_falso
+from analitica import Analitica
+from contenido import AlmacenContenido
+from firma import ValidadorFirma
+from motor_ejercicios import MotorEjercicios
+
+TOKEN = "x"
+FLUJOS = ("respiracion", "grounding", "mindfulness", "cancelar")
+OPCION = {"respiracion": "1", "grounding": "2", "mindfulness": "3", "cancelar": "1"}
+
+# Métricas que se comparan con --comparar: (ruta en el JSON, mayor es peor)
+COMPARABLES = (
+    (("webhook", "p50_ms"), True),
+    (("webhook", "p99_ms"), True),
+    (("webhook", "por_segundo"), False),
+    (("event_loop", "retraso_max_ms"), True),
+    (("memoria", "rss_pico_mb"), True),
+)
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def memoria_proceso(pid):
+    """(VmRSS, VmHWM) en MB desde /proc; None si no está disponible."""
+    valores = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith(("VmRSS:", "VmHWM:")):
+                    clave, kb = linea.split()[:2]
+                    valores[clave[:-1]] = int(kb) / 1024
+    except OSError:
+        return None, None
+    return valores.get("VmRSS"), valores.get("VmHWM")
+
+
+class ClienteHTTP:
+    """HTTP/1.1 mínimo con un pool de conexiones keep-alive (sin dependencias)."""
+
+    def __init__(self, host, puerto, conexiones):
+        self.host = host
+        self.puerto = puerto
+        self._libres = asyncio.Queue()
+        for _ in range(conexiones):
+            self._libres.put_nowait(None)
+
+    async def _abrir(self):
+        return await asyncio.open_connection(self.host, self.puerto)
+
+    async def pedir(self, metodo, ruta, cuerpo=b"", tipo="application/x-www-form-urlencoded", firma=None):
+        conexion = await self._libres.get()
+        try:
+            for intento in range(2):
+                if conexion is None:
+                    conexion = await self._abrir()
+                lector, escritor = conexion
+                try:
+                    extra = f"X-Twilio-Signature: {firma}\r\n" if firma else ""
+                    escritor.write(
+                        f"{metodo} {ruta} HTTP/1.1\r\nHost: {self.host}:{self.puerto}\r\n{extra}"
+                        f"Content-Type: {tipo}\r\nContent-Length: {len(cuerpo)}\r\n\r\n".encode() + cuerpo
+                    )
+                    await escritor.drain()
+                    estado = int((await lector.readline()).split()[1])
+                    largo = 0
+                    while True:
+                        linea = await lector.readline()
+                        if linea in (b"\r\n", b""):
+                            break
+                        nombre, _, valor = linea.decode("latin-1").partition(":")
+                        if nombre.lower() == "content-length":
+                            largo = int(valor)
+                    return estado, await lector.readexactly(largo)
+                except (ConnectionError, IndexError, asyncio.IncompleteReadError):
+                    escritor.close()
+                    conexion = None
+                    if intento:
+                        raise
+        finally:
+            self._libres.put_nowait(conexion)
+
+    async def cerrar(self):
+        while not self._libres.empty():
+            conexion = self._libres.get_nowait()
+            if conexion is not None:
+                conexion[1].close()
+
+
+class Carga:
+
+    def __init__(self, args, cliente, twilio, programas):
+        self.args = args
+        self.cliente = cliente
+        self.twilio = twilio
+        self.programas = programas
+        self.latencias = []
+        self.errores = 0
+        self.completados = {flujo: 0 for flujo in FLUJOS}
+        self.fallidos = {flujo: 0 for flujo in FLUJOS}
+        self._sid = 0
+        # Firmado como Twilio, con el mismo auth token que recibe el bot
+        self._firmador = ValidadorFirma(TOKEN)
+        self._url = f"http://{cliente.host}:{cliente.puerto}/whatsapp"
+        self._leidos = {}  # usuario -> cuerpos ya leídos
+
+    async def webhook(self, usuario, texto):
+        self._sid += 1
+        campos = {
+            "Body": texto,
+            "From": usuario,
+            "ProfileName": "Carga",
+            "MessageSid": f"SMcarga{self._sid:026d}",
+        }
+        firma = self._firmador.calcular(self._url, list(campos.items()))
+        inicio = time.perf_counter()
+        estado, respuesta = await self.cliente.pedir("POST", "/whatsapp", urlencode(campos).encode(), firma=firma)
+        self.latencias.append(time.perf_counter() - inicio)
+        if estado != 200:
+            self.errores += 1
+        return respuesta
+
+    async def leer(self, usuario, ultimo=None):
+        """Espera un mensaje nuevo que termine en `ultimo` (o cualquiera, si es None)."""
+        fin = time.monotonic() + self.args.limite
+        cuerpos = self.twilio.cuerpos[usuario]
+        while True:
+            desde = self._leidos.get(usuario, 0)
+            for i in range(desde, len(cuerpos)):
+                if ultimo is None or cuerpos[i].endswith(ultimo):
+                    self._leidos[usuario] = i + 1
+                    return
+            if time.monotonic() > fin:
+                raise TimeoutError(f"{usuario} no recibió {ultimo!r}")
+            await asyncio.sleep(0.01)
+
+    async def usuario(self, i):
+        flujo = FLUJOS[i % len(FLUJOS)]
+        usuario = f"whatsapp:+51910{i:06d}"
+        await asyncio.sleep(self.args.rampa * i / self.args.usuarios)
+        try:
+            await self.webhook(usuario, "hola")
+            await self.webhook(usuario, OPCION[flujo])
+            programa = self.programas["respiracion" if flujo == "cancelar" else flujo]
+
+            if flujo == "cancelar":
+                await self.leer(usuario)
+                await self.webhook(usuario, "cancelar")
+            else:
+                await self.leer(usuario, programa.guiones[0].pasos[-1][1])
+                for paso in range(1, len(programa.respuestas) + 1):
+                    await self.webhook(usuario, f"respuesta {paso} de {usuario}")
+                    await self.leer(usuario, programa.guiones[paso].pasos[-1][1])
+                if programa.estado_final == "esperando_feedback":
+                    await self.webhook(usuario, "me siento mejor")
+            self.completados[flujo] += 1
+        except Exception as e:
+            self.fallidos[flujo] += 1
+            if self.fallidos[flujo] <= 3:
+                print(f"  ⚠️ {flujo} {usuario}: {e}")
+
+
+async def muestrear(cliente, pid, muestras, parar):
+    while not parar.is_set():
+        try:
+            _, cuerpo = await cliente.pedir("GET", "/test")
+            datos = json.loads(cuerpo)
+            rss, pico = memoria_proceso(pid)
+            muestras.append({"event_loop": datos["event_loop"], "envios": datos["envios"], "rss": rss, "pico": pico})
+        except Exception:
+            pass
+        try:
+            await asyncio.wait_for(parar.wait(), 0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+def compilar_programas():
+    almacen = AlmacenContenido({"menu": "menu.json", "ejercicios": "ejercicios.json"}, intervalo=0)
+    motor = MotorEjercicios(lambda *a: None)
+    almacen.suscribir(motor.preparar)
+    almacen.cargar()
+    return motor.programas
+
+
+def arrancar_bot(args, url_twilio, puerto, directorio):
+    entorno = dict(
+        os.environ,
+        TWILIO_ACCOUNT_SID="ACcarga",
+        TWILIO_AUTH_TOKEN=TOKEN,
+        TWILIO_API_URL=url_twilio,
+        EJERCICIOS_ESCALA_TIEMPO=str(args.escala),
+        ENVIOS_TASA_DESTINO=str(args.tasa_destino / args.escala),
+        ENVIOS_TASA_REMITENTE=str(args.tasa_remitente),
+        MODO_INGESTA="1" if args.ingesta else "0",
+        REGISTRO_CONFIG=json.dumps({"nivel": "WARNING"}),
+        # Diario nuevo en cada corrida: no reanudar los ejercicios de la anterior
+        DIARIO_RUTA=os.path.join(directorio, "diario.jsonl"),
+        ANALITICA_SQLITE=os.path.join(directorio, "analitica.db"),
+        DIFUSION_SQLITE="",
+        PYTHONPATH=RAIZ,
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "whatsapp_bot:app", "--host", "127.0.0.1",
+         "--port", str(puerto), "--log-level", "warning", "--no-access-log"],
+        cwd=RAIZ, env=entorno,
+    )
+
+
+async def esperar_bot(cliente, proceso, limite=30.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError("el bot terminó al arrancar")
+        try:
+            estado, _ = await cliente.pedir("GET", "/test")
+            if estado == 200:
+                return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError("el bot no respondió a /test")
+
+
+async def correr(args):
+    twilio, url_twilio = twilio_falso.iniciar_en_hilo(latencia=args.latencia_twilio)
+    programas = compilar_programas()
+    puerto = puerto_libre()
+    directorio = tempfile.mkdtemp(prefix="aiuda-carga-")
+    proceso = arrancar_bot(args, url_twilio, puerto, directorio)
+    cliente = ClienteHTTP("127.0.0.1", puerto, args.conexiones)
+    monitor = ClienteHTTP("127.0.0.1", puerto, 1)
+    try:
+        await esperar_bot(monitor, proceso)
+        carga = Carga(args, cliente, twilio, programas)
+        muestras, parar = [], asyncio.Event()
+        muestreo = asyncio.create_task(muestrear(monitor, proceso.pid, muestras, parar))
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(carga.usuario(i) for i in range(args.usuarios)))
+        duracion = time.perf_counter() - inicio
+        parar.set()
+        await muestreo
+        _, pico = memoria_proceso(proceso.pid)
+    finally:
+        await cliente.cerrar()
+        await monitor.cerrar()
+        proceso.send_signal(signal.SIGINT)
+        try:
+            proceso.wait(10)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+        twilio.shutdown()
+
+    # El bot ya volcó sus eventos al apagarse
+    analitica = Analitica(os.path.join(directorio, "analitica.db"))
+    embudo = {ejercicio: {clave: datos[clave] for clave in ("iniciados", "completados", "cancelados", "feedback")}
+              for ejercicio, datos in analitica.embudo().items()}
+    analitica.cerrar()
+
+    lat_ms = [x * 1000 for x in carga.latencias]
+    final = muestras[-1] if muestras else {"event_loop": {}, "envios": {}}
+    return {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "usuarios": args.usuarios,
+            "conexiones": args.conexiones,
+            "escala": args.escala,
+            "rampa_s": args.rampa,
+            "latencia_twilio_s": args.latencia_twilio,
+            "tasa_remitente": args.tasa_remitente,
+            "tasa_destino": args.tasa_destino,
+            "ingesta": args.ingesta,
+        },
+        "duracion_s": round(duracion, 2),
+        "webhook": {
+            "peticiones": len(lat_ms),
+            "errores": carga.errores,
+            "por_segundo": round(len(lat_ms) / duracion, 1),
+            "p50_ms": round(percentil(lat_ms, 50), 2),
+            "p90_ms": round(percentil(lat_ms, 90), 2),
+            "p99_ms": round(percentil(lat_ms, 99), 2),
+            "max_ms": round(max(lat_ms, default=0.0), 2),
+        },
+        "flujos": {f: {"completados": carga.completados[f], "fallidos": carga.fallidos[f]} for f in FLUJOS},
+        "envios": {
+            "mensajes": len(twilio.mensajes),
+            "por_segundo": round(len(twilio.mensajes) / duracion, 1),
+            "errores": final["envios"].get("errores"),
+            "agrupados": final["envios"].get("agrupados"),
+            "reintentos": final["envios"].get("reintentos"),
+        },
+        "event_loop": {
+            "retraso_max_ms": max((m["event_loop"]["retraso_max_ms"] for m in muestras), default=0.0),
+            "retraso_p99_ms": round(percentil([m["event_loop"]["retraso_ms"] for m in muestras], 99), 2),
+            "tareas_max": max((m["event_loop"]["tareas_max"] for m in muestras), default=0),
+        },
+        "memoria": {"rss_pico_mb": round(pico, 1) if pico else None},
+        "analitica": embudo,
+    }
+
+
+def comparar(actual, base, tolerancia):
+    """Imprime la comparación y devuelve las métricas que empeoraron más que la tolerancia."""
+    peores = []
+    print(f"\nComparación con la base (tolerancia {tolerancia:.0%}):")
+    for ruta, mayor_es_peor in COMPARABLES:
+        antes, ahora = base[ruta[0]].get(ruta[1]), actual[ruta[0]].get(ruta[1])
+        if not antes or ahora is None:
+            continue
+        cambio = (ahora - antes) / antes
+        empeoro = cambio > tolerancia if mayor_es_peor else cambio < -tolerancia
+        marca = "❌" if empeoro else "✅"
+        print(f"  {marca} {'.'.join(ruta):<28} {antes:>10} → {ahora:<10} ({cambio:+.0%})")
+        if empeoro:
+            peores.append(".".join(ruta))
+    return peores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga del webhook de WhatsApp")
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--conexiones", type=int, default=64, help="conexiones HTTP keep-alive al bot")
+    parser.add_argument("--escala", type=float, default=0.01, help="factor de las esperas de los ejercicios")
+    parser.add_argument("--rampa", type=float, default=2.0, help="segundos para que arranquen todos los usuarios")
+    parser.add_argument("--latencia-twilio", type=float, default=0.0, help="segundos por envío en el Twilio falso")
+    parser.add_argument("--limite", type=float, default=60.0, help="segundos máximos esperando un mensaje")
+    parser.add_argument("--tasa-remitente", type=float, default=0.0,
+                        help="ENVIOS_TASA_REMITENTE del bot (0 = sin límite, para medir el webhook)")
+    parser.add_argument("--tasa-destino", type=float, default=1.0,
+                        help="ENVIOS_TASA_DESTINO del bot en tiempo real (se divide por --escala)")
+    parser.add_argument("--ingesta", action="store_true",
+                        help="MODO_INGESTA=1: el webhook encola y las respuestas salen por la API")
+    parser.add_argument("--salida", help="archivo JSON para guardar los resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    args = parser.parse_args()
+
+    resultado = asyncio.run(correr(args))
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+    fallidos = sum(f["fallidos"] for f in resultado["flujos"].values())
+    peores = []
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            peores = comparar(resultado, json.load(f), args.tolerancia)
+    if fallidos or resultado["webhook"]["errores"] or peores:
+        sys.exit(1)
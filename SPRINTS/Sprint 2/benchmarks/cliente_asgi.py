@@ -0,0 +1,96 @@
+"""Cliente ASGI en proceso, sin dependencias, para pruebas de estrés y benchmarks.
+
+Llama a la app directamente (sin sockets) y maneja el ciclo de vida
+(startup/shutdown) igual que uvicorn.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlencode
+
+from firma import firmar
+
+
+class RespuestaASGI:
+    def __init__(self, estado, cabeceras, cuerpo):
+        self.estado = estado
+        self.cabeceras = cabeceras
+        self.cuerpo = cuerpo
+
+    @property
+    def texto(self):
+        return self.cuerpo.decode()
+
+
+async def llamar(app, metodo, ruta, cuerpo=b"", cabeceras=None, cliente=("127.0.0.1", 50000)):
+    consulta = b""
+    if "?" in ruta:
+        ruta, consulta = ruta.split("?", 1)
+        consulta = consulta.encode()
+    lista = [(k.lower().encode(), v.encode()) for k, v in (cabeceras or {}).items()]
+    lista.append((b"content-length", str(len(cuerpo)).encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": metodo,
+        "scheme": "http",
+        "path": ruta,
+        "raw_path": ruta.encode(),
+        "query_string": consulta,
+        "root_path": "",
+        "headers": lista,
+        "client": cliente,
+        "server": ("testserver", 80),
+    }
+    enviado = False
+
+    async def receive():
+        nonlocal enviado
+        if not enviado:
+            enviado = True
+            return {"type": "http.request", "body": cuerpo, "more_body": False}
+        await asyncio.Event().wait()  # nunca hay desconexión
+
+    partes = []
+    inicio = {}
+
+    async def send(mensaje):
+        if mensaje["type"] == "http.response.start":
+            inicio.update(mensaje)
+        elif mensaje["type"] == "http.response.body":
+            partes.append(mensaje.get("body", b""))
+
+    await app(scope, receive, send)
+    cabeceras_resp = {k.decode().lower(): v.decode() for k, v in inicio.get("headers", [])}
+    return RespuestaASGI(inicio.get("status"), cabeceras_resp, b"".join(partes))
+
+
+async def webhook(app, remitente, texto, message_sid=None, ruta="/whatsapp", cabeceras=None, token=None):
+    """POST con el formato de formulario que usa Twilio (firmado como Twilio si se da `token`)."""
+    campos = {"Body": texto, "From": remitente, "ProfileName": "Prueba"}
+    if message_sid:
+        campos["MessageSid"] = message_sid
+    todas = {"content-type": "application/x-www-form-urlencoded"}
+    if token is not None:
+        todas["x-twilio-signature"] = firmar(token, f"http://testserver{ruta}", list(campos.items()))
+    todas.update(cabeceras or {})
+    return await llamar(app, "POST", ruta, urlencode(campos).encode(), todas)
+
+
+@asynccontextmanager
+async def vida(app):
+    """Ejecuta startup al entrar y shutdown al salir (protocolo lifespan)."""
+    entrada = asyncio.Queue()
+    salida = asyncio.Queue()
+    scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+    tarea = asyncio.create_task(app(scope, entrada.get, salida.put))
+    await entrada.put({"type": "lifespan.startup"})
+    mensaje = await salida.get()
+    if mensaje["type"] != "lifespan.startup.complete":
+        raise RuntimeError(f"startup falló: {mensaje}")
+    try:
+        yield app
+    finally:
+        await entrada.put({"type": "lifespan.shutdown"})
+        await salida.get()
+        await tarea
@@ -0,0 +1,197 @@
+"""Escalado del webhook con la cantidad de workers del lanzador.
+
+Levanta el bot con lanzador.py y 1, 2, 4... workers (hasta los núcleos
+disponibles, o los de --workers) sin Twilio, y le manda "hola" desde
+remitentes al azar por conexiones keep-alive durante --duracion segundos,
+desde --clientes procesos para que el generador de carga no sea el límite.
+
+Por cada corrida reporta peticiones por segundo, latencia p50/p99, la
+eficiencia frente al escalado lineal (rps / (rps con 1 worker × workers))
+y qué parte de las peticiones llegó a un worker que no era el dueño del
+remitente y se reenvió por su socket unix (reparto.py). Con N workers se
+espera que sea (N-1)/N.
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/escala_workers.py
+    python benchmarks/escala_workers.py --workers 1 2 4 8 --clientes 4 --salida escala.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(AQUI)
+sys.path.insert(0, AQUI)
+
+from carga_webhook import ClienteHTTP, percentil, puerto_libre
+
+
+def arrancar_lanzador(workers, puerto):
+    entorno = dict(
+        os.environ,
+        TWILIO_ACCOUNT_SID="",
+        TWILIO_AUTH_TOKEN="",
+        ADMISION_TASA_REMITENTE="0",
+        REGISTRO_CONFIG=json.dumps({"nivel": "WARNING"}),
+        DIARIO_RUTA=os.path.join(tempfile.mkdtemp(prefix="aiuda-escala-"), "diario.jsonl"),
+        DIFUSION_SQLITE="",
+        ANALITICA_SQLITE="",
+    )
+    return subprocess.Popen(
+        [sys.executable, "lanzador.py", "--host", "127.0.0.1", "--puerto", str(puerto),
+         "--workers", str(workers), "--nivel-uvicorn", "warning"],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL,
+    )
+
+
+async def de_cada_worker(puerto, ruta, workers, limite=30.0):
+    """La respuesta JSON de `ruta` de cada worker: el kernel reparte las conexiones, se abren hasta verlos a todos."""
+    vistos = {}
+    fin = time.monotonic() + limite
+    while len(vistos) < workers:
+        if time.monotonic() > fin:
+            raise TimeoutError(f"respondieron {sorted(vistos)} de {workers} workers")
+        cliente = ClienteHTTP("127.0.0.1", puerto, 1)
+        try:
+            estado, cuerpo = await cliente.pedir("GET", ruta)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+        finally:
+            await cliente.cerrar()
+        if estado == 200:
+            datos = json.loads(cuerpo)
+            indice = datos["worker"] if "worker" in datos else datos["reparto"]["worker"]
+            vistos[indice] = datos
+        else:
+            await asyncio.sleep(0.05)
+    return [vistos[i] for i in range(workers)]
+
+
+async def hablar(puerto, conexiones, duracion, usuarios, semilla):
+    """Carga de un proceso cliente: devuelve (latencias en s, errores)."""
+    cliente = ClienteHTTP("127.0.0.1", puerto, conexiones)
+    azar = random.Random(semilla)
+    latencias = []
+    errores = 0
+    fin = time.perf_counter() + duracion
+
+    async def conexion():
+        nonlocal errores
+        while time.perf_counter() < fin:
+            cuerpo = urlencode({"From": f"whatsapp:+549{azar.randrange(usuarios):09d}", "Body": "hola"}).encode()
+            inicio = time.perf_counter()
+            try:
+                estado, _ = await cliente.pedir("POST", "/whatsapp", cuerpo)
+            except OSError:
+                estado = None
+            if estado == 200:
+                latencias.append(time.perf_counter() - inicio)
+            else:
+                errores += 1
+
+    await asyncio.gather(*(conexion() for _ in range(conexiones)))
+    await cliente.cerrar()
+    return latencias, errores
+
+
+def proceso_cliente(puerto, conexiones, duracion, usuarios, semilla, salida):
+    salida.send(asyncio.run(hablar(puerto, conexiones, duracion, usuarios, semilla)))
+    salida.close()
+
+
+async def medir(args, workers):
+    puerto = puerto_libre()
+    proceso = arrancar_lanzador(workers, puerto)
+    try:
+        await de_cada_worker(puerto, "/listo", workers)
+        antes = await de_cada_worker(puerto, "/test", workers)
+
+        tuberias, clientes = [], []
+        for i in range(args.clientes):
+            lectura, escritura = multiprocessing.Pipe(duplex=False)
+            cliente = multiprocessing.Process(target=proceso_cliente, args=(
+                puerto, args.conexiones, args.duracion, args.usuarios, i, escritura))
+            cliente.start()
+            escritura.close()
+            tuberias.append(lectura)
+            clientes.append(cliente)
+        inicio = time.perf_counter()
+        resultados = [await asyncio.to_thread(t.recv) for t in tuberias]
+        duracion = time.perf_counter() - inicio
+        for cliente in clientes:
+            cliente.join()
+
+        despues = await de_cada_worker(puerto, "/test", workers)
+    finally:
+        proceso.send_signal(signal.SIGTERM)
+        try:
+            proceso.wait(60)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+    latencias = [x * 1000 for lat, _ in resultados for x in lat]
+    reenviados = sum(d["reparto"]["reenviados"] for d in despues) - sum(d["reparto"]["reenviados"] for d in antes)
+    return {
+        "workers": workers,
+        "peticiones": len(latencias),
+        "errores": sum(e for _, e in resultados),
+        "por_segundo": round(len(latencias) / duracion, 1),
+        "p50_ms": round(percentil(latencias, 50), 2),
+        "p99_ms": round(percentil(latencias, 99), 2),
+        "reenviadas": round(reenviados / len(latencias), 3) if latencias else 0.0,
+        "errores_reparto": sum(d["reparto"]["errores"] for d in despues),
+    }
+
+
+async def correr(args):
+    corridas = []
+    for workers in args.workers:
+        corrida = await medir(args, workers)
+        base = corridas[0] if corridas else corrida
+        corrida["eficiencia"] = round(
+            corrida["por_segundo"] / (base["por_segundo"] * workers / base["workers"]), 2) if base["por_segundo"] else None
+        corridas.append(corrida)
+        print(f"  {workers:>3} workers: {corrida['por_segundo']:>8} req/s  p50 {corrida['p50_ms']:>6} ms  "
+              f"p99 {corrida['p99_ms']:>7} ms  eficiencia {corrida['eficiencia']}  "
+              f"reenviadas {corrida['reenviadas']:.0%}  errores {corrida['errores']}")
+    return corridas
+
+
+def escalones(nucleos):
+    workers = [1]
+    while workers[-1] * 2 <= nucleos:
+        workers.append(workers[-1] * 2)
+    if workers[-1] != nucleos:
+        workers.append(nucleos)
+    return workers
+
+
+if __name__ == "__main__":
+    nucleos = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Escalado del webhook con los workers del lanzador")
+    parser.add_argument("--workers", type=int, nargs="+", default=escalones(nucleos))
+    parser.add_argument("--duracion", type=float, default=10.0, help="segundos de carga por corrida")
+    parser.add_argument("--clientes", type=int, default=max(1, nucleos // 2), help="procesos generadores de carga")
+    parser.add_argument("--conexiones", type=int, default=32, help="conexiones keep-alive por proceso cliente")
+    parser.add_argument("--usuarios", type=int, default=10000, help="remitentes distintos")
+    parser.add_argument("--salida", help="archivo JSON para guardar los resultados")
+    args = parser.parse_args()
+
+    print(f"🔀 {nucleos} núcleo(s) disponibles; workers: {args.workers}")
+    corridas = asyncio.run(correr(args))
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"fecha": time.strftime("%Y-%m-%dT%H:%M:%S"), "nucleos": nucleos, "corridas": corridas},
+                      f, indent=2, ensure_ascii=False)
+    if any(c["errores"] or c["errores_reparto"] for c in corridas):
+        sys.exit(1)
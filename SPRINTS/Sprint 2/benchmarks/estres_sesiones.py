@@ -0,0 +1,134 @@
+"""Prueba de estrés: ráfagas simultáneas del mismo usuario durante el grounding.
+
+N usuarios hacen el grounding a la vez. En cada paso, cada usuario manda una
+ráfaga de R respuestas simultáneas (como un reintento de Twilio o alguien
+que escribe muy rápido). La máquina de estados debe aceptar exactamente
+una respuesta por paso, avanzar de a uno y enviar los mensajes salientes
+en el orden correcto.
+
+Las secciones con el lock del usuario (leer la sesión, procesar, guardar)
+no tienen ningún await: una vez que un mensaje toma el lock, termina sin
+ceder el event loop, así que dos mensajes del mismo usuario no pueden
+intercalarse aunque lleguen juntos. Eso es lo que hace correcto el
+procesamiento; el lock solo sería necesario si algo ahí adentro esperara.
+La prueba lo verifica directamente: ningún mensaje de una ráfaga debe
+encontrar el lock tomado (esperas == 0). Si alguna vez hay esperas, algo
+dentro del lock cede el event loop y hay que revisarlo.
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/estres_sesiones.py --usuarios 200 --rafaga 4
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, AQUI)
+sys.path.insert(0, os.path.dirname(AQUI))
+os.chdir(os.path.dirname(AQUI))
+
+import twilio_falso
+from cliente_asgi import vida, webhook
+
+servidor_twilio, URL_TWILIO = twilio_falso.iniciar_en_hilo()
+# Sin límites ni agrupación: aquí se verifica mensaje por mensaje (y sin diario: cada corrida empieza de cero)
+os.environ.update(TWILIO_ACCOUNT_SID="ACestres", TWILIO_AUTH_TOKEN="x", TWILIO_API_URL=URL_TWILIO,
+                  ENVIOS_TASA_REMITENTE="0", ENVIOS_TASA_DESTINO="0", ENVIOS_VENTANA_AGRUPAR="0",
+                  ADMISION_TASA_REMITENTE="0", DIARIO_RUTA="", DIFUSION_SQLITE="", ANALITICA_SQLITE="")
+
+import whatsapp_bot as bot
+
+# Pasos interactivos del grounding según ejercicios.json
+PASOS_GROUNDING = len(bot.motor_ejercicios.obtener("grounding").respuestas) if bot.almacen_contenido.actual() else 0
+
+
+async def esperar(condicion, limite=20.0):
+    fin = time.monotonic() + limite
+    while not condicion():
+        if time.monotonic() > fin:
+            raise TimeoutError("la sesión no llegó al estado esperado")
+        await asyncio.sleep(0.05)
+
+
+def en_paso(usuario, paso):
+    sesion = bot.obtener_sesion(usuario)
+    return sesion.estado == "en_ejercicio" and sesion.paso_actual == paso and sesion.esperando_respuesta
+
+
+async def simular_usuario(app, i, rafaga):
+    usuario = f"whatsapp:+51900{i:06d}"
+    aceptadas = []
+    await webhook(app, usuario, "2", token="x")
+    await esperar(lambda: en_paso(usuario, 1))
+
+    for paso in range(1, PASOS_GROUNDING + 1):
+        textos = [f"u{i}-p{paso}-r{k}" for k in range(rafaga)]
+        respuestas = await asyncio.gather(*(webhook(app, usuario, t, token="x") for t in textos))
+        # La respuesta aceptada devuelve TwiML vacío; el resto, "No entendí"
+        vacias = [t for t, r in zip(textos, respuestas) if "<Message>" not in r.texto]
+        if len(vacias) != 1:
+            return usuario, f"paso {paso}: {len(vacias)} respuestas aceptadas (se esperaba 1)"
+        aceptadas.append(vacias[0])
+        if paso < PASOS_GROUNDING:
+            await esperar(lambda: en_paso(usuario, paso + 1))
+        else:
+            await esperar(lambda: bot.obtener_sesion(usuario).estado == "esperando_feedback")
+    return usuario, aceptadas
+
+
+def verificar_envios(usuario, aceptadas):
+    cuerpos = [m["body"] for m in servidor_twilio.mensajes if m["to"] == usuario]
+    esperados = 2 + 2 * PASOS_GROUNDING  # intro + paso 1, y por paso: eco + siguiente/cierre
+    if len(cuerpos) != esperados:
+        return f"{len(cuerpos)} mensajes enviados (se esperaban {esperados})"
+    ecos = cuerpos[2::2]
+    for paso, (eco, texto) in enumerate(zip(ecos, aceptadas), start=1):
+        if texto not in eco:
+            return f"paso {paso}: el eco no contiene la respuesta aceptada {texto!r}"
+    if "Lo lograste" not in cuerpos[-1]:
+        return "el último mensaje no es el cierre del grounding"
+    return None
+
+
+async def main(usuarios, rafaga):
+    async with vida(bot.app) as app:
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*(simular_usuario(app, i, rafaga) for i in range(usuarios)))
+        duracion = time.perf_counter() - inicio
+        await asyncio.sleep(0.5)  # que el pipeline termine de enviar
+
+    fallos = []
+    for usuario, resultado in resultados:
+        error = resultado if isinstance(resultado, str) else verificar_envios(usuario, resultado)
+        if error:
+            fallos.append((usuario, error))
+    return duracion, fallos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estrés de sesiones concurrentes")
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--rafaga", type=int, default=4, help="mensajes simultáneos por paso")
+    args = parser.parse_args()
+
+    # El bot imprime cada mensaje; aquí solo interesa el resultado
+    with contextlib.redirect_stdout(io.StringIO()):
+        duracion, fallos = asyncio.run(main(args.usuarios, args.rafaga))
+
+    webhooks = args.usuarios * (1 + PASOS_GROUNDING * args.rafaga)
+    print(f"👥 {args.usuarios} usuarios, ráfagas de {args.rafaga}: {webhooks} webhooks en {duracion:.1f}s")
+    esperas = bot.cerrojos_usuarios.esperas
+    print(f"🔒 Esperas por lock de usuario: {esperas}")
+    if esperas:
+        print("❌ Hubo mensajes esperando el lock: algo dentro de la sección con lock cede el event loop")
+        sys.exit(1)
+    if fallos:
+        print(f"❌ {len(fallos)} usuarios con transiciones incorrectas")
+        for usuario, error in fallos[:10]:
+            print(f"   {usuario}: {error}")
+        sys.exit(1)
+    print("✅ Todas las transiciones y envíos son correctos")
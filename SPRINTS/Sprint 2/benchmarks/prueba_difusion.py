@@ -0,0 +1,254 @@
+"""Prueba de punta a punta de las difusiones contra el Twilio falso.
+
+Levanta el bot en proceso (cliente_asgi) con un Twilio falso que limita
+por remitente y recorre el flujo completo por /admin/difusiones:
+
+1. sin token o con datos inválidos se rechaza (401 / 400)
+2. check-in con variables a N usuarios: un mensaje por número, con su
+   texto, al ritmo de DIFUSION_TASA, y la sesión queda esperando respuesta
+3. apagar el bot a mitad de una difusión y volver a levantarlo: se
+   retoma y cada número recibe el mensaje exactamente una vez
+4. pausar y reanudar: mientras está pausada no sale nada
+5. ejercicio para la cohorte que cumple un filtro de sesión, omitiendo a
+   quien está en medio de otro ejercicio
+
+Con --sesiones redis (o sqlite) todo corre sobre ese almacén de sesiones;
+para redis se levanta redis_falso.py en un hilo. Al final /test debe
+contar las mismas sesiones que devuelve usuarios().
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/prueba_difusion.py --usuarios 1000 --tasa 100
+    python benchmarks/prueba_difusion.py --usuarios 200 --sesiones redis
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, AQUI)
+sys.path.insert(0, os.path.dirname(AQUI))
+os.chdir(os.path.dirname(AQUI))
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--usuarios", type=int, default=1000)
+parser.add_argument("--tasa", type=float, default=100, help="mensajes por segundo de cada difusión")
+parser.add_argument("--sesiones", choices=("memoria", "sqlite", "redis"), default="memoria")
+args = parser.parse_args()
+
+import twilio_falso
+
+# El Twilio falso limita al remitente al doble de la tasa de la difusión: un 429 se notaría como reintento
+servidor_twilio, URL_TWILIO = twilio_falso.iniciar_en_hilo(latencia=0.005, limite=args.tasa * 2)
+os.environ.update(
+    TWILIO_ACCOUNT_SID="ACdifusion", TWILIO_AUTH_TOKEN="x", TWILIO_API_URL=URL_TWILIO,
+    ENVIOS_TASA_REMITENTE=str(args.tasa * 2), ENVIOS_TASA_DESTINO="0", ENVIOS_VENTANA_AGRUPAR="0",
+    ADMISION_TASA_REMITENTE="0", DIARIO_RUTA="", EJERCICIOS_ESCALA_TIEMPO="0.01",
+    ADMIN_TOKEN="secreto", DIFUSION_TASA=str(args.tasa), DIFUSION_LOTE="50",
+    DIFUSION_SQLITE=os.path.join(tempfile.mkdtemp(prefix="aiuda-difusion-"), "difusiones.db"),
+    ANALITICA_SQLITE="",
+    REGISTRO_CONFIG=json.dumps({"nivel": "WARNING"}),
+    SESIONES_BACKEND=args.sesiones,
+    SESIONES_SQLITE=os.path.join(tempfile.mkdtemp(prefix="aiuda-sesiones-"), "sesiones.db"),
+)
+if args.sesiones == "redis":
+    import redis_falso
+
+    servidor_redis, os.environ["SESIONES_REDIS_URL"] = redis_falso.iniciar_en_hilo()
+
+from cliente_asgi import llamar, vida, webhook
+
+import whatsapp_bot as bot
+
+ADMIN = {"authorization": "Bearer secreto", "content-type": "application/json"}
+fallas = []
+
+
+def verificar(condicion, descripcion):
+    print(f"  {'✅' if condicion else '❌'} {descripcion}")
+    if not condicion:
+        fallas.append(descripcion)
+
+
+async def admin(app, metodo, ruta, cuerpo=None):
+    respuesta = await llamar(app, metodo, ruta, json.dumps(cuerpo).encode() if cuerpo is not None else b"", ADMIN)
+    return respuesta.estado, json.loads(respuesta.cuerpo) if respuesta.cuerpo else None
+
+
+async def esperar_estado(app, id_difusion, estados=("terminada",), limite=120.0, condicion=None):
+    fin = time.monotonic() + limite
+    while True:
+        _, progreso = await admin(app, "GET", f"/admin/difusiones/{id_difusion}")
+        if progreso["estado"] in estados and (condicion is None or condicion(progreso)):
+            return progreso
+        if time.monotonic() > fin:
+            raise TimeoutError(f"la difusión {id_difusion} quedó en {progreso}")
+        await asyncio.sleep(0.05)
+
+
+def recibidos():
+    with servidor_twilio.lock:
+        return {destino: list(cuerpos) for destino, cuerpos in servidor_twilio.cuerpos.items()}
+
+
+def limpiar_twilio():
+    with servidor_twilio.lock:
+        servidor_twilio.mensajes.clear()
+        servidor_twilio.cuerpos.clear()
+
+
+def cohorte(prefijo, n):
+    return [{"numero": f"whatsapp:+{prefijo}{i:06d}", "nombre": f"Persona {i}"} for i in range(n)]
+
+
+def exactamente_una_vez(numeros, cuerpos):
+    conteo = Counter({numero: len(cuerpos.get(numero, [])) for numero in numeros})
+    return sum(1 for c in conteo.values() if c == 0), sum(c - 1 for c in conteo.values() if c > 1)
+
+
+async def rechazos(app):
+    print("\n1. Autenticación y validación")
+    sin_token = await llamar(app, "POST", "/admin/difusiones", b"{}", {"content-type": "application/json"})
+    verificar(sin_token.estado == 401, f"sin token: {sin_token.estado}")
+    otro = await llamar(app, "GET", "/admin/difusiones", b"", {"authorization": "Bearer otro"})
+    verificar(otro.estado == 401, f"token equivocado: {otro.estado}")
+    for cuerpo in ({"mensaje": "hola"}, {"mensaje": "hola", "destinatarios": ["123"]},
+                   {"destinatarios": ["+5491100000000"]}, {"ejercicio": "nada", "destinatarios": ["+5491100000000"]},
+                   {"mensaje": "hola", "filtro": {"color": "azul"}}):
+        estado, _ = await admin(app, "POST", "/admin/difusiones", cuerpo)
+        verificar(estado == 400, f"{json.dumps(cuerpo, ensure_ascii=False)}: {estado}")
+
+
+async def check_in(app, n):
+    print(f"\n2. Check-in a {n} usuarios a {args.tasa:g}/s")
+    limpiar_twilio()
+    destinatarios = cohorte("54911", n)
+    inicio = time.monotonic()
+    cuerpo = {"id": "check-in", "mensaje": "Hola $nombre, ¿cómo te sientes hoy?",
+              "destinatarios": destinatarios + destinatarios[:10], "esperar_respuesta": True}
+    estado, creada = await admin(app, "POST", "/admin/difusiones", cuerpo)
+    verificar(estado == 202 and creada["total"] == n, f"creada: {estado}, {creada['total']} destinatarios (repetidos fuera)")
+    estado, repetida = await admin(app, "POST", "/admin/difusiones", cuerpo)
+    verificar(estado == 202 and not repetida["creada"], "reintentar la creación con el mismo id no la duplica")
+    progreso = await esperar_estado(app, "check-in")
+    segundos = time.monotonic() - inicio
+    numeros = [d["numero"] for d in destinatarios]
+    faltan, repetidos = exactamente_una_vez(numeros, recibidos())
+    verificar(progreso["enviados"] == n and faltan == 0 and repetidos == 0,
+              f"{progreso['enviados']} enviados, {faltan} sin mensaje, {repetidos} repetidos")
+    verificar(all(recibidos()[d["numero"]] == [f"Hola {d['nombre']}, ¿cómo te sientes hoy?"] for d in destinatarios),
+              "cada uno recibió su texto con sus variables")
+    print(f"  {n / segundos:.0f} mensajes/s (tasa pedida {args.tasa:g}/s), 429 del Twilio falso: {servidor_twilio.rechazados}")
+    verificar(n / segundos <= args.tasa * 1.1, "la difusión respeta su tasa")
+    _, filas = await admin(app, "GET", "/admin/difusiones/check-in/destinatarios?limite=5")
+    verificar(len(filas) == 5 and all(f["estado"] == "enviado" and f["detalle"].startswith("SM") for f in filas),
+              "resultado por destinatario con el sid de Twilio")
+    verificar(all(bot.obtener_sesion(numero).estado == "esperando_feedback" for numero in numeros),
+              "las sesiones quedaron esperando la respuesta")
+    respuesta = await webhook(app, numeros[0], "Bien, gracias", token="x")
+    verificar(bot.cache_respuestas.feedback.split("\n")[0] in respuesta.texto, "la respuesta al check-in recibe el agradecimiento")
+
+
+async def reanudar_tras_apagar(n):
+    print(f"\n3. Apagar a mitad de una difusión de {n} y volver a levantar")
+    limpiar_twilio()
+    destinatarios = cohorte("54922", n)
+    async with vida(bot.app) as app:
+        await admin(app, "POST", "/admin/difusiones", {"id": "reanudar", "mensaje": "Recordatorio: $nombre",
+                                                       "destinatarios": destinatarios})
+        await esperar_estado(app, "reanudar", ("en_curso",), condicion=lambda p: p["enviados"] >= n * 0.4)
+    _, parcial = await admin(bot.app, "GET", "/admin/difusiones/reanudar")
+    enviados = sum(map(len, recibidos().values()))
+    verificar(parcial["estado"] == "en_curso" and parcial["pendientes"] > 0,
+              f"al apagar: {parcial['enviados']} anotados, {parcial['pendientes']} pendientes")
+    verificar(enviados == parcial["enviados"], f"todo lo enviado quedó anotado ({enviados} en Twilio)")
+    async with vida(bot.app) as app:
+        progreso = await esperar_estado(app, "reanudar")
+    faltan, repetidos = exactamente_una_vez([d["numero"] for d in destinatarios], recibidos())
+    verificar(progreso["enviados"] == n and faltan == 0 and repetidos == 0,
+              f"retomada: {progreso['enviados']} enviados, {faltan} sin mensaje, {repetidos} repetidos")
+
+
+async def pausar_y_reanudar(app, n):
+    print(f"\n4. Pausar y reanudar una difusión de {n}")
+    limpiar_twilio()
+    destinatarios = cohorte("54933", n)
+    await admin(app, "POST", "/admin/difusiones", {"id": "pausa", "mensaje": "Pausa $nombre", "destinatarios": destinatarios})
+    await esperar_estado(app, "pausa", ("en_curso",), condicion=lambda p: p["enviados"] >= n * 0.3)
+    estado, _ = await admin(app, "POST", "/admin/difusiones/pausa/pausar")
+    verificar(estado == 200, f"pausar: {estado}")
+    # Lo ya encolado termina de salir y se anota; después no debe salir nada
+    fin = time.monotonic() + 30
+    while bot.difusor.estadisticas()["en_curso"] and time.monotonic() < fin:
+        await asyncio.sleep(0.05)
+    antes = sum(map(len, recibidos().values()))
+    await asyncio.sleep(1.0)
+    despues = sum(map(len, recibidos().values()))
+    _, pausada = await admin(app, "GET", "/admin/difusiones/pausa")
+    verificar(antes == despues and pausada["estado"] == "pausada",
+              f"pausada: {despues} enviados y no sale nada más ({pausada['pendientes']} pendientes)")
+    estado, _ = await admin(app, "POST", "/admin/difusiones/pausa/pausar")
+    verificar(estado == 409, f"pausar otra vez: {estado}")
+    await admin(app, "POST", "/admin/difusiones/pausa/reanudar")
+    await esperar_estado(app, "pausa")
+    faltan, repetidos = exactamente_una_vez([d["numero"] for d in destinatarios], recibidos())
+    verificar(faltan == 0 and repetidos == 0, f"reanudada: {faltan} sin mensaje, {repetidos} repetidos")
+
+
+async def ejercicio_por_filtro(app, n):
+    print("\n5. Ejercicio de respiración para un filtro de sesión")
+    limpiar_twilio()
+    ocupados = [f"whatsapp:+54944{i:06d}" for i in range(min(20, n))]
+    for numero in ocupados:
+        await webhook(app, numero, "2", token="x")  # grounding: en_ejercicio esperando respuesta
+    await asyncio.sleep(0.5)
+    esperando = [u for u, s in bot.almacen_sesiones.usuarios() if s.estado == "esperando_feedback"]
+    estado, creada = await admin(app, "POST", "/admin/difusiones", {
+        "id": "respira", "ejercicio": "respiracion", "filtro": {"estado": "esperando_feedback"},
+        "destinatarios": ocupados})
+    verificar(estado == 202 and creada["total"] == len(esperando) + len(ocupados),
+              f"cohorte: {len(esperando)} por filtro + {len(ocupados)} explícitos")
+    progreso = await esperar_estado(app, "respira")
+    verificar(progreso["omitidos"] == len(ocupados) and progreso["enviados"] == len(esperando),
+              f"{progreso['enviados']} iniciados, {progreso['omitidos']} omitidos por estar en otro ejercicio")
+    introduccion = bot.motor_ejercicios.obtener("respiracion").introduccion
+    cuerpos = recibidos()
+    # El primer paso puede salir en la misma llamada que la introducción (el pipeline agrupa)
+    verificar(all((cuerpos.get(u) or [""])[0].startswith(introduccion) for u in esperando),
+              "cada uno recibió la introducción primero")
+    verificar(all(bot.obtener_sesion(u).ejercicio_actual == "respiracion" for u in esperando),
+              "y quedó con el ejercicio en curso")
+
+
+async def contar_sesiones(app):
+    print(f"\n6. /test con sesiones en {args.sesiones}")
+    respuesta = await llamar(app, "GET", "/test")
+    verificar(respuesta.estado == 200, f"/test: {respuesta.estado}")
+    if respuesta.estado == 200:
+        activas = json.loads(respuesta.cuerpo)["sesiones_activas"]
+        usuarios = len(bot.almacen_sesiones.usuarios())
+        verificar(activas == usuarios > 0, f"len() cuenta {activas} sesiones y usuarios() devuelve {usuarios}")
+
+
+async def main():
+    async with vida(bot.app) as app:
+        await rechazos(app)
+        await check_in(app, args.usuarios)
+    await reanudar_tras_apagar(args.usuarios)
+    async with vida(bot.app) as app:
+        await pausar_y_reanudar(app, args.usuarios)
+        await ejercicio_por_filtro(app, args.usuarios)
+        await contar_sesiones(app)
+        _, todas = await admin(app, "GET", "/admin/difusiones")
+        print("\nDifusiones:", ", ".join(f"{d['id']}={d['estado']}" for d in todas))
+        print("Difusor:", bot.difusor.estadisticas())
+    print(f"\n{'✅ Todo bien' if not fallas else f'❌ {len(fallas)} fallas'}")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
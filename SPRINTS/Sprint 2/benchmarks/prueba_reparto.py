@@ -0,0 +1,108 @@
+"""Prueba del reenvío entre workers (reparto.py): el dueño ve la IP del cliente original.
+
+Levanta en el proceso dos "workers" con RepartirWebhook delante de una app
+que responde con lo que ve (la IP del scope y las cabeceras X-Aiuda-Cliente),
+el dueño escuchando con uvicorn en su socket unix como en lanzador.py, y
+manda webhooks al otro como si llegaran por el puerto público:
+
+1. un remitente del dueño se reenvía y el dueño ve la IP del cliente
+2. una X-Aiuda-Cliente que manda el cliente no llega ni reemplaza la real
+3. un remitente propio se atiende ahí mismo, sin reenviar
+
+Uso (desde SPRINTS/Sprint 2):
+    python benchmarks/prueba_reparto.py
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from urllib.parse import urlencode
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, AQUI)
+sys.path.insert(0, os.path.dirname(AQUI))
+os.chdir(os.path.dirname(AQUI))
+
+import uvicorn
+
+from cliente_asgi import llamar
+from reparto import CABECERA_CLIENTE, Reparto, RepartirWebhook, particion
+
+IP_CLIENTE = "203.0.113.7"
+fallas = []
+
+
+def verificar(condicion, descripcion):
+    print(f"  {'✅' if condicion else '❌'} {descripcion}")
+    if not condicion:
+        fallas.append(descripcion)
+
+
+def crear_eco(nombre):
+    async def eco(scope, receive, send):
+        while (await receive()).get("more_body"):
+            pass
+        cuerpo = json.dumps({
+            "worker": nombre,
+            "ip": (scope.get("client") or ("",))[0],
+            "cabeceras_cliente": [v.decode("latin-1") for k, v in scope["headers"] if k == CABECERA_CLIENTE],
+        }).encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", b"%d" % len(cuerpo))]})
+        await send({"type": "http.response.body", "body": cuerpo})
+    return eco
+
+
+def numero_de(indice, workers=2):
+    return next(f"whatsapp:+549{i:09d}" for i in range(1000) if particion(f"whatsapp:+549{i:09d}", workers) == indice)
+
+
+async def enviar(app, numero, cabeceras=None):
+    respuesta = await llamar(app, "POST", "/whatsapp", urlencode({"From": numero, "Body": "hola"}).encode(),
+                             {"host": "bot.ejemplo", "content-type": "application/x-www-form-urlencoded",
+                              **(cabeceras or {})},
+                             cliente=(IP_CLIENTE, 40000))
+    return respuesta.estado, json.loads(respuesta.cuerpo) if respuesta.estado == 200 else None
+
+
+async def main():
+    directorio = tempfile.mkdtemp(prefix="aiuda-reparto-")
+    sockets = [os.path.join(directorio, f"worker-{i}.sock") for i in range(2)]
+    publico, dueno = Reparto(espera=5.0), Reparto(espera=5.0)
+    publico.configurar(0, sockets)
+    dueno.configurar(1, sockets)
+
+    servidor = uvicorn.Server(uvicorn.Config(RepartirWebhook(crear_eco("dueño"), dueno), uds=sockets[1],
+                                             lifespan="off", log_level="warning"))
+    tarea = asyncio.create_task(servidor.serve())
+    while not servidor.started:
+        await asyncio.sleep(0.01)
+    app = RepartirWebhook(crear_eco("público"), publico)
+    try:
+        print("\n1. Remitente de otro worker")
+        estado, visto = await enviar(app, numero_de(1))
+        verificar(estado == 200 and visto["worker"] == "dueño", f"lo atiende el dueño: {estado}, {visto}")
+        verificar(visto is not None and visto["ip"] == IP_CLIENTE, f"el dueño ve la IP del cliente: {visto and visto['ip']}")
+
+        print("\n2. X-Aiuda-Cliente puesta por el cliente")
+        estado, visto = await enviar(app, numero_de(1), {CABECERA_CLIENTE.decode(): "198.51.100.1"})
+        verificar(visto is not None and visto["ip"] == IP_CLIENTE, f"la IP sigue siendo la real: {visto and visto['ip']}")
+        verificar(visto is not None and visto["cabeceras_cliente"] == [IP_CLIENTE],
+                  f"llega una sola cabecera, la de este worker: {visto and visto['cabeceras_cliente']}")
+
+        print("\n3. Remitente propio")
+        estado, visto = await enviar(app, numero_de(0))
+        verificar(estado == 200 and visto["worker"] == "público" and visto["ip"] == IP_CLIENTE,
+                  f"se atiende sin reenviar: {visto}")
+        verificar(publico.reenviados == 2 and dueno.recibidos == 2 and publico.errores == 0,
+                  f"reenviados {publico.reenviados}, recibidos {dueno.recibidos}, errores {publico.errores}")
+    finally:
+        servidor.should_exit = True
+        await tarea
+    print(f"\n{'✅ Todo bien' if not fallas else f'❌ {len(fallas)} fallas'}")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,164 @@
+"""Servidor local mínimo que habla el protocolo de Redis (RESP2).
+
+Implementa lo que usan los almacenes del bot: PING, AUTH, SELECT, GET, MGET,
+SET (con EX/PX/NX), DEL, EXISTS, EXPIRE, INCR y SCAN con MATCH. Sirve para
+probar AlmacenRedis sin instalar Redis:
+
+    python benchmarks/redis_falso.py --puerto 6380
+    SESIONES_BACKEND=redis SESIONES_REDIS_URL=redis://127.0.0.1:6380/0 python whatsapp_bot.py
+"""
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+
+
+class ManejadorRESP(socketserver.StreamRequestHandler):
+
+    def _leer_comando(self):
+        linea = self.rfile.readline()
+        if not linea:
+            return None
+        if not linea.startswith(b"*"):
+            return linea.decode().split()  # comando en línea (redis-cli --no-raw, telnet)
+        argumentos = []
+        for _ in range(int(linea[1:-2])):
+            largo = int(self.rfile.readline()[1:-2])
+            argumentos.append(self.rfile.read(largo + 2)[:-2].decode())
+        return argumentos
+
+    def _escribir(self, valor):
+        self.wfile.write(codificar(valor))
+
+    def handle(self):
+        while True:
+            argumentos = self._leer_comando()
+            if argumentos is None:
+                return
+            if not argumentos:
+                continue
+            try:
+                respuesta = self.server.ejecutar(argumentos)
+            except Exception as e:
+                respuesta = ErrorComando(str(e))
+            self._escribir(respuesta)
+
+
+class ErrorComando(Exception):
+    pass
+
+
+class Simple(str):
+    pass
+
+
+def codificar(valor):
+    if isinstance(valor, ErrorComando):
+        return f"-ERR {valor}\r\n".encode()
+    if isinstance(valor, Simple):
+        return f"+{valor}\r\n".encode()
+    if valor is None:
+        return b"$-1\r\n"
+    if isinstance(valor, int):
+        return f":{valor}\r\n".encode()
+    if isinstance(valor, list):
+        return f"*{len(valor)}\r\n".encode() + b"".join(codificar(v) for v in valor)
+    datos = str(valor).encode()
+    return b"$%d\r\n%s\r\n" % (len(datos), datos)
+
+
+class ServidorRedisFalso(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, direccion):
+        super().__init__(direccion, ManejadorRESP)
+        self.lock = threading.Lock()
+        self.datos = {}  # clave -> (valor, expira o None)
+        self.comandos = 0
+
+    def _vivo(self, clave):
+        entrada = self.datos.get(clave)
+        if entrada is None:
+            return None
+        if entrada[1] is not None and entrada[1] <= time.monotonic():
+            del self.datos[clave]
+            return None
+        return entrada
+
+    def ejecutar(self, argumentos):
+        nombre = argumentos[0].upper()
+        with self.lock:
+            self.comandos += 1
+            if nombre in ("PING",):
+                return Simple("PONG")
+            if nombre in ("AUTH", "SELECT"):
+                return Simple("OK")
+            if nombre == "GET":
+                entrada = self._vivo(argumentos[1])
+                return entrada[0] if entrada else None
+            if nombre == "MGET":
+                return [entrada[0] if entrada else None for entrada in map(self._vivo, argumentos[1:])]
+            if nombre == "SET":
+                clave, valor = argumentos[1], argumentos[2]
+                expira, solo_si_no_existe = None, False
+                opciones = [a.upper() for a in argumentos[3:]]
+                for i, opcion in enumerate(opciones):
+                    if opcion == "EX":
+                        expira = time.monotonic() + int(argumentos[4 + i])
+                    elif opcion == "PX":
+                        expira = time.monotonic() + int(argumentos[4 + i]) / 1000
+                    elif opcion == "NX":
+                        solo_si_no_existe = True
+                if solo_si_no_existe and self._vivo(clave):
+                    return None
+                self.datos[clave] = (valor, expira)
+                return Simple("OK")
+            if nombre == "DEL":
+                return sum(1 for clave in argumentos[1:] if self.datos.pop(clave, None) is not None)
+            if nombre == "EXISTS":
+                return sum(1 for clave in argumentos[1:] if self._vivo(clave))
+            if nombre == "EXPIRE":
+                entrada = self._vivo(argumentos[1])
+                if not entrada:
+                    return 0
+                self.datos[argumentos[1]] = (entrada[0], time.monotonic() + int(argumentos[2]))
+                return 1
+            if nombre == "INCR":
+                entrada = self._vivo(argumentos[1])
+                valor = int(entrada[0]) + 1 if entrada else 1
+                self.datos[argumentos[1]] = (str(valor), entrada[1] if entrada else None)
+                return valor
+            if nombre == "SCAN":
+                patron = "*"
+                opciones = [a.upper() for a in argumentos]
+                if "MATCH" in opciones:
+                    patron = argumentos[opciones.index("MATCH") + 1]
+                claves = [c for c in list(self.datos) if self._vivo(c) and fnmatch.fnmatchcase(c, patron)]
+                return ["0", claves]
+            if nombre == "DBSIZE":
+                return len(self.datos)
+            if nombre == "FLUSHALL":
+                self.datos.clear()
+                return Simple("OK")
+        raise ErrorComando(f"comando no soportado '{argumentos[0]}'")
+
+
+def iniciar_en_hilo(host="127.0.0.1", puerto=0):
+    """Arranca el servidor en un hilo y devuelve (servidor, url)."""
+    servidor = ServidorRedisFalso((host, puerto))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, puerto = servidor.server_address[:2]
+    return servidor, f"redis://{host}:{puerto}/0"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor falso de Redis")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=6380)
+    args = parser.parse_args()
+
+    servidor = ServidorRedisFalso((args.host, args.puerto))
+    print(f"🧪 Redis falso escuchando en redis://{args.host}:{args.puerto}/0")
+    servidor.serve_forever()
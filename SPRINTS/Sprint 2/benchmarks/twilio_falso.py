@@ -0,0 +1,118 @@
+"""Servidor HTTP local que imita la API de mensajes de Twilio.
+
+Uso:
+    python benchmarks/twilio_falso.py --puerto 9100 --latencia 0.05 --limite 80
+
+Con --limite, cada número remitente puede crear a lo sumo ese número de
+mensajes por segundo; el exceso recibe 429 (código 20429) como en Twilio.
+
+Y en el bot:
+    TWILIO_ACCOUNT_SID=ACfalso TWILIO_AUTH_TOKEN=x TWILIO_API_URL=http://127.0.0.1:9100
+
+`GET /mensajes` devuelve los mensajes recibidos y `DELETE /mensajes` los borra.
+"""
+import argparse
+import json
+from collections import defaultdict
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class ManejadorTwilio(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def _responder(self, estado, cuerpo):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_POST(self):
+        largo = int(self.headers.get("Content-Length", 0))
+        campos = {k: v[0] for k, v in parse_qs(self.rfile.read(largo).decode()).items()}
+        servidor = self.server
+        if servidor.latencia:
+            time.sleep(servidor.latencia)
+        if servidor.limite and not self._admitir(campos.get("From")):
+            return self._responder(429, {"code": 20429, "message": "Too Many Requests", "status": 429})
+        with servidor.lock:
+            servidor.contador += 1
+            sid = f"SM{servidor.contador:032d}"
+            servidor.mensajes.append({
+                "sid": sid,
+                "from": campos.get("From"),
+                "to": campos.get("To"),
+                "body": campos.get("Body"),
+                "t": time.time(),
+            })
+            servidor.cuerpos[campos.get("To")].append(campos.get("Body"))
+        self._responder(201, {"sid": sid, "status": "queued", "to": campos.get("To")})
+
+    def _admitir(self, remitente):
+        # Cubeta de tokens por remitente, con ráfaga de un segundo
+        servidor = self.server
+        with servidor.lock:
+            ahora = time.monotonic()
+            tokens, ultimo = servidor.cubetas.get(remitente, (servidor.limite, ahora))
+            tokens = min(servidor.limite, tokens + (ahora - ultimo) * servidor.limite)
+            if tokens < 1:
+                servidor.cubetas[remitente] = (tokens, ahora)
+                servidor.rechazados += 1
+                return False
+            servidor.cubetas[remitente] = (tokens - 1, ahora)
+            return True
+
+    def do_GET(self):
+        if self.path != "/mensajes":
+            return self._responder(404, {"error": "no encontrado"})
+        with self.server.lock:
+            self._responder(200, list(self.server.mensajes))
+
+    def do_DELETE(self):
+        with self.server.lock:
+            self.server.mensajes.clear()
+            self.server.cuerpos.clear()
+        self._responder(200, {"ok": True})
+
+    def log_message(self, formato, *args):
+        pass
+
+
+def crear_servidor(host="127.0.0.1", puerto=0, latencia=0.0, limite=0.0):
+    """Crea el servidor (sin arrancarlo). Con puerto 0 el sistema elige uno libre."""
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorTwilio)
+    servidor.daemon_threads = True
+    servidor.latencia = latencia
+    servidor.limite = limite  # mensajes por segundo por remitente; 0 = sin límite
+    servidor.lock = threading.Lock()
+    servidor.mensajes = []
+    servidor.cuerpos = defaultdict(list)  # destino -> cuerpos recibidos en orden
+    servidor.cubetas = {}
+    servidor.rechazados = 0
+    servidor.contador = 0
+    return servidor
+
+
+def iniciar_en_hilo(host="127.0.0.1", puerto=0, latencia=0.0, limite=0.0):
+    """Arranca el servidor en un hilo y devuelve (servidor, url_base)."""
+    servidor = crear_servidor(host, puerto, latencia, limite)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, puerto = servidor.server_address[:2]
+    return servidor, f"http://{host}:{puerto}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor falso de Twilio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=9100)
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos por mensaje")
+    parser.add_argument("--limite", type=float, default=0.0, help="mensajes por segundo por remitente")
+    args = parser.parse_args()
+
+    servidor = crear_servidor(args.host, args.puerto, args.latencia, args.limite)
+    print(f"📡 Twilio falso escuchando en http://{args.host}:{args.puerto}")
+    servidor.serve_forever()
@@ -0,0 +1,92 @@
+"""Serialización por usuario de los mensajes entrantes.
+
+Twilio reintenta webhooks y algunas personas escriben muy rápido, así que
+pueden llegar varios mensajes del mismo `From` a la vez. Cada usuario
+tiene su propio asyncio.Lock (FIFO): sus mensajes se procesan de uno en
+uno y en orden de llegada, mientras que los de usuarios distintos siguen
+en paralelo. El lock se borra cuando nadie lo usa, así que la memoria
+depende de los usuarios activos, no de los históricos.
+
+MonitorEventLoop mide cuánto se atrasa el event loop (un sleep corto que
+despierta tarde indica que algo lo está bloqueando) y cuántas tareas vivas hay.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class CerrojosPorUsuario:
+
+    def __init__(self):
+        self._cerrojos = {}  # clave -> [lock, usos]
+        self.esperas = 0  # mensajes que tuvieron que esperar a otro del mismo usuario
+
+    @asynccontextmanager
+    async def de(self, clave):
+        entrada = self._cerrojos.get(clave)
+        if entrada is None:
+            entrada = self._cerrojos[clave] = [asyncio.Lock(), 0]
+        entrada[1] += 1
+        try:
+            if entrada[0].locked():
+                self.esperas += 1
+            async with entrada[0]:
+                yield
+        finally:
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                del self._cerrojos[clave]
+
+    def __len__(self):
+        return len(self._cerrojos)
+
+    def estadisticas(self):
+        return {"usuarios_con_lock": len(self._cerrojos), "esperas": self.esperas}
+
+
+class MonitorEventLoop:
+
+    def __init__(self, intervalo=0.1, histograma=None):
+        self.intervalo = intervalo
+        self.histograma = histograma  # metricas.Histograma opcional para cada muestra
+        self._tarea = None
+        self.retraso = 0.0
+        self.retraso_max = 0.0
+        self.retraso_total = 0.0
+        self.muestras = 0
+        self.tareas = 0
+        self.tareas_max = 0
+
+    async def iniciar(self):
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._bucle(), name="monitor_event_loop")
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+
+    async def _bucle(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            inicio = loop.time()
+            await asyncio.sleep(self.intervalo)
+            retraso = max(0.0, loop.time() - inicio - self.intervalo)
+            self.retraso = retraso
+            self.retraso_max = max(self.retraso_max, retraso)
+            self.retraso_total += retraso
+            self.muestras += 1
+            if self.histograma is not None:
+                self.histograma.observar(retraso)
+            # Se cuenta aquí, dentro del loop: /test corre en otro hilo
+            self.tareas = len(asyncio.all_tasks(loop))
+            self.tareas_max = max(self.tareas_max, self.tareas)
+
+    def estadisticas(self):
+        return {
+            "retraso_ms": round(self.retraso * 1000, 2),
+            "retraso_max_ms": round(self.retraso_max * 1000, 2),
+            "retraso_promedio_ms": round(self.retraso_total * 1000 / self.muestras, 2) if self.muestras else 0.0,
+            "tareas": self.tareas,
+            "tareas_max": self.tareas_max,
+        }
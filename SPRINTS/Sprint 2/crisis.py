@@ -0,0 +1,137 @@
+"""Detector de frases de crisis en cualquier parte del texto entrante.
+
+La intención URGENTE solo reconoce mensajes que son enteros una palabra de
+urgencia ("ayuda", "auxilio"). Este detector busca las frases de
+`palabras_crisis` de menu.json ("no puedo más", "quiero morir*"...) dentro
+de cualquier mensaje, incluidas las respuestas libres de los ejercicios y
+el feedback, para cortar el ejercicio y mostrar la ayuda urgente.
+
+Se construye una vez por cada carga de menu.json (suscriptor de
+AlmacenContenido): un autómata de Aho-Corasick sobre las frases
+normalizadas igual que las intenciones (sin tildes, en minúsculas, signos
+como espacios, letras repetidas colapsadas), convertido en una tabla de
+transiciones completa. Buscar es normalizar el texto (operaciones en C) y
+recorrerlo una sola vez, un índice de lista por byte, sin importar
+cuántas frases haya. Las letras repetidas del texto ("no puedo maaas")
+no se colapsan antes (costaría más que recorrerlo): cada estado vuelve a
+sí mismo con la última letra que leyó.
+
+Las frases calzan con palabras enteras ("matarme" no calza en
+"rematarme"); un `*` al final calza con cualquier terminación ("suicid*"
+calza en "suicidio" y "suicidarme"). Los estados de las frases halladas
+son absorbentes: el recorrido no necesita preguntar en cada byte si ya
+encontró algo.
+"""
+from collections import deque
+
+from intenciones import normalizar, normalizar_base
+
+# Sin palabras_crisis en menu.json
+FRASES = ("necesito ayuda", "auxilio", "emergencia")
+
+# Símbolos del texto normalizado: espacio, a-z y 0-9 (normalizar_base no deja otros)
+SIMBOLOS = " abcdefghijklmnopqrstuvwxyz0123456789"
+ANCHO = len(SIMBOLOS)
+TABLA_SIMBOLOS = bytes(SIMBOLOS.find(chr(c)) if chr(c) in SIMBOLOS else 0 for c in range(256))
+
+
+def patron(frase):
+    """La frase como se busca: normalizada, con espacios de límite de palabra ("" si no queda nada)."""
+    prefijo = frase.rstrip().endswith("*")
+    normal = normalizar(frase.replace("*", " "))
+    if not normal:
+        return ""
+    return " " + normal + ("" if prefijo else " ")
+
+
+class DetectorCrisis:
+
+    def __init__(self):
+        self._transiciones = [0] * ANCHO  # estado * ANCHO + símbolo -> estado siguiente * ANCHO
+        self._halladas = {}  # estado * ANCHO -> frase original
+        self.frases = 0
+        # Métricas
+        self.revisados = 0
+        self.detectados = 0
+
+    def construir(self, contenido):
+        self.preparar(contenido)()
+
+    def preparar(self, contenido):
+        """Suscriptor de AlmacenContenido: arma el autómata con las frases del menú nuevo y devuelve cómo publicarlo."""
+        hijos = [{}]  # trie: estado -> {símbolo: estado}
+        salida = [None]  # estado -> frase que termina ahí
+        ultimo = [None]  # estado -> símbolo con el que se llega
+        frases = 0
+        for frase in contenido.menu.get("palabras_crisis", FRASES):
+            texto = patron(frase)
+            if not texto:
+                continue
+            frases += 1
+            estado = 0
+            for simbolo in texto.encode("ascii").translate(TABLA_SIMBOLOS):
+                siguiente = hijos[estado].get(simbolo)
+                if siguiente is None:
+                    siguiente = hijos[estado][simbolo] = len(hijos)
+                    hijos.append({})
+                    salida.append(None)
+                    ultimo.append(simbolo)
+                estado = siguiente
+            if salida[estado] is None:
+                salida[estado] = frase
+
+        # Enlaces de fallo por niveles, resueltos directamente en la tabla completa
+        transiciones = [[0] * ANCHO for _ in hijos]
+        for simbolo, hijo in hijos[0].items():
+            transiciones[0][simbolo] = hijo
+        pendientes = deque((hijo, 0) for hijo in hijos[0].values())
+        while pendientes:
+            estado, fallo = pendientes.popleft()
+            if salida[estado] is None:
+                salida[estado] = salida[fallo]  # una frase más corta termina en el mismo lugar
+            fila = transiciones[estado] = list(transiciones[fallo])
+            for simbolo, hijo in hijos[estado].items():
+                fila[simbolo] = hijo
+                pendientes.append((hijo, transiciones[fallo][simbolo]))
+
+        # Recién ahora los estados con frase se vuelven absorbentes (antes servían de fallo)
+        # y los demás ignoran la repetición de su última letra, como colapsar()
+        plana = []
+        for estado, fila in enumerate(transiciones):
+            if salida[estado] is not None:
+                fila = [estado] * ANCHO
+            elif estado:
+                fila[ultimo[estado]] = estado
+            plana.extend(destino * ANCHO for destino in fila)
+
+        halladas = {estado * ANCHO: frase for estado, frase in enumerate(salida) if frase is not None}
+
+        def publicar():
+            self._halladas = halladas
+            self._transiciones = plana
+            self.frases = frases
+        return publicar
+
+    def buscar(self, texto):
+        """La frase de crisis (como está en menu.json) que aparece en el texto, o None."""
+        self.revisados += 1
+        datos = normalizar_base(texto)
+        if not datos:
+            return None
+        transiciones = self._transiciones
+        estado = 0
+        # Espacio (símbolo 0) antes y después: las frases empiezan y terminan en límite de palabra
+        for simbolo in b"\x00" + datos.encode("ascii").translate(TABLA_SIMBOLOS) + b"\x00":
+            estado = transiciones[estado + simbolo]
+        frase = self._halladas.get(estado)
+        if frase is not None:
+            self.detectados += 1
+        return frase
+
+    def estadisticas(self):
+        return {
+            "frases": self.frases,
+            "estados": len(self._transiciones) // ANCHO,
+            "revisados": self.revisados,
+            "detectados": self.detectados,
+        }
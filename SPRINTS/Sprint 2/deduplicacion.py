@@ -0,0 +1,115 @@
+"""Caché de respuestas por MessageSid para webhooks reentregados.
+
+Twilio reintenta el webhook si no respondemos a tiempo. Sin esto, un "1"
+reentregado arranca un segundo ejercicio y duplica todos los envíos. La
+primera vez que vemos un MessageSid guardamos el TwiML que respondimos;
+los reintentos dentro de la ventana reciben esa misma respuesta sin volver
+a procesar nada.
+
+La caché local es un LRU acotado con expiración. Opcionalmente se consulta
+también un Redis compartido para cubrir reintentos que caen en otro worker.
+Si ese Redis no responde, el mensaje se trata como nuevo (solo con la
+caché local) y se avisa una vez por caída, no en cada webhook.
+"""
+import time
+from collections import OrderedDict
+
+from registro import obtener_registro
+from sesiones import ClienteRESP, ErrorRedis
+
+registro = obtener_registro("deduplicacion")
+
+
+class RespaldoRedis:
+    """Respaldo compartido: una clave por MessageSid con expiración nativa."""
+
+    def __init__(self, url, prefijo="aiuda:sid:"):
+        self.cliente = ClienteRESP(url)
+        self.prefijo = prefijo
+
+    def obtener(self, message_sid):
+        return self.cliente.comando("GET", self.prefijo + message_sid)
+
+    def guardar(self, message_sid, respuesta, ventana):
+        self.cliente.comando("SET", self.prefijo + message_sid, respuesta, "EX", int(ventana))
+
+
+class CacheDeduplicacion:
+
+    def __init__(self, max_entradas=50_000, ventana=600, respaldo=None):
+        self.max_entradas = max_entradas
+        self.ventana = ventana
+        self.respaldo = respaldo
+        self._datos = OrderedDict()  # message_sid -> (respuesta, expira)
+        self.aciertos = 0
+        self.aciertos_respaldo = 0
+        self.fallos = 0
+        self.errores_respaldo = 0
+        self._respaldo_caido = False
+
+    def obtener(self, message_sid):
+        """Devuelve la respuesta guardada para este MessageSid, o None si es nuevo."""
+        if not message_sid:
+            return None
+        entrada = self._datos.get(message_sid)
+        if entrada is not None:
+            if entrada[1] >= time.monotonic():
+                self.aciertos += 1
+                return entrada[0]
+            del self._datos[message_sid]
+
+        if self.respaldo is not None:
+            try:
+                respuesta = self.respaldo.obtener(message_sid)
+                self._respaldo_disponible()
+            except ErrorRedis as e:
+                self._error_respaldo(e)
+                respuesta = None
+            if respuesta is not None:
+                self.aciertos_respaldo += 1
+                self._guardar_local(message_sid, respuesta)
+                return respuesta
+
+        self.fallos += 1
+        return None
+
+    def guardar(self, message_sid, respuesta):
+        if not message_sid:
+            return
+        self._guardar_local(message_sid, respuesta)
+        if self.respaldo is not None:
+            try:
+                self.respaldo.guardar(message_sid, respuesta, self.ventana)
+                self._respaldo_disponible()
+            except ErrorRedis as e:
+                self._error_respaldo(e)
+
+    def _error_respaldo(self, error):
+        self.errores_respaldo += 1
+        if not self._respaldo_caido:
+            self._respaldo_caido = True
+            registro.warning("respaldo_no_disponible", error=str(error))
+
+    def _respaldo_disponible(self):
+        if self._respaldo_caido:
+            self._respaldo_caido = False
+            registro.info("respaldo_recuperado", errores=self.errores_respaldo)
+
+    def _guardar_local(self, message_sid, respuesta):
+        ahora = time.monotonic()
+        self._datos[message_sid] = (respuesta, ahora + self.ventana)
+        self._datos.move_to_end(message_sid)
+        while self._datos:
+            primera, (_, expira) = next(iter(self._datos.items()))
+            if expira >= ahora and len(self._datos) <= self.max_entradas:
+                break
+            del self._datos[primera]
+
+    def estadisticas(self):
+        return {
+            "entradas": len(self._datos),
+            "aciertos": self.aciertos,
+            "aciertos_respaldo": self.aciertos_respaldo,
+            "fallos": self.fallos,
+            "errores_respaldo": self.errores_respaldo,
+        }
@@ -0,0 +1,355 @@
+"""Diario de sesiones y pasos programados para sobrevivir a reinicios.
+
+Sin esto, un deploy o una caída pierde todas las sesiones en memoria y
+todos los ejercicios en curso: el usuario se queda a mitad de la
+respiración sin que nadie le avise. Cada cambio se anota en un archivo de
+solo agregado. Registros:
+
+- ["s", usuario, sesion, t]: la sesión quedó así (null si se eliminó);
+  `t` es el time.time() de la escritura, para aplicar el TTL al cargar.
+- ["p", usuario, ref, paso, vence_ms]: el próximo paso del guion `ref`
+  vence en `vence_ms` (time.time() en milisegundos).
+- ["f", usuario]: el usuario ya no tiene pasos programados.
+
+Cada registro es el estado completo de su clave (la sesión o el paso
+programado del usuario), no un delta. Por eso, entre dos volcados, solo
+hace falta escribir el último registro de cada clave (elegir un ejercicio
+cambia la sesión dos veces y se escribe una), el orden entre claves
+distintas no importa y la compactación puede correr mientras se siguen
+anotando cambios.
+
+Anotar son un par de asignaciones en dicts desde el hilo del event loop,
+sin locks. Una tarea vuelca lo pendiente cada `intervalo` segundos en un
+hilo aparte con un write y un fsync, así que una caída pierde a lo sumo ese
+intervalo. Cada línea es una lista JSON de hasta REGISTROS_POR_LINEA
+registros serializada con un solo json.dumps (mucho más barato que uno por
+registro, y en trozos para no retener el GIL con un lote grande). Una línea
+cortada al final se descarta entera. Cuando el archivo tiene muchos más
+registros que claves vivas, se reescribe con una foto del estado (archivo
+temporal + fsync + os.replace). El archivo contiene números de teléfono y
+respuestas de los usuarios, igual que sesiones.db.
+
+Con varios workers (lanzador.py) cada uno tiene su diario con los usuarios
+de su partición: diario.0de4.jsonl ... diario.3de4.jsonl. Si cambia la
+cantidad de workers, `repartir` redistribuye los registros en el maestro
+antes de crearlos.
+"""
+import asyncio
+import glob
+import json
+import os
+import re
+import time
+
+from registro import obtener_registro
+
+registro = obtener_registro("diario")
+
+SEPARADORES = (",", ":")
+REGISTROS_POR_LINEA = 1000
+
+
+def _serializar(registros):
+    lineas = [
+        json.dumps(registros[i:i + REGISTROS_POR_LINEA], separators=SEPARADORES, ensure_ascii=False)
+        for i in range(0, len(registros), REGISTROS_POR_LINEA)
+    ]
+    lineas.append("")
+    return "\n".join(lineas).encode("utf-8")
+
+
+def ruta_particion(ruta, indice, workers):
+    """diario.jsonl -> diario.2de4.jsonl; con un solo worker la ruta no cambia."""
+    if workers == 1:
+        return ruta
+    base, extension = os.path.splitext(ruta)
+    return f"{base}.{indice}de{workers}{extension}"
+
+
+def repartir(ruta, workers, particion, ttl=86400):
+    """Redistribuye los diarios de otra cantidad de workers entre `workers` archivos.
+
+    `particion(usuario, workers)` es el worker dueño de cada usuario. Primero
+    se escriben los archivos nuevos y después se borran los viejos: si se
+    corta en el medio, la próxima vez se vuelve a repartir lo mismo.
+    Devuelve cuántos archivos viejos se repartieron.
+    """
+    base, extension = os.path.splitext(ruta)
+    nuevas = [ruta_particion(ruta, i, workers) for i in range(workers)]
+    patron = re.compile(re.escape(base) + r"\.\d+de\d+" + re.escape(extension))
+    existentes = [r for r in glob.glob(glob.escape(base) + ".*de*" + extension) if patron.fullmatch(r)]
+    if os.path.exists(ruta):
+        existentes.append(ruta)
+    viejas = [r for r in existentes if r not in nuevas]
+    if not viejas:
+        return 0
+
+    sesiones = {}
+    pasos = {}
+    # Las nuevas al final: si quedaron de un reparto cortado, son las más recientes
+    for origen in viejas + [r for r in nuevas if r in existentes]:
+        diario = Diario(origen, ttl=ttl)
+        diario.cargar()
+        diario._archivo.close()
+        sesiones.update(diario._sesiones)
+        pasos.update(diario._pasos)
+    for indice, destino in enumerate(nuevas):
+        diario = Diario(destino, ttl=ttl)
+        diario._archivo = open(destino, "ab")
+        try:
+            diario._reescribir(
+                [r for u, r in sesiones.items() if particion(u, workers) == indice]
+                + [r for u, r in pasos.items() if particion(u, workers) == indice])
+        finally:
+            diario._archivo.close()
+    for origen in viejas:
+        os.remove(origen)
+    registro.info("diario_repartido", archivos=len(viejas), workers=workers,
+                  sesiones=len(sesiones), pasos=len(pasos))
+    return len(viejas)
+
+
+class Diario:
+
+    def __init__(self, ruta, intervalo=0.05, compactar_desde=100_000, ttl=86400, histograma_fsync=None):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.compactar_desde = compactar_desde
+        self.ttl = ttl
+        self.histograma_fsync = histograma_fsync
+        # usuario -> último registro: el estado vigente y lo que aún no se escribió.
+        # Las mismas tuplas en ambos lados: anotar no asigna más de lo necesario
+        # (cada objeto nuevo acerca la próxima pasada completa del GC).
+        self._sesiones = {}
+        self._pasos = {}
+        self._sesiones_pendientes = {}
+        self._pasos_pendientes = {}
+        self._en_archivo = 0  # registros en el archivo actual
+        self._archivo = None
+        self._escribiendo = asyncio.Lock()  # un volcado o una compactación a la vez
+        self._cerrando = None
+        self._tarea = None
+
+        # Métricas
+        self.escritos = 0
+        self.lotes = 0
+        self.max_lote = 0
+        self.bytes = 0
+        self.fsync_max = 0.0
+        self.compactaciones = 0
+        self.errores = 0
+        self.lineas_corruptas = 0
+        self.segundos_carga = 0.0
+
+    # Anotar (hot path: un par de asignaciones en dicts, nada de E/S)
+
+    def registrar_sesion(self, usuario, sesion):
+        """`sesion` es Sesion.a_tupla(), o None si la sesión se eliminó."""
+        anotado = self._sesiones_pendientes[usuario] = ("s", usuario, sesion, int(time.time()))
+        if sesion is None:
+            self._sesiones.pop(usuario, None)
+        else:
+            self._sesiones[usuario] = anotado
+
+    def registrar_paso(self, usuario, ref, paso, vence):
+        """El paso `paso` del guion `ref` vence en `vence` (time.time())."""
+        self._pasos[usuario] = self._pasos_pendientes[usuario] = ("p", usuario, ref, paso, int(vence * 1000))
+
+    def registrar_fin(self, usuario):
+        if self._pasos.pop(usuario, None) is not None:
+            self._pasos_pendientes[usuario] = ("f", usuario)
+
+    # Cargar al arrancar
+
+    def cargar(self):
+        """Lee el diario y deja el archivo listo para seguir agregando.
+
+        Devuelve (sesiones, pasos): {usuario: tupla de la sesión} con las que
+        no expiraron y {usuario: (ref, paso, vence)} con los pasos que
+        quedaron programados (`vence` en time.time()).
+        """
+        inicio = time.perf_counter()
+        registros = []
+        if os.path.exists(self.ruta):
+            with open(self.ruta, "rb") as f:
+                datos = f.read()
+            # Una caída a mitad de un write deja una línea incompleta al final: se descarta
+            fin = datos.rfind(b"\n") + 1
+            if fin < len(datos):
+                self.lineas_corruptas += 1
+                with open(self.ruta, "r+b") as f:
+                    f.truncate(fin)
+            registros = self._leer(datos[:fin].decode("utf-8", "replace"))
+
+        sesiones = {}
+        pasos = {}
+        for linea in registros:
+            for r in linea:
+                tipo = r[0]
+                if tipo == "s":
+                    if r[2] is None:
+                        sesiones.pop(r[1], None)
+                    else:
+                        sesiones[r[1]] = r
+                elif tipo == "p":
+                    pasos[r[1]] = r
+                elif tipo == "f":
+                    pasos.pop(r[1], None)
+
+        limite = time.time() - self.ttl
+        self._sesiones = {u: r for u, r in sesiones.items() if r[3] >= limite}
+        self._pasos = pasos
+        self._en_archivo = sum(map(len, registros))
+        self._archivo = open(self.ruta, "ab")
+        self.segundos_carga = time.perf_counter() - inicio
+        return ({u: r[2] for u, r in self._sesiones.items()},
+                {u: (r[2], r[3], r[4] / 1000) for u, r in pasos.items()})
+
+    def _leer(self, texto):
+        """Lista de líneas, cada una con su lista de registros."""
+        if not texto:
+            return []
+        try:
+            # Un solo json.loads para todo el archivo: un string JSON nunca lleva "\n" literal
+            return json.loads("[" + texto[:-1].replace("\n", ",") + "]")
+        except ValueError:
+            pass
+        lotes = []
+        for linea in texto.splitlines():
+            try:
+                lotes.append(json.loads(linea))
+            except ValueError:
+                self.lineas_corruptas += 1
+        return lotes
+
+    # Volcar a disco
+
+    async def iniciar(self):
+        if self._archivo is None:
+            self.cargar()
+        if self._tarea is None:
+            self._cerrando = asyncio.Event()
+            self._tarea = asyncio.create_task(self._bucle(), name="diario")
+
+    async def detener(self):
+        """Vuelca lo pendiente y cierra el archivo."""
+        if self._tarea is not None:
+            # Sin cancelar: un write a medias en el hilo seguiría corriendo
+            self._cerrando.set()
+            await self._tarea
+            self._tarea = None
+        await self.volcar()
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+
+    async def _bucle(self):
+        while not self._cerrando.is_set():
+            try:
+                await asyncio.wait_for(self._cerrando.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            await self.volcar()
+            vivos = len(self._sesiones) + len(self._pasos)
+            if self._en_archivo > self.compactar_desde and self._en_archivo > 2 * vivos:
+                await self.compactar()
+
+    async def volcar(self):
+        """Escribe los registros pendientes con un write y un fsync."""
+        async with self._escribiendo:
+            await self._volcar()
+
+    async def _volcar(self):
+        if not (self._sesiones_pendientes or self._pasos_pendientes) or self._archivo is None:
+            return
+        sesiones, self._sesiones_pendientes = self._sesiones_pendientes, {}
+        pasos, self._pasos_pendientes = self._pasos_pendientes, {}
+        lote = list(sesiones.values()) + list(pasos.values())
+        try:
+            duracion, escritos = await asyncio.to_thread(self._escribir, lote)
+        except OSError as e:
+            # Disco lleno o similar: se reintenta en el próximo ciclo (lo anotado después manda)
+            sesiones.update(self._sesiones_pendientes)
+            pasos.update(self._pasos_pendientes)
+            self._sesiones_pendientes, self._pasos_pendientes = sesiones, pasos
+            self.errores += 1
+            registro.error("diario_no_escrito", registros=len(lote), error=str(e))
+            return
+        self._en_archivo += len(lote)
+        self.escritos += len(lote)
+        self.lotes += 1
+        self.max_lote = max(self.max_lote, len(lote))
+        self.bytes += escritos
+        self.fsync_max = max(self.fsync_max, duracion)
+        if self.histograma_fsync is not None:
+            self.histograma_fsync.observar(duracion)
+
+    def _escribir(self, lote):
+        datos = _serializar(lote)
+        inicio = time.perf_counter()
+        self._archivo.write(datos)
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+        return time.perf_counter() - inicio, len(datos)
+
+    async def compactar(self):
+        """Reescribe el archivo con solo el estado vigente."""
+        async with self._escribiendo:
+            if self._archivo is None:
+                return
+            # Foto tomada en el loop; lo que se anote mientras tanto va al archivo nuevo
+            foto = list(self._sesiones.values()) + list(self._pasos.values())
+            await self._volcar()
+            try:
+                await asyncio.to_thread(self._reescribir, foto)
+            except OSError as e:
+                self.errores += 1
+                registro.error("diario_no_compactado", error=str(e))
+                return
+            registro.info("diario_compactado", antes=self._en_archivo, despues=len(foto))
+            self._en_archivo = len(foto)
+            self.compactaciones += 1
+
+    def _reescribir(self, foto):
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "wb") as f:
+            f.write(_serializar(foto))
+            f.flush()
+            os.fsync(f.fileno())
+        # En Windows no se puede reemplazar un archivo abierto
+        self._archivo.close()
+        try:
+            os.replace(temporal, self.ruta)
+            self._sincronizar_directorio()
+        finally:
+            self._archivo = open(self.ruta, "ab")
+
+    def _sincronizar_directorio(self):
+        # Que el rename también sobreviva a una caída (no se puede en Windows)
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.ruta)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def estadisticas(self):
+        return {
+            "sesiones": len(self._sesiones),
+            "pasos_programados": len(self._pasos),
+            "pendientes": len(self._sesiones_pendientes) + len(self._pasos_pendientes),
+            "registros_en_archivo": self._en_archivo,
+            "registros_escritos": self.escritos,
+            "lotes": self.lotes,
+            "max_lote": self.max_lote,
+            "bytes_escritos": self.bytes,
+            "fsync_max_ms": round(self.fsync_max * 1000, 2),
+            "compactaciones": self.compactaciones,
+            "errores": self.errores,
+            "lineas_corruptas": self.lineas_corruptas,
+            "segundos_carga": round(self.segundos_carga, 3),
+        }
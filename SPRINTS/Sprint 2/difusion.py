@@ -0,0 +1,615 @@
+"""Difusiones: mensajes proactivos a cohortes de miles de usuarios.
+
+Un check-in diario ("¿Cómo te sientes hoy?") o un ejercicio de respiración
+para toda una cohorte. Cada difusión tiene un contenido (un texto con
+variables $nombre, o un ejercicio de ejercicios.json) y una lista de
+destinatarios que se fija al crearla: números explícitos o las sesiones
+que cumplen un filtro. Todo queda en SQLite (DIFUSION_SQLITE):
+
+- difusiones: definición, estado (en_curso, pausada, terminada) y
+  contadores de progreso.
+- destinatarios: una fila por número con su resultado (pendiente,
+  enviado, fallido u omitido) y el sid de Twilio o el motivo.
+
+Un Difusor corre cada difusión en una tarea: toma lotes de pendientes,
+los encola en el PipelineEnvios a `tasa` mensajes por segundo (por debajo
+del límite del remitente, para que las respuestas del webhook no esperen
+detrás de la difusión), espera los resultados y los anota en una sola
+transacción por lote. Al detenerse termina el lote en curso y lo anota,
+así que reanudar no repite mensajes; tras una caída se puede repetir a lo
+sumo el último lote.
+
+Con varios workers sobre la misma base, cada difusión la corre un solo
+worker: la reclama con un arriendo (`dueno` + `vence`) que renueva en cada
+lote. Si ese worker muere, otro la retoma cuando vence el arriendo. Con
+el lanzador, cada destinatario lo prepara y lo encola el worker dueño de
+ese número (reparto.py); el que corre la difusión solo espera el resultado.
+
+También es la CLI para administrarlas contra un bot en marcha:
+
+    python difusion.py crear --mensaje "Hola $nombre, ¿cómo te sientes hoy?" --numeros cohorte.csv
+    python difusion.py crear --ejercicio respiracion --filtro estado=menu
+    python difusion.py estado [ID] | pausar ID | reanudar ID | resultados ID --estado fallido
+
+(--url y --token, o BOT_URL y ADMIN_TOKEN en el entorno.)
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from string import Template
+
+from limites import CubetaTokens
+from registro import obtener_registro
+
+registro = obtener_registro("difusion")
+
+NUMERO = re.compile(r"whatsapp:\+\d{6,15}")
+RESULTADOS = ("enviado", "fallido", "omitido")
+
+
+class Omitido(Exception):
+    """El destinatario se omite; el motivo va en el mensaje."""
+
+
+class ErrorDifusion(Exception):
+    """La definición de la difusión o su cohorte no son válidas."""
+
+
+def normalizar_numero(numero):
+    numero = str(numero).strip().replace(" ", "")
+    if numero.startswith("+"):
+        numero = "whatsapp:" + numero
+    if not NUMERO.fullmatch(numero):
+        raise ErrorDifusion(f"número inválido: {numero!r}")
+    return numero
+
+
+def normalizar_destinatarios(destinatarios, maximo):
+    """[(numero, variables)] sin repetidos, desde números sueltos o dicts {"numero": ..., otras variables}."""
+    vistos = {}
+    for destinatario in destinatarios:
+        if isinstance(destinatario, dict):
+            variables = dict(destinatario)
+            numero = normalizar_numero(variables.pop("numero", ""))
+        else:
+            numero, variables = normalizar_numero(destinatario), {}
+        vistos.setdefault(numero, variables)
+    if not vistos:
+        raise ErrorDifusion("la cohorte está vacía")
+    if len(vistos) > maximo:
+        raise ErrorDifusion(f"la cohorte tiene {len(vistos)} destinatarios (máximo {maximo})")
+    return list(vistos.items())
+
+
+def filtrar_sesiones(usuarios, filtro):
+    """Números de las sesiones que cumplen el filtro {"estado": ..., "ejercicio": ...} (valor o lista)."""
+    condiciones = []
+    for campo, atributo in (("estado", "estado"), ("ejercicio", "ejercicio_actual")):
+        valor = filtro.get(campo)
+        if valor is not None:
+            condiciones.append((atributo, set(valor) if isinstance(valor, list) else {valor}))
+    desconocidos = set(filtro) - {"estado", "ejercicio"}
+    if desconocidos:
+        raise ErrorDifusion(f"filtro desconocido: {', '.join(sorted(desconocidos))}")
+    return [
+        user_id for user_id, sesion in usuarios
+        if all(getattr(sesion, atributo) in valores for atributo, valores in condiciones)
+    ]
+
+
+def definir(datos, max_caracteres=1600):
+    """Valida el contenido de una difusión. Devuelve el dict que se guarda."""
+    mensaje = datos.get("mensaje")
+    ejercicio = datos.get("ejercicio")
+    if bool(mensaje) == bool(ejercicio):
+        raise ErrorDifusion("la difusión lleva 'mensaje' o 'ejercicio' (uno de los dos)")
+    if mensaje and len(mensaje) > max_caracteres:
+        raise ErrorDifusion(f"el mensaje supera los {max_caracteres} caracteres")
+    return {
+        "mensaje": mensaje,
+        "ejercicio": ejercicio,
+        # Dejar la sesión esperando la respuesta (un check-in); si no, la respuesta va al menú
+        "esperar_respuesta": bool(datos.get("esperar_respuesta", False)),
+        # No interrumpir a quien está en medio de un ejercicio
+        "omitir_ocupados": bool(datos.get("omitir_ocupados", True)),
+    }
+
+
+def redactar(definicion, numero, variables):
+    """Texto del mensaje para un destinatario ($numero y las variables de la cohorte)."""
+    return Template(definicion["mensaje"]).safe_substitute(variables, numero=numero)
+
+
+class BaseDifusiones:
+    """Difusiones y resultados por destinatario en SQLite (modo WAL), compartible entre workers.
+
+    Es bloqueante: el Difusor la usa desde asyncio.to_thread.
+    """
+
+    def __init__(self, ruta="difusiones.db"):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._conexion = None
+        self._pid = None
+
+    def _conectar(self):
+        # Una conexión por proceso: no se comparte a través de fork()
+        if self._conexion is None or self._pid != os.getpid():
+            import sqlite3
+            conexion = sqlite3.connect(self.ruta, timeout=5, check_same_thread=False, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.executescript(
+                "CREATE TABLE IF NOT EXISTS difusiones ("
+                " id TEXT PRIMARY KEY, creada REAL NOT NULL, definicion TEXT NOT NULL, tasa REAL NOT NULL,"
+                " estado TEXT NOT NULL, total INTEGER NOT NULL, enviados INTEGER NOT NULL DEFAULT 0,"
+                " fallidos INTEGER NOT NULL DEFAULT 0, omitidos INTEGER NOT NULL DEFAULT 0,"
+                " dueno TEXT, vence REAL NOT NULL DEFAULT 0, actualizada REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS destinatarios ("
+                " difusion TEXT NOT NULL, orden INTEGER NOT NULL, numero TEXT NOT NULL, variables TEXT,"
+                " estado TEXT NOT NULL DEFAULT 'pendiente', detalle TEXT, t REAL,"
+                " PRIMARY KEY (difusion, numero));"
+                "CREATE INDEX IF NOT EXISTS destinatarios_por_estado ON destinatarios (difusion, estado, orden);"
+            )
+            self._conexion = conexion
+            self._pid = os.getpid()
+        return self._conexion
+
+    def crear(self, id_difusion, definicion, destinatarios, tasa, dueno, arriendo):
+        """Crea la difusión ya reclamada por `dueno`. Si el id ya existe no hace nada y devuelve False."""
+        ahora = time.time()
+        with self._lock:
+            conexion = self._conectar()
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conexion.execute(
+                    "INSERT OR IGNORE INTO difusiones (id, creada, definicion, tasa, estado, total, dueno, vence, actualizada)"
+                    " VALUES (?, ?, ?, ?, 'en_curso', ?, ?, ?, ?)",
+                    (id_difusion, ahora, json.dumps(definicion, ensure_ascii=False), tasa,
+                     len(destinatarios), dueno, ahora + arriendo, ahora),
+                )
+                if cursor.rowcount:
+                    conexion.executemany(
+                        "INSERT INTO destinatarios (difusion, orden, numero, variables) VALUES (?, ?, ?, ?)",
+                        ((id_difusion, orden, numero, json.dumps(variables, ensure_ascii=False) if variables else None)
+                         for orden, (numero, variables) in enumerate(destinatarios)),
+                    )
+                conexion.execute("COMMIT")
+            except BaseException:
+                conexion.execute("ROLLBACK")
+                raise
+        return bool(cursor.rowcount)
+
+    def reclamar(self, id_difusion, dueno, arriendo):
+        """Toma la difusión si está en curso y nadie la tiene (o su arriendo venció)."""
+        ahora = time.time()
+        with self._lock:
+            return self._conectar().execute(
+                "UPDATE difusiones SET dueno = ?, vence = ? WHERE id = ? AND estado = 'en_curso'"
+                " AND (dueno = ? OR dueno IS NULL OR vence < ?)",
+                (dueno, ahora + arriendo, id_difusion, dueno, ahora),
+            ).rowcount == 1
+
+    def huerfanas(self, dueno):
+        """Ids de difusiones en curso que este worker podría reclamar."""
+        with self._lock:
+            return [fila[0] for fila in self._conectar().execute(
+                "SELECT id FROM difusiones WHERE estado = 'en_curso' AND (dueno = ? OR dueno IS NULL OR vence < ?)"
+                " ORDER BY creada", (dueno, time.time()),
+            )]
+
+    def soltar(self, id_difusion, dueno):
+        with self._lock:
+            self._conectar().execute(
+                "UPDATE difusiones SET dueno = NULL, vence = 0 WHERE id = ? AND dueno = ?", (id_difusion, dueno))
+
+    def definicion(self, id_difusion):
+        with self._lock:
+            fila = self._conectar().execute(
+                "SELECT definicion, tasa FROM difusiones WHERE id = ?", (id_difusion,)).fetchone()
+        return (json.loads(fila[0]), fila[1]) if fila else (None, None)
+
+    def pendientes(self, id_difusion, desde, limite):
+        """Próximo lote de [(orden, numero, variables)] sin resultado desde `orden`, en el orden de la cohorte."""
+        with self._lock:
+            filas = self._conectar().execute(
+                "SELECT orden, numero, variables FROM destinatarios WHERE difusion = ? AND estado = 'pendiente'"
+                " AND orden >= ? ORDER BY orden LIMIT ?", (id_difusion, desde, limite),
+            ).fetchall()
+        return [(orden, numero, json.loads(variables) if variables else {}) for orden, numero, variables in filas]
+
+    def anotar(self, id_difusion, dueno, resultados, arriendo):
+        """Guarda los resultados del lote y renueva el arriendo en una transacción.
+
+        `resultados` es [(numero, estado, detalle)]. Devuelve False si la
+        difusión ya no es de este worker o no sigue en curso (se pausó).
+        """
+        ahora = time.time()
+        cuenta = dict.fromkeys(RESULTADOS, 0)
+        for _, estado, _ in resultados:
+            cuenta[estado] += 1
+        with self._lock:
+            conexion = self._conectar()
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                conexion.executemany(
+                    "UPDATE destinatarios SET estado = ?, detalle = ?, t = ? WHERE difusion = ? AND numero = ?",
+                    ((estado, detalle, ahora, id_difusion, numero) for numero, estado, detalle in resultados),
+                )
+                conexion.execute(
+                    "UPDATE difusiones SET enviados = enviados + ?, fallidos = fallidos + ?, omitidos = omitidos + ?,"
+                    " actualizada = ? WHERE id = ?",
+                    (cuenta["enviado"], cuenta["fallido"], cuenta["omitido"], ahora, id_difusion),
+                )
+                sigue = conexion.execute(
+                    "UPDATE difusiones SET vence = ? WHERE id = ? AND dueno = ? AND estado = 'en_curso'",
+                    (ahora + arriendo, id_difusion, dueno),
+                ).rowcount == 1
+                conexion.execute("COMMIT")
+            except BaseException:
+                conexion.execute("ROLLBACK")
+                raise
+        return sigue
+
+    def terminar(self, id_difusion, dueno):
+        with self._lock:
+            self._conectar().execute(
+                "UPDATE difusiones SET estado = 'terminada', dueno = NULL, vence = 0, actualizada = ?"
+                " WHERE id = ? AND dueno = ? AND estado = 'en_curso'", (time.time(), id_difusion, dueno))
+
+    def cambiar_estado(self, id_difusion, desde, hacia):
+        """pausar: en_curso -> pausada; reanudar: pausada -> en_curso (sin dueño, la toma cualquiera)."""
+        with self._lock:
+            return self._conectar().execute(
+                "UPDATE difusiones SET estado = ?, dueno = NULL, vence = 0, actualizada = ? WHERE id = ? AND estado = ?",
+                (hacia, time.time(), id_difusion, desde),
+            ).rowcount == 1
+
+    def progreso(self, id_difusion=None):
+        """Un dict por difusión (o solo la pedida) con su estado y contadores."""
+        consulta = ("SELECT id, creada, definicion, tasa, estado, total, enviados, fallidos, omitidos, dueno, actualizada"
+                    " FROM difusiones")
+        with self._lock:
+            if id_difusion is None:
+                filas = self._conectar().execute(consulta + " ORDER BY creada DESC").fetchall()
+            else:
+                filas = self._conectar().execute(consulta + " WHERE id = ?", (id_difusion,)).fetchall()
+        resultado = []
+        for id_, creada, definicion, tasa, estado, total, enviados, fallidos, omitidos, dueno, actualizada in filas:
+            resultado.append({
+                "id": id_, "estado": estado, "definicion": json.loads(definicion), "tasa": tasa,
+                "total": total, "enviados": enviados, "fallidos": fallidos, "omitidos": omitidos,
+                "pendientes": total - enviados - fallidos - omitidos, "worker": dueno,
+                "creada": creada, "actualizada": actualizada,
+            })
+        return resultado
+
+    def resultados(self, id_difusion, estado=None, limite=1000, desde=0):
+        """Resultados por destinatario, en el orden de la cohorte."""
+        consulta = "SELECT orden, numero, estado, detalle, t FROM destinatarios WHERE difusion = ? AND orden >= ?"
+        parametros = [id_difusion, desde]
+        if estado:
+            consulta += " AND estado = ?"
+            parametros.append(estado)
+        consulta += " ORDER BY orden LIMIT ?"
+        parametros.append(limite)
+        with self._lock:
+            filas = self._conectar().execute(consulta, parametros).fetchall()
+        return [{"orden": orden, "numero": numero, "estado": estado, "detalle": detalle, "t": t}
+                for orden, numero, estado, detalle, t in filas]
+
+    def cerrar(self):
+        if self._conexion is not None:
+            self._conexion.close()
+            self._conexion = None
+
+
+class Difusor:
+    """Corre las difusiones en curso de este worker contra el pipeline de envíos.
+
+    `encolar(destino, texto)` es PipelineEnvios.encolar. `preparar(numero,
+    definicion, variables)` es una corrutina del bot que deja la sesión
+    lista y devuelve (texto, None) o (None, motivo) para omitir al
+    destinatario; o (futuro, None) si el mensaje ya quedó encolado en el
+    worker dueño del número (reparto.py), y entonces el futuro puede
+    terminar con Omitido. Un resultado None del pipeline es un envío
+    fallido, salvo con `simulado` (sin credenciales de Twilio).
+    """
+
+    def __init__(self, base, encolar, preparar, tasa=20.0, lote=100, max_destinatarios=100_000,
+                 arriendo=60.0, revisar_cada=10.0, simulado=False):
+        self.base = base
+        self.encolar = encolar
+        self.preparar = preparar
+        self.tasa = tasa
+        self.lote = lote
+        self.max_destinatarios = max_destinatarios
+        self.arriendo = arriendo
+        self.revisar_cada = revisar_cada
+        self.simulado = simulado
+        self.dueno = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._tareas = {}  # id -> tarea
+        self._pausadas = set()  # pausadas desde este worker: cortar sin esperar al fin del lote
+        self._cerrando = None
+        self._vigilante = None
+
+        # Métricas (solo se modifican desde el hilo del event loop)
+        self.resultados = dict.fromkeys(RESULTADOS, 0)
+        self.lotes = 0
+        self.reanudadas = 0
+
+    async def iniciar(self):
+        """Retoma las difusiones en curso (de un reinicio o de un worker caído) y las vigila."""
+        if self._vigilante is None:
+            # Creado antes de un fork (lanzador.py): cada worker necesita su propio dueño
+            self.dueno = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            self._cerrando = asyncio.Event()
+            await self._retomar()
+            self._vigilante = asyncio.create_task(self._vigilar(), name="difusion-vigilante")
+
+    async def detener(self):
+        """Termina y anota el lote en curso de cada difusión y suelta sus arriendos."""
+        if self._vigilante is None:
+            return
+        self._cerrando.set()
+        await self._vigilante
+        self._vigilante = None
+        await asyncio.gather(*self._tareas.values(), return_exceptions=True)
+
+    async def crear(self, datos, destinatarios):
+        """Valida y guarda una difusión nueva y empieza a correrla. Devuelve (id, creada)."""
+        definicion = definir(datos)
+        cohorte = normalizar_destinatarios(destinatarios, self.max_destinatarios)
+        tasa = float(datos.get("tasa") or self.tasa)
+        if tasa <= 0:
+            raise ErrorDifusion("la tasa debe ser positiva")
+        id_difusion = str(datos.get("id") or uuid.uuid4().hex[:12])
+        creada = await asyncio.to_thread(
+            self.base.crear, id_difusion, definicion, cohorte, tasa, self.dueno, self.arriendo)
+        if creada:
+            registro.info("difusion_creada", id=id_difusion, destinatarios=len(cohorte), tasa=tasa,
+                          ejercicio=definicion["ejercicio"])
+            self._lanzar(id_difusion)
+        return id_difusion, creada
+
+    async def pausar(self, id_difusion):
+        if not await asyncio.to_thread(self.base.cambiar_estado, id_difusion, "en_curso", "pausada"):
+            return False
+        if id_difusion in self._tareas:
+            self._pausadas.add(id_difusion)
+        registro.info("difusion_pausada", id=id_difusion)
+        return True
+
+    async def reanudar(self, id_difusion):
+        if not await asyncio.to_thread(self.base.cambiar_estado, id_difusion, "pausada", "en_curso"):
+            return False
+        registro.info("difusion_reanudada", id=id_difusion)
+        if await asyncio.to_thread(self.base.reclamar, id_difusion, self.dueno, self.arriendo):
+            self._lanzar(id_difusion)
+        return True
+
+    def _lanzar(self, id_difusion):
+        # Reanudada antes de que cortara: la tarea que sigue viva continúa
+        self._pausadas.discard(id_difusion)
+        tarea = self._tareas.get(id_difusion)
+        if tarea is not None and not tarea.done():
+            return
+        self._tareas[id_difusion] = asyncio.create_task(self._correr(id_difusion), name=f"difusion-{id_difusion}")
+
+    async def _retomar(self):
+        for id_difusion in await asyncio.to_thread(self.base.huerfanas, self.dueno):
+            if id_difusion in self._tareas and not self._tareas[id_difusion].done():
+                continue
+            if await asyncio.to_thread(self.base.reclamar, id_difusion, self.dueno, self.arriendo):
+                self.reanudadas += 1
+                registro.info("difusion_retomada", id=id_difusion)
+                self._lanzar(id_difusion)
+
+    async def _vigilar(self):
+        while not self._cerrando.is_set():
+            try:
+                await asyncio.wait_for(self._cerrando.wait(), timeout=self.revisar_cada)
+            except asyncio.TimeoutError:
+                pass
+            if self._cerrando.is_set():
+                break
+            for id_difusion in [i for i, t in self._tareas.items() if t.done()]:
+                del self._tareas[id_difusion]
+            try:
+                await self._retomar()
+            except Exception:
+                registro.error("difusion_vigilante", exc_info=True)
+
+    def _cortar(self, id_difusion):
+        return self._cerrando.is_set() or id_difusion in self._pausadas
+
+    async def _correr(self, id_difusion):
+        loop = asyncio.get_running_loop()
+        anotando = None  # tarea que espera los resultados del lote anterior y los anota
+        try:
+            definicion, tasa = await asyncio.to_thread(self.base.definicion, id_difusion)
+            # Ráfaga de una décima de segundo (como el remitente en PipelineEnvios): salida pareja
+            # que deja lugar a las respuestas del webhook, sin perder ritmo por lo que se pasa cada sleep
+            cubeta = CubetaTokens(tasa, tasa / 10, loop.time())
+            siguiente = 0  # los lotes en vuelo siguen pendientes en la base: se avanza por orden
+            while not self._cortar(id_difusion):
+                lote = await asyncio.to_thread(self.base.pendientes, id_difusion, siguiente, self.lote)
+                if not lote:
+                    break
+                siguiente = lote[-1][0] + 1
+                resultados, futuros = await self._encolar_lote(id_difusion, definicion, lote, cubeta, loop)
+                # El lote anterior se anota mientras este sale: no hay pausa entre lotes
+                sigue = await anotando if anotando is not None else True
+                anotando = asyncio.create_task(self._anotar(id_difusion, resultados, futuros))
+                if not sigue:
+                    return  # pausada desde otro worker, o el arriendo pasó a otro
+            sigue = await anotando if anotando is not None else True
+            anotando = None
+            if not sigue:
+                return
+            if self._cortar(id_difusion):
+                if self._cerrando.is_set():
+                    await asyncio.to_thread(self.base.soltar, id_difusion, self.dueno)
+                return
+            await asyncio.to_thread(self.base.terminar, id_difusion, self.dueno)
+            registro.info("difusion_terminada", id=id_difusion)
+        except Exception:
+            # El arriendo vence y la difusión se retoma (aquí o en otro worker) desde lo anotado
+            registro.error("difusion_interrumpida", exc_info=True, id=id_difusion)
+        finally:
+            if anotando is not None:
+                await asyncio.gather(anotando, return_exceptions=True)
+            self._pausadas.discard(id_difusion)
+
+    async def _encolar_lote(self, id_difusion, definicion, lote, cubeta, loop):
+        """Encola el lote al ritmo de la cubeta. Lo que no llega a encolarse queda pendiente.
+
+        Devuelve los resultados ya conocidos (omitidos y fallidos) y los
+        futuros de los envíos encolados.
+        """
+        resultados = []
+        futuros = []
+        for _, numero, variables in lote:
+            if self._cortar(id_difusion):
+                break
+            espera = cubeta.tomar(loop.time())
+            if espera > 0:
+                await asyncio.sleep(espera)
+            try:
+                texto, motivo = await self.preparar(numero, definicion, variables)
+            except Exception as e:
+                registro.error("difusion_destinatario", exc_info=True, id=id_difusion, destino=numero)
+                resultados.append((numero, "fallido", str(e)))
+                continue
+            if texto is None:
+                resultados.append((numero, "omitido", motivo))
+            elif isinstance(texto, str):
+                futuros.append((numero, await self.encolar(numero, texto)))
+            else:
+                futuros.append((numero, texto))
+        return resultados, futuros
+
+    async def _anotar(self, id_difusion, resultados, futuros):
+        """Espera los envíos del lote y anota todo. Devuelve False si la difusión no debe seguir."""
+        for numero, futuro in futuros:
+            try:
+                respuesta = await futuro
+            except Omitido as e:
+                resultados.append((numero, "omitido", str(e)))
+                continue
+            except Exception as e:
+                registro.error("difusion_destinatario", id=id_difusion, destino=numero, error=str(e))
+                resultados.append((numero, "fallido", str(e)))
+                continue
+            if respuesta is not None:
+                resultados.append((numero, "enviado", respuesta.get("sid")))
+            elif self.simulado:
+                resultados.append((numero, "enviado", "simulado"))
+            else:
+                resultados.append((numero, "fallido", "twilio"))
+        self.lotes += 1
+        for _, estado, _ in resultados:
+            self.resultados[estado] += 1
+        return await asyncio.to_thread(self.base.anotar, id_difusion, self.dueno, resultados, self.arriendo)
+
+    def estadisticas(self):
+        return {
+            "en_curso": sum(1 for tarea in self._tareas.values() if not tarea.done()),
+            "lotes": self.lotes,
+            "reanudadas": self.reanudadas,
+            **self.resultados,
+        }
+
+
+def _cli():
+    import argparse
+    import csv
+    import urllib.error
+    import urllib.request
+
+    parser = argparse.ArgumentParser(description="Difusiones del bot (contra la API de administración)")
+    parser.add_argument("--url", default=os.getenv("BOT_URL", "http://127.0.0.1:8000"))
+    parser.add_argument("--token", default=os.getenv("ADMIN_TOKEN", ""))
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    crear = comandos.add_parser("crear", help="crea una difusión y empieza a enviarla")
+    crear.add_argument("--id", help="id propio (crear dos veces el mismo id no duplica la difusión)")
+    crear.add_argument("--mensaje", help="texto; $numero y las columnas del CSV son variables")
+    crear.add_argument("--ejercicio", help="ejercicio de ejercicios.json a iniciar")
+    crear.add_argument("--numeros", help="archivo con un número por línea, o CSV con columna 'numero'")
+    crear.add_argument("--filtro", action="append", default=[], help="campo=valor sobre las sesiones (estado, ejercicio)")
+    crear.add_argument("--tasa", type=float, help="mensajes por segundo")
+    crear.add_argument("--esperar-respuesta", action="store_true", help="dejar la sesión esperando la respuesta")
+    crear.add_argument("--incluir-ocupados", action="store_true", help="enviar también a quien está en un ejercicio")
+    crear.add_argument("--seguir", action="store_true", help="mostrar el progreso hasta que termine")
+    estado = comandos.add_parser("estado", help="progreso de una difusión (o de todas)")
+    estado.add_argument("id", nargs="?")
+    estado.add_argument("--seguir", action="store_true")
+    for nombre in ("pausar", "reanudar"):
+        comandos.add_parser(nombre).add_argument("id")
+    resultados = comandos.add_parser("resultados", help="resultado por destinatario")
+    resultados.add_argument("id")
+    resultados.add_argument("--estado", choices=("pendiente",) + RESULTADOS)
+    resultados.add_argument("--limite", type=int, default=1000)
+    args = parser.parse_args()
+
+    def pedir(metodo, ruta, cuerpo=None):
+        peticion = urllib.request.Request(
+            args.url.rstrip("/") + ruta, method=metodo,
+            data=json.dumps(cuerpo).encode() if cuerpo is not None else None,
+            headers={"Authorization": f"Bearer {args.token}", "Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(peticion, timeout=60) as respuesta:
+                return json.loads(respuesta.read())
+        except urllib.error.HTTPError as e:
+            raise SystemExit(f"❌ {e.code}: {e.read().decode(errors='replace')}")
+        except urllib.error.URLError as e:
+            raise SystemExit(f"❌ No se pudo contactar al bot en {args.url}: {e.reason}")
+
+    def seguir(id_difusion):
+        while True:
+            progreso = pedir("GET", f"/admin/difusiones/{id_difusion}")
+            hechos = progreso["total"] - progreso["pendientes"]
+            print(f"\r{progreso['estado']}: {hechos}/{progreso['total']} (enviados {progreso['enviados']},"
+                  f" fallidos {progreso['fallidos']}, omitidos {progreso['omitidos']})", end="", flush=True)
+            if progreso["estado"] != "en_curso":
+                print()
+                return
+            time.sleep(1)
+
+    if args.comando == "crear":
+        cuerpo = {"id": args.id, "mensaje": args.mensaje, "ejercicio": args.ejercicio, "tasa": args.tasa,
+                  "esperar_respuesta": args.esperar_respuesta, "omitir_ocupados": not args.incluir_ocupados}
+        if args.numeros:
+            with open(args.numeros, encoding="utf-8", newline="") as f:
+                lineas = [linea for linea in f.read().splitlines() if linea.strip()]
+            if lineas and "numero" in lineas[0]:
+                cuerpo["destinatarios"] = list(csv.DictReader(lineas))
+            else:
+                cuerpo["destinatarios"] = [linea.strip() for linea in lineas]
+        if args.filtro:
+            cuerpo["filtro"] = dict(condicion.split("=", 1) for condicion in args.filtro)
+        creada = pedir("POST", "/admin/difusiones", cuerpo)
+        print(f"{'✅ Difusión creada' if creada['creada'] else 'ℹ️  Ya existía la difusión'}: "
+              f"{creada['id']} ({creada['total']} destinatarios)")
+        if args.seguir:
+            seguir(creada["id"])
+    elif args.comando == "estado":
+        if args.seguir and args.id:
+            seguir(args.id)
+        else:
+            print(json.dumps(pedir("GET", f"/admin/difusiones/{args.id or ''}".rstrip("/")), indent=2, ensure_ascii=False))
+    elif args.comando in ("pausar", "reanudar"):
+        print(json.dumps(pedir("POST", f"/admin/difusiones/{args.id}/{args.comando}"), ensure_ascii=False))
+    else:
+        consulta = f"?limite={args.limite}" + (f"&estado={args.estado}" if args.estado else "")
+        for fila in pedir("GET", f"/admin/difusiones/{args.id}/destinatarios{consulta}"):
+            print(f"{fila['numero']}\t{fila['estado']}\t{fila['detalle'] or ''}")
+
+
+if __name__ == "__main__":
+    _cli()
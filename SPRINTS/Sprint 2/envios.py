@@ -0,0 +1,393 @@
+"""Envío asíncrono de mensajes salientes de WhatsApp.
+
+El SDK de Twilio es síncrono: llamarlo desde una corrutina bloquea el event
+loop. Aquí los envíos pasan por colas acotadas que consumen corrutinas
+trabajadoras; cada una hace la llamada HTTP en un pool de hilos con
+conexiones keep-alive. Cada destinatario cae siempre en la misma cola, así
+que sus mensajes salen en el orden en que se encolaron.
+
+Los envíos respetan una cubeta de tokens por número remitente y otra por
+destinatario (ver limites.py). Mientras un destinatario espera su turno,
+sus mensajes se acumulan y salen juntos en una sola llamada (hasta 1600
+caracteres), sin frenar a los demás destinatarios de la misma cola. Un 429
+se reintenta con backoff exponencial y jitter.
+"""
+import asyncio
+import base64
+import http.client
+import json
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+from limites import CubetaTokens, espera_reintento
+from perfilado import Trazas
+from registro import obtener_registro
+
+registro = obtener_registro("envios")
+
+
+class ErrorEnvio(Exception):
+    """Twilio respondió con un error o no se pudo contactar."""
+
+    def __init__(self, mensaje, estado=None, reintentar_en=None):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.reintentar_en = reintentar_en  # segundos del Retry-After, si vino
+
+
+class ClienteTwilio:
+    """Cliente HTTP mínimo para la API de mensajes de Twilio.
+
+    Mantiene una conexión keep-alive por hilo. `url_base` permite apuntarlo a
+    un servidor falso local (ver benchmarks/twilio_falso.py).
+    """
+
+    def __init__(self, account_sid, auth_token, url_base="https://api.twilio.com", timeout=10):
+        self.account_sid = account_sid
+        partes = urlsplit(url_base)
+        self._https = partes.scheme == "https"
+        self._host = partes.hostname
+        self._puerto = partes.port
+        self._ruta = f"{partes.path.rstrip('/')}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        credenciales = base64.b64encode(f"{account_sid}:{auth_token}".encode()).decode()
+        self._cabeceras = {
+            "Authorization": f"Basic {credenciales}",
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Connection": "keep-alive",
+        }
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            clase = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            conexion = clase(self._host, self._puerto, timeout=self.timeout)
+            self._local.conexion = conexion
+        return conexion
+
+    def _cerrar_conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is not None:
+            conexion.close()
+            self._local.conexion = None
+
+    def enviar(self, origen, destino, cuerpo):
+        """Crea el mensaje en Twilio (bloqueante). Devuelve el JSON de respuesta."""
+        datos = urlencode({"From": origen, "To": destino, "Body": cuerpo})
+        for intento in range(2):
+            conexion = self._conexion()
+            try:
+                conexion.request("POST", self._ruta, body=datos, headers=self._cabeceras)
+                respuesta = conexion.getresponse()
+                contenido = respuesta.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                # La conexión keep-alive pudo haberse cerrado del otro lado: reintentar una vez
+                self._cerrar_conexion()
+                if intento == 1:
+                    raise ErrorEnvio(f"No se pudo contactar a Twilio: {e}")
+
+        if respuesta.status >= 400:
+            reintentar_en = respuesta.getheader("Retry-After")
+            raise ErrorEnvio(
+                f"Twilio respondió {respuesta.status}: {contenido[:200]!r}",
+                respuesta.status,
+                float(reintentar_en) if reintentar_en and reintentar_en.isdigit() else None,
+            )
+        return json.loads(contenido) if contenido else {}
+
+
+class PipelineEnvios:
+    """Colas acotadas + corrutinas trabajadoras para los envíos salientes.
+
+    Si se pasa `histograma_envio` (metricas.Histograma), se observa ahí la
+    duración de cada llamada a Twilio; con `trazas` (perfilado.Trazas
+    activas) cada lote enviado es una traza "envio". `tasa_remitente` y
+    `tasa_destino` son mensajes por segundo (None = sin límite). La ráfaga
+    del remitente es por defecto una décima de segundo de tasa: salida
+    pareja, sin picos.
+    """
+
+    def __init__(self, cliente, origen, trabajadores=8, capacidad=1000, histograma_envio=None,
+                 tasa_remitente=None, rafaga_remitente=None, tasa_destino=None, rafaga_destino=3,
+                 max_caracteres=1600, max_reintentos=5, trazas=None):
+        self.cliente = cliente
+        self.origen = origen
+        self.trabajadores = max(1, trabajadores)
+        self.capacidad = capacidad
+        self.histograma_envio = histograma_envio
+        self.trazas = trazas if trazas is not None else Trazas()
+        self.tasa_remitente = tasa_remitente
+        self.rafaga_remitente = rafaga_remitente or (tasa_remitente or 0) / 10
+        self.tasa_destino = tasa_destino
+        self.rafaga_destino = rafaga_destino
+        self.max_caracteres = max_caracteres
+        self.max_reintentos = max_reintentos
+        self._cubeta_remitente = None
+        self._colas = []
+        self._tareas = []
+        self._pool = None
+
+        # Métricas (solo se modifican desde el hilo del event loop)
+        self.encolados = 0
+        self.enviados = 0
+        self.errores = 0
+        self.esperas_backpressure = 0
+        self.segundos_backpressure = 0.0
+        self.segundos_envio = 0.0
+        self.max_segundos_envio = 0.0
+        self.agrupados = 0  # mensajes que salieron dentro de la llamada de otro
+        self.perdidos = 0  # mensajes de envíos que fallaron
+        self.reintentos = 0
+        self.esperas_limite = 0
+        self.segundos_limite = 0.0
+
+    @property
+    def activo(self):
+        return bool(self._tareas)
+
+    async def iniciar(self):
+        if self._tareas:
+            return
+        capacidad_por_cola = max(1, self.capacidad // self.trabajadores)
+        self._pool = ThreadPoolExecutor(max_workers=self.trabajadores, thread_name_prefix="envios")
+        if self.tasa_remitente:
+            self._cubeta_remitente = CubetaTokens(
+                self.tasa_remitente, self.rafaga_remitente, asyncio.get_running_loop().time())
+        self._colas = [asyncio.Queue(maxsize=capacidad_por_cola) for _ in range(self.trabajadores)]
+        self._tareas = [
+            asyncio.create_task(self._trabajador(cola, capacidad_por_cola), name=f"envios-{i}")
+            for i, cola in enumerate(self._colas)
+        ]
+
+    async def detener(self, drenar=True):
+        """Detiene los trabajadores. Con `drenar`, espera a que se vacíen las colas."""
+        if drenar:
+            for cola in self._colas:
+                await cola.join()
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        self._colas = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _cola_de(self, destino):
+        return self._colas[zlib.crc32(destino.encode()) % len(self._colas)]
+
+    async def encolar(self, destino, mensaje):
+        """Encola un mensaje y devuelve un Future con el resultado del envío.
+
+        Si la cola del destinatario está llena, espera (backpressure) en
+        lugar de descartar el mensaje.
+        """
+        if not self._tareas:
+            await self.iniciar()
+        futuro = asyncio.get_running_loop().create_future()
+        item = (destino, mensaje, futuro)
+        cola = self._cola_de(destino)
+        try:
+            cola.put_nowait(item)
+        except asyncio.QueueFull:
+            self.esperas_backpressure += 1
+            inicio = time.perf_counter()
+            await cola.put(item)
+            self.segundos_backpressure += time.perf_counter() - inicio
+        self.encolados += 1
+        return futuro
+
+    async def enviar(self, destino, mensaje):
+        """Encola el mensaje y espera a que se envíe (sin bloquear el event loop)."""
+        futuro = await self.encolar(destino, mensaje)
+        return await futuro
+
+    async def _trabajador(self, cola, limite):
+        """Atiende una cola. Saca de ella hasta `limite` mensajes y los agrupa por destinatario."""
+        loop = asyncio.get_running_loop()
+        turno = _Turno(limite)
+        while True:
+            if not turno.pendientes:
+                turno.recibir(await cola.get())
+            # Lo que llegó mientras se enviaba o se esperaba se suma ahora (y puede agruparse)
+            while not turno.lleno and not cola.empty():
+                turno.recibir(cola.get_nowait())
+
+            ahora = loop.time()
+            destino, espera = self._elegir(turno, ahora)
+            if destino is None:
+                # Nadie puede enviar todavía: dormir hasta el primero o hasta que llegue algo
+                self.esperas_limite += 1
+                self.segundos_limite += espera
+                if turno.lleno:
+                    await asyncio.sleep(espera)
+                else:
+                    try:
+                        turno.recibir(await asyncio.wait_for(cola.get(), espera))
+                    except asyncio.TimeoutError:
+                        pass
+                continue
+
+            if self._cubeta_remitente is not None:
+                espera = self._cubeta_remitente.tomar(ahora)
+                if espera > 0:
+                    self.esperas_limite += 1
+                    self.segundos_limite += espera
+                    await asyncio.sleep(espera)
+                    while not turno.lleno and not cola.empty():
+                        turno.recibir(cola.get_nowait())
+            if self.tasa_destino:
+                turno.cubeta(destino, self.tasa_destino, self.rafaga_destino, ahora).tomar(ahora)
+            abierta = self.trazas.iniciar("envio", destino=destino)
+            try:
+                await self._enviar_lote(loop, cola, turno, destino)
+            finally:
+                self.trazas.terminar(abierta)
+            turno.podar(loop.time())
+
+    def _elegir(self, turno, ahora):
+        """Primer destinatario (en orden de llegada) que ya puede enviar, o la espera mínima."""
+        minima = None
+        for destino in turno.pendientes:
+            espera = turno.bloqueado_hasta.get(destino, 0.0) - ahora
+            if self.tasa_destino:
+                espera = max(espera, turno.cubeta(destino, self.tasa_destino, self.rafaga_destino, ahora).espera(ahora))
+            if espera <= 0:
+                return destino, 0.0
+            minima = espera if minima is None else min(minima, espera)
+        return None, minima
+
+    async def _enviar_lote(self, loop, cola, turno, destino):
+        lote = turno.sacar(destino, self.max_caracteres)
+        cuerpo = "\n\n".join(mensaje for mensaje, _ in lote)
+        self.trazas.anotar(mensajes=len(lote))
+        try:
+            resultado = await self._enviar_uno(loop, destino, cuerpo)
+        except ErrorEnvio as e:
+            intento = turno.intentos.get(destino, 0)
+            if e.estado == 429 and intento < self.max_reintentos:
+                # Demasiado rápido: devolver el lote al frente y reintentar más tarde
+                espera = max(espera_reintento(intento), e.reintentar_en or 0.0)
+                turno.devolver(destino, lote, loop.time() + espera)
+                turno.intentos[destino] = intento + 1
+                if self._cubeta_remitente is not None:
+                    self._cubeta_remitente.vaciar(loop.time())
+                self.reintentos += 1
+                registro.warning("envio_limitado", destino=destino, intento=intento + 1, espera_s=round(espera, 2))
+                return
+            resultado = self._fallo(destino, e, lote)
+        except Exception as e:
+            resultado = self._fallo(destino, e, lote)
+
+        turno.intentos.pop(destino, None)
+        self.agrupados += len(lote) - 1
+        for _, futuro in lote:
+            if not futuro.done():
+                futuro.set_result(resultado)
+            cola.task_done()
+
+    def _fallo(self, destino, error, lote):
+        self.errores += 1
+        self.perdidos += len(lote)
+        registro.error("envio_fallido", destino=destino, mensajes=len(lote), error=str(error))
+        return None
+
+    async def _enviar_uno(self, loop, destino, mensaje):
+        if self.cliente is None:
+            registro.info("envio_simulado", destino=destino, mensaje=mensaje)
+            return None
+        inicio = time.perf_counter()
+        with self.trazas.tramo("twilio"):
+            resultado = await loop.run_in_executor(self._pool, self.cliente.enviar, self.origen, destino, mensaje)
+        duracion = time.perf_counter() - inicio
+        self.enviados += 1
+        self.segundos_envio += duracion
+        self.max_segundos_envio = max(self.max_segundos_envio, duracion)
+        if self.histograma_envio is not None:
+            self.histograma_envio.observar(duracion)
+        registro.debug("envio", destino=destino, mensaje=mensaje, ms=round(duracion * 1000, 1))
+        return resultado
+
+    def estadisticas(self):
+        return {
+            "trabajadores": self.trabajadores,
+            "capacidad": self.capacidad,
+            "en_cola": sum(cola.qsize() for cola in self._colas),
+            "encolados": self.encolados,
+            "enviados": self.enviados,
+            "errores": self.errores,
+            "perdidos": self.perdidos,
+            "agrupados": self.agrupados,
+            "reintentos": self.reintentos,
+            "esperas_limite": self.esperas_limite,
+            "segundos_limite": round(self.segundos_limite, 3),
+            "esperas_backpressure": self.esperas_backpressure,
+            "segundos_backpressure": round(self.segundos_backpressure, 3),
+            "latencia_media_ms": round(1000 * self.segundos_envio / self.enviados, 2) if self.enviados else 0,
+            "latencia_max_ms": round(1000 * self.max_segundos_envio, 2),
+        }
+
+
+class _Turno:
+    """Mensajes que un trabajador ya sacó de su cola, agrupados por destinatario."""
+
+    __slots__ = ("limite", "cantidad", "pendientes", "bloqueado_hasta", "intentos", "cubetas", "_envios")
+
+    def __init__(self, limite):
+        self.limite = limite
+        self.cantidad = 0
+        self.pendientes = {}  # destino -> deque[(mensaje, futuro)]; el dict conserva el orden de llegada
+        self.bloqueado_hasta = {}  # destino -> momento (tras un 429)
+        self.intentos = {}  # destino -> 429 seguidos
+        self.cubetas = {}  # destino -> CubetaTokens
+        self._envios = 0
+
+    @property
+    def lleno(self):
+        return self.cantidad >= self.limite
+
+    def recibir(self, item):
+        destino, mensaje, futuro = item
+        self.pendientes.setdefault(destino, deque()).append((mensaje, futuro))
+        self.cantidad += 1
+
+    def cubeta(self, destino, tasa, rafaga, ahora):
+        cubeta = self.cubetas.get(destino)
+        if cubeta is None:
+            cubeta = self.cubetas[destino] = CubetaTokens(tasa, rafaga, ahora)
+        return cubeta
+
+    def sacar(self, destino, max_caracteres):
+        """Mensajes del destinatario que entran juntos en una llamada (al menos uno)."""
+        cola = self.pendientes[destino]
+        lote = [cola.popleft()]
+        largo = len(lote[0][0])
+        while cola and largo + 2 + len(cola[0][0]) <= max_caracteres:
+            largo += 2 + len(cola[0][0])
+            lote.append(cola.popleft())
+        if not cola:
+            del self.pendientes[destino]
+        self.cantidad -= len(lote)
+        return lote
+
+    def devolver(self, destino, lote, no_antes_de):
+        cola = self.pendientes.setdefault(destino, deque())
+        cola.extendleft(reversed(lote))
+        self.cantidad += len(lote)
+        self.bloqueado_hasta[destino] = no_antes_de
+
+    def podar(self, ahora):
+        # Cada tanto, olvidar destinatarios sin nada pendiente y con la cubeta llena
+        self._envios += 1
+        if self._envios % 1000:
+            return
+        for destino in [d for d, c in self.cubetas.items() if d not in self.pendientes and c.llena(ahora)]:
+            del self.cubetas[destino]
+        for destino in [d for d, t in self.bloqueado_hasta.items() if t <= ahora]:
+            del self.bloqueado_hasta[destino]
@@ -0,0 +1,303 @@
+"""Firma de Twilio y admisión del webhook, antes de parsear nada.
+
+Sin esto cualquiera puede hacer POST a /whatsapp con un From inventado y
+arrancar ejercicios que gastan trabajadores y cuota de envíos. Twilio firma
+cada webhook con HMAC-SHA1 del auth token sobre la URL más los parámetros
+del formulario ordenados por nombre (nombre y valor concatenados), en base64,
+en la cabecera X-Twilio-Signature.
+
+AdmisionWebhook guarda el estado y las métricas; FiltrarWebhook es el
+middleware ASGI que le pasa los POST al webhook. Por cada uno:
+
+1. IP castigada: cada petición rechazada consume un token de la cubeta de
+   su IP; con la cubeta vacía se responde 429 sin leer el cuerpo ni
+   calcular el HMAC. No se limita el tráfico válido por IP porque Twilio
+   envía todo desde pocas IPs compartidas.
+2. Cuerpo acotado (413 si pasa de `max_bytes`): Twilio manda formularios
+   de pocos KB.
+3. Firma: se calcula sobre el formulario crudo, sin parsearlo campo por
+   campo, copiando un HMAC con la clave ya cargada (ver ValidadorFirma),
+   y se compara en tiempo constante. 403 si falta o no coincide.
+4. Repetición: se recuerdan las últimas `max_firmas` firmas válidas. Una
+   firma repetida dentro de `ventana_reintentos` es un reintento de Twilio
+   y pasa (la deduplicación por MessageSid le devuelve la misma respuesta);
+   más tarde es una petición capturada que se reenvía: 403.
+5. Remitente: solo sin firma que validar (sin auth token), cubeta por
+   From; 429 si manda más rápido de lo que escribe una persona. Lo firmado
+   por Twilio pasa siempre: Twilio no reintenta un 429 y el mensaje se
+   perdería, aunque sea un "salir" o un pedido de ayuda escrito rápido.
+
+El cuerpo leído se le entrega a la app tal cual (sin copiarlo si llegó en
+un solo trozo). Todo corre en el hilo del event loop, sin locks.
+"""
+import base64
+import codecs
+import hashlib
+import hmac
+import math
+import operator
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+from limites import CubetaTokens
+from registro import obtener_registro
+
+registro = obtener_registro("firma")
+
+PUERTOS_POR_DEFECTO = {"http": 80, "https": 443}
+MOTIVOS = ("ip", "tamano", "firma", "repetida", "remitente")
+
+# Lo que manda Twilio: nombres alfanuméricos, un "=" por campo, "%XX" bien formados y sin "\\"
+_CAMPO_SIMPLE = r"[A-Za-z0-9_]+=(?:[^=&%\\]+|%[0-9A-Fa-f]{2})*"
+FORMULARIO_SIMPLE = re.compile(rf"{_CAMPO_SIMPLE}(?:&{_CAMPO_SIMPLE})*")
+CAMPO_FROM = re.compile(r"(?:^|&)From=([^&]*)")
+_NOMBRE_Y_VALOR = operator.methodcaller("split", "\0", 1)
+
+
+def firmar(token, url, parametros):
+    """X-Twilio-Signature de un POST de formulario (para clientes de prueba y benchmarks)."""
+    return ValidadorFirma(token).calcular(url, parametros)
+
+
+def _concatenar(texto):
+    """Nombres y valores ordenados y decodificados, sin parsear campo por campo.
+
+    Con un "=" por campo y nombres sin repetir, ordenar "nombre\\0valor"
+    ordena por nombre, y "%XX" se decodifica de una vez como "\\xXX" con
+    codecs.escape_decode: todo en C. None si el formulario no es simple.
+    """
+    if not texto.isascii() or not FORMULARIO_SIMPLE.fullmatch(texto):
+        return None
+    campos = texto.replace("=", "\0").split("&")
+    if len(dict(map(_NOMBRE_Y_VALOR, campos))) != len(campos):
+        return None
+    unido = "".join(sorted(campos)).replace("\0", "")
+    if "%" not in unido and "+" not in unido:
+        return unido
+    try:
+        crudo = codecs.escape_decode(unido.replace("+", " ").replace("%", "\\x").encode("ascii"))[0]
+        return crudo.decode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class ValidadorFirma:
+    """HMAC-SHA1 de Twilio.
+
+    El HMAC con la clave ya procesada se copia en cada petición (más barato
+    que hmac.new, que rehace el relleno de la clave). Lo caro era parsear
+    el formulario, de ahí `_concatenar` (ver benchmarks/bench_firma.py).
+    """
+
+    def __init__(self, token):
+        self._base = hmac.new(token.encode("utf-8"), digestmod=hashlib.sha1)
+
+    def _firma(self, datos):
+        mac = self._base.copy()
+        mac.update(datos.encode("utf-8"))
+        return base64.b64encode(mac.digest())
+
+    def calcular(self, url, parametros):
+        """`parametros` como lista de (nombre, valor), ya decodificados."""
+        return self._firma(url + "".join([k + v for k, v in sorted(parametros)])).decode("ascii")
+
+    def valida(self, url, cuerpo, firma):
+        """`cuerpo` es el formulario crudo (decodificado como latin-1)."""
+        unido = _concatenar(cuerpo)
+        if unido is not None and hmac.compare_digest(self._firma(url + unido), firma):
+            return True
+        # Camino exacto: formularios raros (o una firma que no coincide, para confirmarlo)
+        parametros = parse_qsl(cuerpo, keep_blank_values=True)
+        return hmac.compare_digest(self.calcular(url, parametros).encode("ascii"), firma)
+
+
+class FiltrarWebhook:
+    """Middleware ASGI; la instancia la crea Starlette, el estado vive en `admision`."""
+
+    def __init__(self, app, admision):
+        self.app = app
+        self.admision = admision
+
+    async def __call__(self, scope, receive, send):
+        await self.admision.atender(self.app, scope, receive, send)
+
+
+class AdmisionWebhook:
+    """Firma, repeticiones y límites de admisión de los POST a `ruta`.
+
+    Sin `validador` (no hay auth token) solo aplica los límites, incluido
+    el de remitente, que con validador no se aplica.
+    `url_publica` es la URL exacta configurada en Twilio, si la app está
+    detrás de un proxy que cambia el host o el esquema; si no, se arma con
+    Host, X-Forwarded-Proto y el path. `encabezado_ip` (p. ej.
+    "x-forwarded-for") toma la IP del cliente de esa cabecera cuando un
+    proxy de confianza la pone.
+    """
+
+    def __init__(self, ruta="/whatsapp", validador=None, url_publica="", fallos_ip=1.0, rafaga_ip=20,
+                 tasa_remitente=5.0, rafaga_remitente=30, ventana_reintentos=600, max_firmas=50_000,
+                 max_bytes=65536, encabezado_ip=""):
+        self.ruta = ruta
+        self.validador = validador
+        self.url_publica = url_publica
+        self.fallos_ip = fallos_ip
+        self.rafaga_ip = rafaga_ip
+        self.tasa_remitente = tasa_remitente
+        self.rafaga_remitente = rafaga_remitente
+        self.ventana_reintentos = ventana_reintentos
+        self.max_firmas = max_firmas
+        self.max_bytes = max_bytes
+        self.encabezado_ip = encabezado_ip.lower().encode("latin-1")
+        self._ips = {}  # ip -> CubetaTokens de fallos
+        self._remitentes = {}  # From -> CubetaTokens
+        self._firmas = OrderedDict()  # firma -> monotonic de la primera vez
+        self._ultima_poda = time.monotonic()
+
+        # Métricas
+        self.admitidos = 0
+        self.rechazados = dict.fromkeys(MOTIVOS, 0)
+        self.reintentos = 0
+
+    async def atender(self, app, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.ruta or scope["method"] != "POST":
+            return await app(scope, receive, send)
+
+        cabeceras = dict(scope["headers"])
+        ahora = time.monotonic()
+        if ahora - self._ultima_poda > 60:
+            self._podar(ahora)
+        ip = self._ip(scope, cabeceras)
+
+        cubeta_ip = self._ips.get(ip)
+        if cubeta_ip is not None:
+            espera = cubeta_ip.espera(ahora)
+            if espera > 0:
+                return await self._rechazar(send, "ip", 429, espera)
+
+        largo = cabeceras.get(b"content-length")
+        if largo is not None and largo.isdigit() and int(largo) > self.max_bytes:
+            return await self._fallo(send, ip, ahora, "tamano", 413)
+        cuerpo = await self._leer_cuerpo(receive)
+        if cuerpo is None:
+            return await self._fallo(send, ip, ahora, "tamano", 413)
+        texto = cuerpo.decode("latin-1")
+
+        if self.validador is not None:
+            firma = cabeceras.get(b"x-twilio-signature")
+            if not firma or not self.validador.valida(self._url(scope, cabeceras), texto, firma):
+                return await self._fallo(send, ip, ahora, "firma", 403)
+            primera = self._firmas.get(firma)
+            if primera is None:
+                self._firmas[firma] = ahora
+                if len(self._firmas) > self.max_firmas:
+                    self._firmas.popitem(last=False)
+            elif ahora - primera > self.ventana_reintentos:
+                return await self._fallo(send, ip, ahora, "repetida", 403)
+            else:
+                self.reintentos += 1
+
+        if self.tasa_remitente and self.validador is None:
+            # El valor crudo (sin decodificar) alcanza como clave
+            campo = CAMPO_FROM.search(texto)
+            remitente = campo.group(1) if campo else ""
+            cubeta = self._remitentes.get(remitente)
+            if cubeta is None:
+                cubeta = self._remitentes[remitente] = CubetaTokens(self.tasa_remitente, self.rafaga_remitente, ahora)
+            espera = cubeta.espera(ahora)
+            if espera > 0:
+                return await self._rechazar(send, "remitente", 429, espera)
+            cubeta.tomar(ahora)
+
+        self.admitidos += 1
+        entregado = False
+
+        async def repetir_cuerpo():
+            nonlocal entregado
+            if entregado:
+                return await receive()
+            entregado = True
+            return {"type": "http.request", "body": cuerpo, "more_body": False}
+
+        await app(scope, repetir_cuerpo, send)
+
+    def _ip(self, scope, cabeceras):
+        if self.encabezado_ip:
+            valor = cabeceras.get(self.encabezado_ip)
+            if valor:
+                # El último salto es el que agregó nuestro proxy
+                return valor.rsplit(b",", 1)[-1].strip().decode("latin-1")
+        cliente = scope.get("client")
+        return cliente[0] if cliente else ""
+
+    def _url(self, scope, cabeceras):
+        if self.url_publica:
+            return self.url_publica
+        esquema = cabeceras.get(b"x-forwarded-proto", b"").decode("latin-1") or scope["scheme"]
+        host = cabeceras.get(b"host", b"").decode("latin-1")
+        if not host and scope.get("server"):
+            servidor, puerto = scope["server"]
+            host = servidor if PUERTOS_POR_DEFECTO.get(esquema) == puerto else f"{servidor}:{puerto}"
+        url = f"{esquema}://{host}{scope.get('root_path', '')}{scope['path']}"
+        consulta = scope.get("query_string")
+        return f"{url}?{consulta.decode('latin-1')}" if consulta else url
+
+    async def _leer_cuerpo(self, receive):
+        """El cuerpo completo, o None si pasa de max_bytes o el cliente se fue."""
+        mensaje = await receive()
+        if mensaje["type"] != "http.request":
+            return None
+        cuerpo = mensaje.get("body", b"")
+        if not mensaje.get("more_body"):
+            return cuerpo if len(cuerpo) <= self.max_bytes else None
+        partes = [cuerpo]
+        largo = len(cuerpo)
+        while mensaje.get("more_body"):
+            mensaje = await receive()
+            if mensaje["type"] != "http.request":
+                return None
+            partes.append(mensaje.get("body", b""))
+            largo += len(partes[-1])
+            if largo > self.max_bytes:
+                return None
+        return b"".join(partes)
+
+    async def _fallo(self, send, ip, ahora, motivo, estado):
+        """Rechazo que cuenta contra la IP: con la cubeta vacía queda castigada."""
+        if self.fallos_ip:
+            cubeta = self._ips.get(ip)
+            if cubeta is None:
+                cubeta = self._ips[ip] = CubetaTokens(self.fallos_ip, self.rafaga_ip, ahora)
+            cubeta.tomar(ahora)
+            if cubeta.espera(ahora) > 0:
+                registro.warning("ip_castigada", ip=ip, motivo=motivo)
+        registro.info("webhook_rechazado", ip=ip, motivo=motivo)
+        await self._rechazar(send, motivo, estado)
+
+    async def _rechazar(self, send, motivo, estado, espera=None):
+        self.rechazados[motivo] += 1
+        cabeceras = [(b"content-length", b"0")]
+        if espera is not None:
+            cabeceras.append((b"retry-after", str(max(1, math.ceil(espera))).encode()))
+        await send({"type": "http.response.start", "status": estado, "headers": cabeceras})
+        await send({"type": "http.response.body", "body": b""})
+
+    def _podar(self, ahora):
+        # Olvidar IPs y remitentes con la cubeta llena (como si nunca hubieran llegado)
+        self._ultima_poda = ahora
+        for cubetas in (self._ips, self._remitentes):
+            for clave in [c for c, cubeta in cubetas.items() if cubeta.llena(ahora)]:
+                del cubetas[clave]
+
+    def estadisticas(self):
+        ahora = time.monotonic()
+        return {
+            "firma_validada": self.validador is not None,
+            "admitidos": self.admitidos,
+            "rechazados": dict(self.rechazados),
+            "reintentos_twilio": self.reintentos,
+            "ips_castigadas": sum(1 for c in self._ips.values() if c.espera(ahora) > 0),
+            "remitentes_seguidos": len(self._remitentes),
+            "firmas_recordadas": len(self._firmas),
+        }
@@ -0,0 +1,120 @@
+"""Modo ingesta: el webhook solo encola y responde; el procesamiento va aparte.
+
+Twilio corta el webhook a los 15 segundos y lo reintenta. En una ráfaga,
+procesar cada mensaje antes de responder alarga las respuestas hasta que
+llegan los reintentos, que suman más carga. En modo ingesta el webhook
+valida el formulario, encola el mensaje y devuelve un TwiML vacío; un pool
+de corrutinas trabajadoras corre `procesar` y la respuesta sale por la API
+de mensajes, igual que los pasos de los ejercicios.
+
+Como en PipelineEnvios, cada remitente cae siempre en la misma cola, así
+que sus mensajes se procesan en el orden en que llegaron. Las colas son
+acotadas: si la del remitente está llena, `encolar` devuelve False y el
+webhook responde 503 con Retry-After en lugar de acumular sin límite. Al
+detener se dejan de aceptar mensajes y se drena lo encolado (con un límite
+de tiempo).
+"""
+import asyncio
+import time
+import zlib
+
+from perfilado import Trazas
+from registro import obtener_registro
+
+registro = obtener_registro("ingesta")
+
+
+class ColaIngesta:
+    """Colas acotadas por remitente y `trabajadores` corrutinas que las atienden.
+
+    `procesar(remitente, *datos)` es la corrutina que atiende cada mensaje;
+    con `trazas` (perfilado.Trazas activas) cada mensaje es una traza "ingesta"
+    que incluye su espera en la cola.
+    """
+
+    def __init__(self, procesar, trabajadores=8, capacidad=1000, histograma_espera=None, trazas=None):
+        self.procesar = procesar
+        self.trabajadores = trabajadores
+        self.capacidad = capacidad
+        self.histograma_espera = histograma_espera
+        self.trazas = trazas if trazas is not None else Trazas()
+        self.aceptando = False
+        self._colas = []
+        self._tareas = []
+
+        # Métricas (solo se modifican desde el hilo del event loop)
+        self.encolados = 0
+        self.procesados = 0
+        self.rechazados = 0
+        self.errores = 0
+        self.descartados = 0  # quedaban en cola al vencer el drenaje
+        self.max_espera = 0.0
+
+    async def iniciar(self):
+        if self._tareas:
+            return
+        capacidad_por_cola = max(1, self.capacidad // self.trabajadores)
+        self._colas = [asyncio.Queue(maxsize=capacidad_por_cola) for _ in range(self.trabajadores)]
+        self._tareas = [
+            asyncio.create_task(self._trabajador(cola), name=f"ingesta-{i}")
+            for i, cola in enumerate(self._colas)
+        ]
+        self.aceptando = True
+
+    async def detener(self, limite=10.0):
+        """Deja de aceptar mensajes y espera hasta `limite` segundos a que se procesen los encolados."""
+        self.aceptando = False
+        try:
+            await asyncio.wait_for(asyncio.gather(*(cola.join() for cola in self._colas)), limite)
+        except asyncio.TimeoutError:
+            self.descartados = sum(cola.qsize() for cola in self._colas)
+            registro.error("drenaje_incompleto", descartados=self.descartados, limite_s=limite)
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        self._colas = []
+
+    def encolar(self, remitente, *datos):
+        """Encola el mensaje sin esperar. False si no hay lugar (o ya no se aceptan mensajes)."""
+        if not self.aceptando:
+            self.rechazados += 1
+            return False
+        cola = self._colas[zlib.crc32(remitente.encode()) % len(self._colas)]
+        try:
+            cola.put_nowait((time.perf_counter(), remitente, datos))
+        except asyncio.QueueFull:
+            self.rechazados += 1
+            return False
+        self.encolados += 1
+        return True
+
+    async def _trabajador(self, cola):
+        while True:
+            encolado, remitente, datos = await cola.get()
+            espera = time.perf_counter() - encolado
+            self.max_espera = max(self.max_espera, espera)
+            if self.histograma_espera is not None:
+                self.histograma_espera.observar(espera)
+            abierta = self.trazas.iniciar("ingesta", de=remitente, espera_ms=round(espera * 1000, 2))
+            try:
+                await self.procesar(remitente, *datos)
+                self.procesados += 1
+            except Exception:
+                self.errores += 1
+                registro.error("mensaje_no_procesado", exc_info=True, de=remitente)
+            finally:
+                self.trazas.terminar(abierta)
+                cola.task_done()
+
+    def estadisticas(self):
+        return {
+            "trabajadores": self.trabajadores,
+            "en_cola": sum(cola.qsize() for cola in self._colas),
+            "encolados": self.encolados,
+            "procesados": self.procesados,
+            "rechazados": self.rechazados,
+            "errores": self.errores,
+            "descartados": self.descartados,
+            "max_espera_ms": round(self.max_espera * 1000, 2),
+        }
@@ -0,0 +1,201 @@
+"""Clasificador de intenciones del texto entrante.
+
+Se construye una vez por cada carga de menu.json (suscriptor de
+AlmacenContenido) y clasifica cada mensaje en un solo paso:
+
+1. Búsqueda exacta del texto tal cual llegó ("1", "menu", "hola"...), que
+   es lo más frecuente. Un texto mucho más largo (o con muchas más
+   palabras) que cualquier entrada de la tabla, como las respuestas libres
+   de los ejercicios, no tiene intención y se descarta sin normalizar.
+2. Si no está, se normaliza: sin tildes ni emoji (NFKD a ASCII), en
+   minúsculas, signos como espacios y espacios simples, todo con
+   operaciones en C (una tabla de bytes.translate). Con más palabras que
+   la entrada más larga ya no hay intención posible. Si no, búsqueda en la tabla de intenciones
+   normalizada (incluye "menú", "1.", "uno", "opción 2", el nombre y la
+   categoría de cada opción). Si falla, se colapsan las letras repetidas
+   ("ayudaaa" → "ayuda") y se vuelve a buscar. El resultado de cada texto
+   corto ya visto se recuerda (las mismas variantes llegan una y otra vez).
+3. Si tampoco está, solo para las palabras de urgencia: distancia de
+   edición 1 por vecindario de borrados (un error de tipeo en "auxilio"
+   sigue siendo urgente).
+
+Devuelve (intencion, valor); `valor` es el id de la opción para OPCION y
+el número para NUMERO.
+"""
+import unicodedata
+
+COMANDO = "comando"
+SALUDO = "saludo"
+URGENTE = "urgente"
+OPCION = "opcion"
+NUMERO = "numero"
+OTRO = "otro"
+
+COMANDOS = ("menu", "salir", "cancelar", "stop")
+SALUDOS = ("hola", "inicio", "start", "hi", "hello", "buenas", "buenos dias", "buenas tardes", "buenas noches")
+URGENTES = ("urgente", "ayuda", "sos", "emergency", "emergencia", "auxilio", "ayudame", "necesito ayuda")
+NUMEROS_PALABRA = ("cero", "uno", "dos", "tres", "cuatro", "cinco", "seis", "siete", "ocho", "nueve", "diez")
+MAX_RECIENTES = 4096
+MARGEN_PALABRAS = 3  # espacios de más tolerados antes de normalizar ("hola 👋 👋", "1 .")
+LARGO_MINIMO_DIFUSO = 5  # "sos" o "hola" con un error ya son otra palabra
+
+DOBLES = tuple(c + c for c in "abcdefghijklmnopqrstuvwxyz")
+# bytes.translate en una pasada: mayúsculas → minúsculas, signos → espacio
+TABLA_ASCII = bytes(
+    c + 32 if 65 <= c <= 90 else (c if chr(c).isalnum() or c >= 128 else 32)
+    for c in range(256)
+)
+
+
+def normalizar_base(texto):
+    """Sin tildes, emoji ni signos, en minúsculas y con espacios simples."""
+    if texto.isascii():
+        datos = texto.encode("ascii")
+    else:
+        datos = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore")
+    return b" ".join(datos.translate(TABLA_ASCII).split()).decode("ascii")
+
+
+def colapsar(texto):
+    """"ayudaaa" → "ayuda" (más rápido que una regex con referencia hacia atrás en textos cortos)."""
+    for doble in DOBLES:
+        while doble in texto:
+            texto = texto.replace(doble, doble[0])
+    return texto
+
+
+def normalizar(texto):
+    return colapsar(normalizar_base(texto))
+
+
+def _borrados(palabra):
+    return {palabra[:i] + palabra[i + 1:] for i in range(len(palabra))}
+
+
+class ClasificadorIntenciones:
+
+    def __init__(self):
+        self._exactas = {}  # texto tal cual -> (intencion, valor)
+        self._normalizadas = {}  # texto normalizado -> (intencion, valor)
+        self._difusas = {}  # palabra urgente o uno de sus borrados -> intención
+        self._largo_maximo = 0  # más largo que esto no puede ser ninguna entrada
+        self._palabras_maximo = 0
+        self._recientes = {}  # texto tal cual -> intención ya calculada (acotado)
+        # Métricas
+        self.exactas = 0
+        self.recientes = 0
+        self.normalizadas = 0
+        self.difusas = 0
+        self.sin_intencion = 0
+
+    def construir(self, contenido):
+        self.preparar(contenido)()
+
+    def preparar(self, contenido):
+        """Suscriptor de AlmacenContenido: arma las tablas con el menú nuevo y devuelve cómo publicarlas."""
+        normalizadas = {}
+
+        def agregar(texto, intencion, valor=None):
+            normalizadas.setdefault(normalizar(texto), (intencion, valor))
+
+        # El orden da la prioridad si dos entradas normalizan igual
+        for texto in COMANDOS:
+            agregar(texto, COMANDO)
+        for texto in SALUDOS:
+            agregar(texto, SALUDO)
+        for texto in URGENTES:
+            agregar(texto, URGENTE)
+        for opcion in contenido.menu["menu_principal"]["opciones"]:
+            ident = opcion["id"]
+            for texto in (str(ident), f"opcion {ident}", opcion["nombre"], opcion["categoria"]):
+                agregar(texto, OPCION, ident)
+            if ident < len(NUMEROS_PALABRA):
+                agregar(NUMEROS_PALABRA[ident], OPCION, ident)
+                agregar(f"opcion {NUMEROS_PALABRA[ident]}", OPCION, ident)
+
+        difusas = {}
+        for texto in URGENTES:
+            palabra = normalizar(texto)
+            if len(palabra) >= LARGO_MINIMO_DIFUSO:
+                for variante in _borrados(palabra) | {palabra}:
+                    difusas.setdefault(variante, (URGENTE, None))
+
+        # Lo que llega tal cual con más frecuencia: claves en minúscula y mayúscula inicial
+        exactas = {}
+        for clave, intencion in normalizadas.items():
+            for variante in (clave, clave.capitalize(), clave.upper()):
+                exactas.setdefault(variante, intencion)
+
+        # Margen para emoji, signos, espacios y letras repetidas
+        largo_maximo = 2 * max(map(len, normalizadas)) + 8
+        palabras_maximo = max(clave.count(" ") for clave in normalizadas)
+
+        def publicar():
+            self._difusas = difusas
+            self._normalizadas = normalizadas
+            self._exactas = exactas
+            self._recientes = {}
+            self._largo_maximo = largo_maximo
+            self._palabras_maximo = palabras_maximo
+        return publicar
+
+    def clasificar(self, texto):
+        """(intencion, valor) del texto del usuario."""
+        intencion = self._exactas.get(texto)
+        if intencion is not None:
+            self.exactas += 1
+            return intencion
+
+        if len(texto) > self._largo_maximo or texto.count(" ") > self._palabras_maximo + MARGEN_PALABRAS:
+            self.sin_intencion += 1
+            return (OTRO, None)
+
+        # Las variantes se repiten mucho ("Menú", "1.", "hola 👋"): se recuerdan
+        intencion = self._recientes.get(texto)
+        if intencion is not None:
+            self.recientes += 1
+            return intencion
+        if len(self._recientes) >= MAX_RECIENTES:
+            self._recientes.clear()
+        intencion = self._recientes[texto] = self._clasificar_normalizado(texto)
+        return intencion
+
+    def _clasificar_normalizado(self, texto):
+        normal = normalizar_base(texto)
+        if normal.count(" ") > self._palabras_maximo:
+            self.sin_intencion += 1
+            return (OTRO, None)
+        intencion = self._normalizadas.get(normal)
+        if intencion is None:
+            normal = colapsar(normal)
+            intencion = self._normalizadas.get(normal)
+        if intencion is not None:
+            self.normalizadas += 1
+            return intencion
+        if normal.isdigit():
+            self.normalizadas += 1
+            return (NUMERO, int(normal))
+
+        if len(normal) >= LARGO_MINIMO_DIFUSO - 1 and len(normal) <= 16:
+            intencion = self._difusas.get(normal)
+            if intencion is None:
+                for variante in _borrados(normal):
+                    intencion = self._difusas.get(variante)
+                    if intencion is not None:
+                        break
+            if intencion is not None:
+                self.difusas += 1
+                return intencion
+
+        self.sin_intencion += 1
+        return (OTRO, None)
+
+    def estadisticas(self):
+        return {
+            "entradas": len(self._normalizadas),
+            "exactas": self.exactas,
+            "recientes": self.recientes,
+            "normalizadas": self.normalizadas,
+            "difusas": self.difusas,
+            "sin_intencion": self.sin_intencion,
+        }
@@ -0,0 +1,365 @@
+"""Lanzador de producción: un proceso maestro y varios workers de uvicorn (prefork).
+
+    python lanzador.py --host 0.0.0.0 --puerto 8000 --workers 4
+
+(o HOST, PORT y WORKERS en el entorno; por defecto, un worker por núcleo).
+
+El maestro importa la app y carga el contenido antes de crear los workers
+con fork(): todos comparten esas páginas copy-on-write en lugar de tener
+cada uno su copia (gc.freeze() evita que el recolector las ensucie al
+recorrerlas). El maestro abre el puerto público y un socket unix por
+worker, y los workers los heredan ya abiertos: un worker que se reinicia
+no cierra nada y las conexiones esperan en el backlog a su reemplazo.
+
+Cada usuario pertenece a un worker (reparto.py); lo que llega a otro se le
+reenvía por su socket unix. Así las sesiones en memoria, el lock por
+usuario, el planificador y el diario (uno por worker) siguen siendo de un
+solo proceso. Si la app define `precargar(workers, en_caliente)` se llama
+en el maestro antes de crear workers (con `en_caliente` si los anteriores
+siguen atendiendo, en el reinicio escalonado: no debe tocar sus archivos),
+y `configurar_worker(indice, sockets)` en cada worker después.
+
+Señales al maestro:
+- SIGTERM / SIGINT: apagado ordenado; cada worker termina lo que tiene en
+  curso y detiene sus servicios (el shutdown de la app).
+- SIGHUP: reinicio escalonado, de a un worker: se apaga, arranca el nuevo
+  (con el contenido releído) y se espera su /listo antes del siguiente.
+- SIGUSR2: recarga del código: se apagan los workers y el maestro se
+  reemplaza a sí mismo (exec) con el puerto abierto; mientras tanto las
+  conexiones esperan en el backlog.
+Un worker que muere se reemplaza (esperando un segundo si murió al arrancar).
+
+Solo POSIX (usa fork); en Windows: `python whatsapp_bot.py`, un proceso.
+"""
+import argparse
+import asyncio
+import gc
+import importlib
+import os
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+import uvicorn
+
+from registro import detener_registro, obtener_registro
+
+registro = obtener_registro("lanzador")
+
+SENALES = ("SIGTERM", "SIGINT", "SIGHUP", "SIGUSR2", "SIGCHLD")
+VARIABLE_FD = "LANZADOR_FD"  # el puerto público abierto, a través de un exec
+
+
+def abrir_puerto(host, puerto, backlog):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, puerto))
+    sock.listen(backlog)
+    return sock
+
+
+def abrir_socket_unix(ruta, backlog):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(ruta)
+    sock.listen(backlog)
+    return sock
+
+
+def consultar_listo(ruta, limite):
+    """True si el worker de ese socket responde 200 a GET /listo antes de `limite` segundos."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(limite)
+            sock.connect(ruta)
+            sock.sendall(b"GET /listo HTTP/1.1\r\nhost: lanzador\r\nconnection: close\r\n\r\n")
+            return sock.recv(64).startswith(b"HTTP/1.1 200")
+    except OSError:
+        return False
+
+
+class ServidorWorker(uvicorn.Server):
+    """uvicorn.Server que al apagarse deja de aceptar un momento antes de cerrar las conexiones.
+
+    Una conexión aceptada justo antes del SIGTERM puede no haber mandado
+    todavía su petición, y uvicorn la cerraría sin responder. Los demás
+    workers siguen aceptando del mismo socket mientras tanto.
+    """
+
+    async def shutdown(self, sockets=None):
+        for servidor in self.servers:
+            servidor.close()
+        await asyncio.sleep(0.2)
+        await super().shutdown(sockets)
+
+
+class Lanzador:
+
+    def __init__(self, app="whatsapp_bot:app", host="0.0.0.0", puerto=8000, workers=1, gracia=30.0,
+                 backlog=2048, nivel_uvicorn="warning"):
+        self.ruta_app = app
+        self.host = host
+        self.puerto = puerto
+        self.workers = workers
+        self.gracia = gracia
+        self.backlog = backlog
+        self.nivel_uvicorn = nivel_uvicorn
+        self.modulo = None
+        self.app = None
+        self.publico = None
+        self.directorio = None
+        self.sockets = []  # ruta del socket unix de cada worker
+        self.internos = []
+        self.pids = [None] * workers  # pid del worker de cada partición
+        self.arranques = [0.0] * workers
+        self._hijos = {}  # pid -> partición
+        self._detenidos = set()  # pids a los que se les pidió terminar
+        self._senales = []
+        self._despertador = None
+
+        # Métricas
+        self.reinicios = 0
+        self.caidas = 0
+
+    # Maestro
+
+    def preparar(self):
+        """Importa la app, abre los sockets y deja todo listo para el fork."""
+        gc.disable()  # hasta el fork: que no se reorganice nada de lo que se va a compartir
+        nombre, _, atributo = self.ruta_app.partition(":")
+        self.modulo = importlib.import_module(nombre)
+        self.app = getattr(self.modulo, atributo or "app")
+        self._precargar(en_caliente=False)
+
+        heredado = os.environ.pop(VARIABLE_FD, None)
+        if heredado is not None:
+            self.publico = socket.socket(fileno=int(heredado))
+        else:
+            self.publico = abrir_puerto(self.host, self.puerto, self.backlog)
+        self.publico.set_inheritable(True)
+        # Los sockets entre workers, en un directorio que solo ve este usuario
+        self.directorio = tempfile.mkdtemp(prefix="aiuda-lanzador-")
+        self.sockets = [os.path.join(self.directorio, f"worker-{i}.sock") for i in range(self.workers)]
+        self.internos = [abrir_socket_unix(ruta, self.backlog) for ruta in self.sockets]
+
+    def _precargar(self, en_caliente):
+        precargar = getattr(self.modulo, "precargar", None)
+        if precargar is not None:
+            precargar(self.workers, en_caliente)
+        # Lo cargado hasta aquí queda fuera del recolector: sus páginas no se copian en los workers
+        gc.freeze()
+
+    def correr(self):
+        self.preparar()
+        lectura, escritura = os.pipe()
+        os.set_blocking(escritura, False)
+        self._despertador = lectura
+        signal.set_wakeup_fd(escritura)
+        for nombre in SENALES:
+            signal.signal(getattr(signal, nombre), self._anotar_senal)
+
+        for indice in range(self.workers):
+            self._crear(indice)
+        registro.info("lanzador_iniciado", host=self.host, puerto=self.puerto, workers=self.workers,
+                      pid=os.getpid())
+
+        while True:
+            select.select([lectura], [], [], 1.0)
+            try:
+                os.read(lectura, 4096)
+            except BlockingIOError:
+                pass
+            self._recoger()
+            while self._senales:
+                senal = self._senales.pop(0)
+                if senal in (signal.SIGTERM, signal.SIGINT):
+                    self.apagar()
+                    return
+                if senal == signal.SIGHUP:
+                    self.reiniciar()
+                elif senal == signal.SIGUSR2:
+                    self.reemplazar()
+            self._reponer()
+
+    def _anotar_senal(self, senal, frame):
+        # Solo anotar: el bucle principal la atiende al despertar
+        if senal != signal.SIGCHLD:
+            self._senales.append(senal)
+
+    def _crear(self, indice):
+        pid = os.fork()
+        if pid == 0:
+            codigo = 1
+            try:
+                self._worker(indice)
+                codigo = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                detener_registro()
+                sys.stdout.flush()
+                os._exit(codigo)
+        self.pids[indice] = pid
+        self.arranques[indice] = time.monotonic()
+        self._hijos[pid] = indice
+        registro.info("worker_creado", worker=indice, pid=pid)
+
+    def _recoger(self):
+        """Recoge los workers que terminaron; los que nadie detuvo quedan para reponer."""
+        while self._hijos:
+            try:
+                pid, estado = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            indice = self._hijos.pop(pid, None)
+            if indice is None:
+                continue
+            if pid in self._detenidos:
+                self._detenidos.discard(pid)
+            else:
+                self.caidas += 1
+                registro.error("worker_caido", worker=indice, pid=pid, estado=os.waitstatus_to_exitcode(estado))
+            if self.pids[indice] == pid:
+                self.pids[indice] = None
+
+    def _reponer(self):
+        for indice, pid in enumerate(self.pids):
+            # Si murió al arrancar (contenido inválido, puerto...) no reintentar en un bucle apretado
+            if pid is None and time.monotonic() - self.arranques[indice] > 1.0:
+                self._crear(indice)
+
+    def _detener(self, pids):
+        """SIGTERM y esperar; el que siga vivo después de `gracia` + 5 s recibe SIGKILL."""
+        for pid in pids:
+            self._detenidos.add(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        limite = time.monotonic() + self.gracia + 5
+        while True:
+            self._recoger()
+            vivos = [pid for pid in pids if pid in self._hijos]
+            if not vivos:
+                return
+            if time.monotonic() > limite:
+                for pid in vivos:
+                    registro.warning("worker_forzado", pid=pid)
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                limite = float("inf")
+            time.sleep(0.05)
+
+    def _liberar(self, indice):
+        pid = self.pids[indice]
+        if pid is not None:
+            self._detener([pid])
+            self.pids[indice] = None
+
+    def reiniciar(self):
+        """SIGHUP: de a un worker, para que siempre atiendan los demás."""
+        registro.info("reinicio_escalonado", workers=self.workers)
+        # Los workers nuevos heredan el contenido como esté ahora en disco; los viejos siguen escribiendo
+        # sus diarios hasta que se apaga cada uno, así que no se reparten (la cantidad es la misma)
+        self._precargar(en_caliente=True)
+        for indice in range(self.workers):
+            self._liberar(indice)
+            self._crear(indice)
+            # El socket del worker queda escuchando en el maestro: la consulta espera a que acepte
+            if not consultar_listo(self.sockets[indice], 60.0):
+                registro.error("worker_no_listo", worker=indice)
+                return
+            self.reinicios += 1
+        registro.info("reinicio_terminado", workers=self.workers)
+
+    def apagar(self):
+        registro.info("lanzador_apagando", workers=self.workers)
+        self._detener([pid for pid in self.pids if pid is not None])
+        shutil.rmtree(self.directorio, ignore_errors=True)
+        registro.info("lanzador_detenido")
+
+    def reemplazar(self):
+        """SIGUSR2: otro maestro con el código nuevo, sobre el mismo puerto abierto."""
+        registro.info("lanzador_reemplazando")
+        self._detener([pid for pid in self.pids if pid is not None])
+        shutil.rmtree(self.directorio, ignore_errors=True)
+        os.environ[VARIABLE_FD] = str(self.publico.fileno())
+        signal.set_wakeup_fd(-1)
+        detener_registro()
+        os.execv(sys.executable, sys.orig_argv)
+
+    # Worker
+
+    def _worker(self, indice):
+        signal.set_wakeup_fd(-1)
+        os.close(self._despertador)
+        for nombre in SENALES:
+            signal.signal(getattr(signal, nombre), signal.SIG_DFL)
+        # Ctrl+C llega a todo el grupo: el worker se entera por el maestro, una sola vez
+        os.setpgid(0, 0)
+        gc.enable()
+        for otro, sock in enumerate(self.internos):
+            if otro != indice:
+                sock.close()
+
+        configurar = getattr(self.modulo, "configurar_worker", None)
+        if configurar is not None:
+            configurar(indice, self.sockets)
+        servidor = ServidorWorker(uvicorn.Config(
+            self.app, lifespan="on", log_level=self.nivel_uvicorn, access_log=False,
+            timeout_graceful_shutdown=self.gracia,
+        ))
+        maestro = os.getppid()
+
+        def vigilar_maestro():
+            # Si el maestro muere sin apagar a nadie (SIGKILL), el worker no queda huérfano con el puerto
+            while not servidor.should_exit:
+                if os.getppid() != maestro:
+                    servidor.should_exit = True
+                time.sleep(1.0)
+
+        threading.Thread(target=vigilar_maestro, name="vigilante-maestro", daemon=True).start()
+        servidor.run(sockets=[self.publico, self.internos[indice]])
+
+
+def nucleos():
+    """Núcleos que puede usar este proceso (macOS no tiene sched_getaffinity)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def main():
+    if not hasattr(os, "fork"):
+        sys.exit("lanzador.py necesita fork() (Linux o macOS); en Windows: python whatsapp_bot.py")
+    parser = argparse.ArgumentParser(description="Maestro + workers de uvicorn con la app precargada")
+    parser.add_argument("app", nargs="?", default="whatsapp_bot:app", help="módulo:atributo de la app ASGI")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--puerto", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", "0")) or None,
+                        help="procesos que atienden (por defecto, uno por núcleo)")
+    parser.add_argument("--gracia", type=float, default=float(os.getenv("LANZADOR_GRACIA", "30")),
+                        help="segundos para terminar lo que está en curso al apagar o reiniciar un worker")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--nivel-uvicorn", default="warning")
+    args = parser.parse_args()
+    if not args.workers:
+        args.workers = nucleos()
+
+    # La app se importa desde el directorio actual, como con `uvicorn módulo:app`
+    sys.path.insert(0, os.getcwd())
+    print(f"🚀 AIuda: {args.app} en http://{args.host}:{args.puerto} con {args.workers} worker(s)")
+    Lanzador(args.app, args.host, args.puerto, args.workers, args.gracia, args.backlog, args.nivel_uvicorn).correr()
+
+
+if __name__ == "__main__":
+    main()
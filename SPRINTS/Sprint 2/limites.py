@@ -0,0 +1,54 @@
+"""Límites de tasa para los envíos salientes.
+
+Twilio y WhatsApp limitan por número remitente (mensajes por segundo) y
+por destinatario. Con una cubeta de tokens por cada uno, el pipeline envía
+a ritmo parejo cerca del límite en lugar de mandar ráfagas que terminan en
+429. Solo se usan desde el hilo del event loop, sin locks.
+"""
+import random
+
+
+class CubetaTokens:
+    """`tasa` tokens por segundo, con hasta `rafaga` acumulados.
+
+    Los tiempos los pasa quien llama (loop.time()), así se puede probar sin
+    relojes reales.
+    """
+
+    __slots__ = ("tasa", "rafaga", "tokens", "_ultimo")
+
+    def __init__(self, tasa, rafaga, ahora=0.0):
+        self.tasa = tasa
+        self.rafaga = max(1.0, rafaga)
+        self.tokens = self.rafaga
+        self._ultimo = ahora
+
+    def _recargar(self, ahora):
+        if ahora > self._ultimo:
+            self.tokens = min(self.rafaga, self.tokens + (ahora - self._ultimo) * self.tasa)
+            self._ultimo = ahora
+
+    def espera(self, ahora):
+        """Segundos hasta que haya un token (0 si ya hay), sin consumirlo."""
+        self._recargar(ahora)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.tasa
+
+    def tomar(self, ahora):
+        """Consume un token aunque no haya (queda en deuda). Devuelve la espera que correspondía."""
+        espera = self.espera(ahora)
+        self.tokens -= 1
+        return espera
+
+    def vaciar(self, ahora):
+        """Tras un 429: el proveedor dice que vamos rápido, empezar de cero tokens."""
+        self._recargar(ahora)
+        self.tokens = min(self.tokens, 0.0)
+
+    def llena(self, ahora):
+        self._recargar(ahora)
+        return self.tokens >= self.rafaga
+
+
+def espera_reintento(intento, base=0.5, maximo=30.0):
+    """Backoff exponencial con jitter completo: uniforme entre 0 y base·2^intento."""
+    return random.uniform(0, min(maximo, base * 2 ** intento))
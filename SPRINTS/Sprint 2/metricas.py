@@ -0,0 +1,166 @@
+"""Métricas operativas en formato de texto de Prometheus.
+
+Los contadores e histogramas se modifican solo desde el hilo del event
+loop (el webhook, el planificador y los trabajadores de envío son
+corrutinas), así que no llevan locks: incrementar es una búsqueda en un
+dict y una suma. El endpoint /metrics también corre en el loop, por lo que
+lee un estado consistente.
+
+Lo que ya cuentan otros módulos (pasos pendientes, recargas, tareas...) no
+se duplica: se registra un medidor que lo lee recién al exponer.
+"""
+from bisect import bisect_left
+import time
+
+# Límites de los histogramas de latencia, en segundos
+LIMITES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(nombres, valores, extra=""):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._series = {}  # valores de etiquetas -> total
+
+    def inc(self, *valores, n=1):
+        self._series[valores] = self._series.get(valores, 0) + n
+
+    def valor(self, *valores):
+        return self._series.get(valores, 0)
+
+    def lineas(self):
+        for valores, total in sorted(self._series.items()):
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {_numero(total)}"
+
+
+class Histograma:
+
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        # valores de etiquetas -> [conteo por cubeta..., conteo > último límite, suma]
+        self._series = {}
+
+    def observar(self, valor, *valores):
+        serie = self._series.get(valores)
+        if serie is None:
+            serie = self._series[valores] = [0] * (len(self.limites) + 1) + [0.0]
+        serie[bisect_left(self.limites, valor)] += 1
+        serie[-1] += valor
+
+    def lineas(self):
+        for valores, serie in sorted(self._series.items()):
+            acumulado = 0
+            for limite, cantidad in zip(self.limites + (float("inf"),), serie):
+                acumulado += cantidad
+                le = f'le="{_numero(float(limite))}"'
+                yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, le)} {acumulado}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {_numero(serie[-1])}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {acumulado}"
+
+
+class Medidor:
+    """Valor leído al exponer. `leer()` devuelve un número o un dict {valores de etiquetas: número}."""
+
+    def __init__(self, nombre, ayuda, leer, etiquetas=(), tipo="gauge"):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.leer = leer
+        self.etiquetas = tuple(etiquetas)
+        self.tipo = tipo
+
+    def lineas(self):
+        valor = self.leer()
+        if not isinstance(valor, dict):
+            valor = {(): valor}
+        for valores, numero in sorted(valor.items()):
+            if not isinstance(valores, tuple):
+                valores = (valores,)
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {_numero(numero)}"
+
+
+class RegistroMetricas:
+
+    def __init__(self):
+        self._metricas = {}
+
+    def _agregar(self, metrica):
+        if metrica.nombre in self._metricas:
+            raise ValueError(f"métrica duplicada: {metrica.nombre}")
+        self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._agregar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        return self._agregar(Histograma(nombre, ayuda, etiquetas, limites))
+
+    def medidor(self, nombre, ayuda, leer, etiquetas=(), tipo="gauge"):
+        return self._agregar(Medidor(nombre, ayuda, leer, etiquetas, tipo))
+
+    def exponer(self):
+        """Todas las métricas en formato de texto de Prometheus."""
+        salida = []
+        for metrica in self._metricas.values():
+            salida.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            salida.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            salida.extend(metrica.lineas())
+        salida.append("")
+        return "\n".join(salida)
+
+
+class MedirRutas:
+    """Middleware ASGI: latencia de cada petición HTTP por ruta y estado de la sesión.
+
+    La ruta es el path si es una ruta conocida de la app ("otra" si no, para
+    no crear una serie por cada URL inventada). El estado lo deja el
+    endpoint en `request.state.estado_sesion`; "-" si no aplica.
+    """
+
+    def __init__(self, app, histograma):
+        self.app = app
+        self.histograma = histograma
+        self._rutas = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if self._rutas is None:
+            self._rutas = frozenset(getattr(r, "path", None) for r in scope["app"].routes)
+        estado = scope.setdefault("state", {})
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            ruta = scope["path"] if scope["path"] in self._rutas else "otra"
+            self.histograma.observar(time.perf_counter() - inicio, ruta, estado.get("estado_sesion", "-"))
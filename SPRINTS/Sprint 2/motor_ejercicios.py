@@ -0,0 +1,145 @@
+"""Motor genérico de ejercicios definido por ejercicios.json.
+
+Cada ejercicio se compila una sola vez (al cargar o recargar el contenido)
+en un Programa inmutable. Los pasos se agrupan en tramos: un tramo es todo
+lo que se envía seguido hasta llegar a un paso interactivo (que espera la
+respuesta del usuario) o al cierre. Cada tramo ya es un Guion listo para el
+planificador, compartido por todos los usuarios que hacen ese ejercicio.
+
+Tipos de paso en ejercicios.json:
+- "temporizado": envía `mensaje` tras `espera` segundos.
+- "interactivo": envía `mensaje` tras `espera` y espera una respuesta; al
+  llegar, envía `respuesta` (con {respuesta} reemplazado por el texto del
+  usuario) tras `espera_respuesta` y sigue con el próximo tramo.
+Un ejercicio con ambos tipos es mixto.
+
+Cada guion lleva una `ref` (ejercicio, tramo, respuesta) para que
+el diario pueda reconstruirlo tras un reinicio con el contenido vigente.
+"""
+from contenido import ErrorContenido
+from planificador import Guion
+
+TIPOS_PASO = ("temporizado", "interactivo")
+ESTADOS_FINALES = ("esperando_feedback", "menu")
+MARCADOR_RESPUESTA = "{respuesta}"
+
+
+class Programa:
+    """Ejercicio compilado.
+
+    `guiones[k]` es el tramo k. Los tramos 0..n-1 terminan esperando la
+    respuesta interactiva k+1; el último termina con el cierre.
+    `respuestas[k]` es (espera, prefijo, sufijo) del eco a la respuesta k+1.
+    """
+
+    __slots__ = ("nombre", "introduccion", "guiones", "respuestas", "estado_final")
+
+    def __init__(self, nombre, introduccion, guiones, respuestas, estado_final):
+        self.nombre = nombre
+        self.introduccion = introduccion
+        self.guiones = guiones
+        self.respuestas = respuestas
+        self.estado_final = estado_final
+
+    @property
+    def interactivo(self):
+        return bool(self.respuestas)
+
+    def guion_respuesta(self, paso, texto):
+        """Guion que responde a la respuesta del paso interactivo `paso` (1..n) y sigue."""
+        espera, prefijo, sufijo = self.respuestas[paso - 1]
+        siguiente = self.guiones[paso]
+        return Guion(
+            siguiente.nombre,
+            ((espera, prefijo + texto + sufijo),) + siguiente.pasos,
+            siguiente.al_terminar,
+            (self.nombre, paso, texto),
+        )
+
+
+def _numero(valor, donde):
+    if not isinstance(valor, (int, float)) or valor < 0:
+        raise ErrorContenido(f"ejercicios.json: {donde} debe ser un número >= 0")
+    return float(valor)
+
+
+def compilar_programa(nombre, definicion, al_terminar_tramo):
+    """Compila un ejercicio. `al_terminar_tramo(user_id, programa, indice)` cierra cada tramo."""
+    pasos = definicion.get("pasos", [])
+    estado_final = definicion.get("al_terminar", "esperando_feedback")
+    if estado_final not in ESTADOS_FINALES:
+        raise ErrorContenido(f"ejercicios.json: '{nombre}' tiene al_terminar inválido: {estado_final}")
+
+    tramos = [[]]
+    respuestas = []
+    for i, paso in enumerate(pasos, start=1):
+        donde = f"'{nombre}' paso {i}"
+        tipo = paso.get("tipo", "temporizado")
+        if tipo not in TIPOS_PASO:
+            raise ErrorContenido(f"ejercicios.json: {donde} tiene tipo desconocido: {tipo}")
+        if not isinstance(paso.get("mensaje"), str):
+            raise ErrorContenido(f"ejercicios.json: {donde} necesita 'mensaje'")
+        tramos[-1].append((_numero(paso.get("espera", 0), f"{donde}.espera"), paso["mensaje"]))
+        if tipo == "interactivo":
+            plantilla = paso.get("respuesta", MARCADOR_RESPUESTA)
+            prefijo, marcador, sufijo = plantilla.partition(MARCADOR_RESPUESTA)
+            if not marcador:
+                prefijo, sufijo = plantilla + "\n\n", ""
+            espera = _numero(paso.get("espera_respuesta", 1), f"{donde}.espera_respuesta")
+            respuestas.append((espera, prefijo, sufijo))
+            tramos.append([])
+
+    if definicion.get("cierre"):
+        tramos[-1].append((_numero(definicion.get("espera_cierre", 0), f"'{nombre}'.espera_cierre"),
+                           definicion["cierre"]))
+    if not tramos[-1] and len(tramos) > 1:
+        raise ErrorContenido(f"ejercicios.json: '{nombre}' termina en un paso interactivo sin cierre")
+
+    guiones = []
+    programa = Programa(nombre, definicion["introduccion"], guiones, tuple(respuestas), estado_final)
+    for indice, tramo in enumerate(tramos):
+        guiones.append(Guion(
+            nombre,
+            tramo,
+            lambda user_id, indice=indice: al_terminar_tramo(user_id, programa, indice),
+            (nombre, indice, None),
+        ))
+    programa.guiones = tuple(guiones)
+    return programa
+
+
+class MotorEjercicios:
+    """Programas compilados del contenido vigente; se reemplazan en bloque al recargar."""
+
+    def __init__(self, al_terminar_tramo):
+        self.al_terminar_tramo = al_terminar_tramo
+        self.programas = {}
+
+    def compilar(self, contenido):
+        self.preparar(contenido)()
+
+    def preparar(self, contenido):
+        """Suscriptor de AlmacenContenido: compila todos los ejercicios del contenido nuevo y devuelve cómo publicarlos."""
+        programas = {
+            nombre: compilar_programa(nombre, definicion, self.al_terminar_tramo)
+            for nombre, definicion in (contenido.ejercicios or {}).items()
+        }
+
+        def publicar():
+            self.programas = programas
+        return publicar
+
+    def obtener(self, nombre):
+        return self.programas.get(nombre)
+
+    def reconstruir(self, ref):
+        """Guion de una `ref` anotada en el diario, o None si el ejercicio ya no tiene ese tramo."""
+        nombre, tramo, texto = ref
+        programa = self.programas.get(nombre)
+        if programa is None:
+            return None
+        if texto is None:
+            return programa.guiones[tramo] if 0 <= tramo < len(programa.guiones) else None
+        if 1 <= tramo <= len(programa.respuestas):
+            return programa.guion_respuesta(tramo, texto)
+        return None
@@ -0,0 +1,297 @@
+"""Perfilado bajo demanda y trazas de las peticiones lentas, para producción.
+
+Perfilador: durante N segundos un hilo toma cada `intervalo` la pila del
+hilo del event loop (o de todos los hilos) con sys._current_frames() y
+cuenta cuántas veces aparece cada una. El resultado está en el formato
+"collapsed" de flamegraph.pl / speedscope / inferno: una línea por pila,
+los marcos de afuera hacia adentro separados por ";" y la cantidad de
+muestras al final. Mientras no se pide un perfil no hay ningún hilo ni
+costo; mientras corre, cada muestra cuesta unas decenas de µs.
+
+Trazas: con `activo`, cada petición HTTP y cada tarea de fondo que se
+traza (un paso de un ejercicio, un envío a Twilio) lleva una Traza en un
+ContextVar, y el código marca tramos con `with trazas.tramo("twiml"):` y
+datos con `trazas.anotar(rama="menu")`. Un hilo vigía revisa las trazas
+en curso: a la que pasa de `umbral` segundos le toma en ese momento la
+pila del hilo donde corre (si algo bloquea el event loop, ahí está) y la
+cadena de awaits de su tarea (si espera algo, dónde). Al terminar, las
+lentas se guardan (las últimas `capacidad`) con sus tramos y pilas y se
+registra el evento "peticion_lenta".
+
+Desactivado (lo normal), `tramo()` devuelve siempre el mismo objeto vacío
+y `anotar()` retorna enseguida: una comparación por llamada.
+
+Con varios workers (lanzador.py) cada uno perfila y traza su propio
+proceso; la respuesta dice cuál fue en la cabecera X-Aiuda-Worker.
+"""
+import asyncio
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from registro import obtener_registro
+
+registro = obtener_registro("perfilado")
+
+
+class ErrorPerfil(Exception):
+    """Ya hay un perfil en curso."""
+
+
+def nombre_marco(codigo):
+    return f"{os.path.basename(codigo.co_filename)}:{codigo.co_qualname}"
+
+
+def pila_de(marco):
+    """Marcos de afuera hacia adentro, como "archivo.py:Clase.funcion"."""
+    marcos = []
+    while marco is not None:
+        marcos.append(nombre_marco(marco.f_code))
+        marco = marco.f_back
+    marcos.reverse()
+    return marcos
+
+
+def pila_de_tarea(tarea):
+    """Dónde está suspendida una tarea: la cadena de corrutinas que espera, de afuera hacia adentro."""
+    marcos = []
+    corrutina = tarea.get_coro() if tarea is not None else None
+    while corrutina is not None:
+        codigo = getattr(corrutina, "cr_code", None) or getattr(corrutina, "gi_code", None)
+        marco = getattr(corrutina, "cr_frame", None) or getattr(corrutina, "gi_frame", None)
+        if codigo is not None:
+            marcos.append(f"{nombre_marco(codigo)}:{marco.f_lineno}" if marco is not None else nombre_marco(codigo))
+        corrutina = getattr(corrutina, "cr_await", None) or getattr(corrutina, "gi_yieldfrom", None)
+    return marcos
+
+
+class Perfilador:
+    """Perfiles de muestreo de a uno por vez. muestrear() bloquea: usar con asyncio.to_thread."""
+
+    def __init__(self, max_segundos=60.0):
+        self.max_segundos = max_segundos
+        self._en_curso = threading.Lock()
+        # Métricas
+        self.perfiles = 0
+        self.muestras = 0
+
+    def muestrear(self, segundos, intervalo=0.005, hilo=None):
+        """Pilas colapsadas del hilo `hilo` (o de todos si es None) durante `segundos`.
+
+        Devuelve (texto, muestras). Lanza ErrorPerfil si ya hay otro en curso.
+        """
+        if not 0 < segundos <= self.max_segundos or not 0.001 <= intervalo <= 1:
+            raise ValueError(f"segundos entre 0 y {self.max_segundos:g}, intervalo entre 1 ms y 1 s")
+        if not self._en_curso.acquire(blocking=False):
+            raise ErrorPerfil("ya hay un perfil en curso")
+        try:
+            propio = threading.get_ident()
+            nombres = {t.ident: t.name for t in threading.enumerate()}
+            pilas = Counter()
+            muestras = 0
+            fin = time.monotonic() + segundos
+            while time.monotonic() < fin:
+                for ident, marco in sys._current_frames().items():
+                    if ident == propio or (hilo is not None and ident != hilo):
+                        continue
+                    pilas[(nombres.get(ident, f"hilo-{ident}"), *pila_de(marco))] += 1
+                muestras += 1
+                time.sleep(intervalo)
+        finally:
+            self._en_curso.release()
+        self.perfiles += 1
+        self.muestras += muestras
+        texto = "".join(f"{';'.join(pila)} {cantidad}\n" for pila, cantidad in pilas.most_common())
+        return texto, muestras
+
+    def estadisticas(self):
+        return {"perfiles": self.perfiles, "muestras": self.muestras, "en_curso": self._en_curso.locked()}
+
+
+class Traza:
+    __slots__ = ("nombre", "inicio", "atributos", "tramos", "hilo", "tarea", "pilas", "duracion")
+
+    def __init__(self, nombre, atributos):
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.atributos = atributos
+        self.tramos = []  # (nombre, desde el inicio, duración) en segundos
+        self.hilo = threading.get_ident()
+        try:
+            self.tarea = asyncio.current_task()
+        except RuntimeError:
+            self.tarea = None  # fuera del event loop (endpoint síncrono en el threadpool)
+        self.pilas = None
+        self.duracion = None
+
+    def como_dict(self):
+        return {
+            "nombre": self.nombre,
+            "ms": round(self.duracion * 1000, 2) if self.duracion is not None else None,
+            **self.atributos,
+            "tramos": [{"tramo": nombre, "desde_ms": round(desde * 1000, 2), "ms": round(duracion * 1000, 2)}
+                       for nombre, desde, duracion in self.tramos],
+            "pilas": self.pilas,
+        }
+
+
+class _Tramo:
+    __slots__ = ("traza", "nombre", "inicio")
+
+    def __init__(self, traza, nombre):
+        self.traza = traza
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *error):
+        fin = time.perf_counter()
+        self.traza.tramos.append((self.nombre, self.inicio - self.traza.inicio, fin - self.inicio))
+
+
+class _SinTramo:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *error):
+        return None
+
+
+SIN_TRAMO = _SinTramo()
+
+
+class Trazas:
+
+    def __init__(self, activo=False, umbral=1.0, capacidad=50):
+        self.activo = activo
+        self.umbral = umbral
+        self.lentas = deque(maxlen=capacidad)
+        self._actual = contextvars.ContextVar("traza", default=None)
+        self._en_curso = {}  # id(traza) -> traza, lo lee el vigía desde su hilo
+        self._vigia = None
+        self._detener = threading.Event()
+        # Métricas
+        self.trazadas = 0
+        self.lentas_total = 0
+        self.pilas_capturadas = 0
+
+    # Trazas y tramos
+
+    def iniciar(self, nombre, **atributos):
+        """Abre una traza en el contexto actual; lo que devuelve va a terminar(). None si están desactivadas."""
+        if not self.activo:
+            return None
+        traza = Traza(nombre, atributos)
+        token = self._actual.set(traza)
+        self._en_curso[id(traza)] = traza
+        return traza, token
+
+    def terminar(self, abierta):
+        if abierta is None:
+            return
+        traza, token = abierta
+        traza.duracion = time.perf_counter() - traza.inicio
+        traza.tarea = None  # las lentas se guardan: que no retengan la tarea
+        self._en_curso.pop(id(traza), None)
+        self._actual.reset(token)
+        self.trazadas += 1
+        if traza.duracion >= self.umbral:
+            self.lentas_total += 1
+            self.lentas.append(traza)
+            registro.warning("peticion_lenta", **traza.como_dict())
+
+    def tramo(self, nombre):
+        traza = self._actual.get() if self.activo else None
+        if traza is None:
+            return SIN_TRAMO
+        return _Tramo(traza, nombre)
+
+    def anotar(self, **atributos):
+        if not self.activo:
+            return
+        traza = self._actual.get()
+        if traza is not None:
+            traza.atributos.update(atributos)
+
+    # Vigía de las trazas en curso
+
+    def configurar(self, activo=None, umbral=None):
+        """Cambia activo y umbral en caliente; arranca o detiene el vigía según haga falta."""
+        if umbral is not None:
+            self.umbral = umbral
+        if activo is not None:
+            self.activo = activo
+        if self.activo:
+            self.iniciar_vigia()
+        else:
+            self.detener_vigia()
+
+    def iniciar_vigia(self):
+        if self._vigia is None and self.activo:
+            self._detener.clear()
+            self._vigia = threading.Thread(target=self._vigilar, name="vigia-trazas", daemon=True)
+            self._vigia.start()
+
+    def detener_vigia(self):
+        if self._vigia is not None:
+            self._detener.set()
+            self._vigia.join(timeout=1)
+            self._vigia = None
+        self._en_curso.clear()
+
+    def _vigilar(self):
+        while not self._detener.wait(min(max(self.umbral / 4, 0.01), 0.5)):
+            ahora = time.perf_counter()
+            lentas = [t for t in list(self._en_curso.values())
+                      if t.pilas is None and ahora - t.inicio >= self.umbral]
+            if not lentas:
+                continue
+            marcos = sys._current_frames()
+            for traza in lentas:
+                marco = marcos.get(traza.hilo)
+                try:
+                    tarea = pila_de_tarea(traza.tarea)
+                except Exception:
+                    tarea = []  # la corrutina terminó mientras se recorría
+                traza.pilas = {
+                    "a_los_ms": round((ahora - traza.inicio) * 1000, 1),
+                    "hilo": pila_de(marco) if marco is not None else [],
+                    "tarea": tarea,
+                }
+                self.pilas_capturadas += 1
+
+    def estadisticas(self):
+        return {
+            "activo": self.activo,
+            "umbral_ms": round(self.umbral * 1000, 1),
+            "trazadas": self.trazadas,
+            "en_curso": len(self._en_curso),
+            "lentas": self.lentas_total,
+            "pilas_capturadas": self.pilas_capturadas,
+        }
+
+
+class TrazarPeticiones:
+    """Middleware ASGI: una traza por petición HTTP, con la ruta y el estado de la sesión."""
+
+    def __init__(self, app, trazas):
+        self.app = app
+        self.trazas = trazas
+
+    async def __call__(self, scope, receive, send):
+        if not self.trazas.activo or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        abierta = self.trazas.iniciar(scope["path"], metodo=scope["method"])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if abierta is not None:
+                abierta[0].atributos["estado"] = scope.get("state", {}).get("estado_sesion", "-")
+            self.trazas.terminar(abierta)
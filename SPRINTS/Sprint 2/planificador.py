@@ -0,0 +1,273 @@
+"""Planificador central de pasos temporizados de los ejercicios.
+
+En lugar de una corrutina dormida por usuario, cada ejercicio en curso es
+una sola entrada en un heap: (momento, secuencia, destinatario, guion,
+paso, ejecucion). Una única tarea duerme hasta la entrada más próxima,
+despacha en lote todas las que ya vencieron y programa el paso siguiente
+de cada guion. Cancelar un ejercicio es O(1): la entrada queda obsoleta y
+se descarta cuando sale del heap.
+
+Con un `diario`, cada paso programado (con su vencimiento en time.time())
+y cada ejecución terminada o cancelada se anota, y `reanudar` retoma tras
+un reinicio los guiones que tienen `ref`.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+from perfilado import Trazas
+from registro import obtener_registro
+
+registro = obtener_registro("planificador")
+
+
+class Guion:
+    """Secuencia de pasos (espera_en_segundos, mensaje) que se envían en orden.
+
+    `al_terminar(destinatario)` se llama después de enviar el último paso.
+    `ref` es una tupla serializable en JSON con la que quien lo creó puede reconstruirlo
+    tras un reinicio (ver MotorEjercicios.reconstruir); sin ella el guion
+    no se anota en el diario.
+    """
+
+    __slots__ = ("nombre", "pasos", "al_terminar", "ref")
+
+    def __init__(self, nombre, pasos, al_terminar=None, ref=None):
+        self.nombre = nombre
+        self.pasos = tuple(pasos)
+        self.al_terminar = al_terminar
+        self.ref = ref
+
+
+class Planificador:
+    """Un heap de pasos pendientes y una tarea que los despacha por lotes.
+
+    `enviar(destinatario, mensaje)` es la corrutina que entrega cada paso,
+    normalmente PipelineEnvios.encolar. `escala` multiplica todas las esperas
+    (1 en producción; p. ej. 0.01 para pruebas de carga). Los pasos que
+    siguen a menos de `ventana_agrupar` segundos del anterior salen junto con
+    él en un solo mensaje (hasta `max_caracteres`). Con `trazas` (perfilado.Trazas
+    activas) cada paso despachado es una traza "paso".
+    """
+
+    def __init__(self, enviar, escala=1.0, ventana_agrupar=0.0, max_caracteres=1600, diario=None, trazas=None):
+        self.enviar = enviar
+        self.escala = escala
+        self.ventana_agrupar = ventana_agrupar
+        self.max_caracteres = max_caracteres
+        self.diario = diario
+        self.trazas = trazas if trazas is not None else Trazas()
+        self._heap = []
+        self._secuencia = itertools.count()
+        self._ejecuciones = itertools.count(1)
+        # destinatario -> [ejecucion, guion, paso_siguiente]
+        self._vigentes = {}
+        self._obsoletas = 0
+        self._despertar = None
+        self._tarea = None
+
+        # Métricas
+        self.pasos_enviados = 0
+        self.lotes = 0
+        self.max_lote = 0
+        self.ejecuciones_completadas = 0
+        self.cancelaciones = 0
+        self.pasos_evitados = 0
+        self.pasos_agrupados = 0
+        self.pasos_saltados = 0
+
+    async def iniciar(self):
+        if self._tarea is None:
+            self._despertar = asyncio.Event()
+            self._tarea = asyncio.create_task(self._bucle(), name="planificador")
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+
+    def programar(self, destinatario, guion, retraso=0.0):
+        """Arranca `guion` para `destinatario`, reemplazando el que tuviera en curso.
+
+        El primer paso sale tras `retraso` + su propia espera. Devuelve el id
+        de la ejecución.
+        """
+        self.cancelar(destinatario)
+        if not guion.pasos:
+            if guion.al_terminar:
+                guion.al_terminar(destinatario)
+            return None
+        ejecucion = next(self._ejecuciones)
+        self._vigentes[destinatario] = [ejecucion, guion, 0]
+        momento = time.monotonic() + (retraso + guion.pasos[0][0]) * self.escala
+        self._empujar(momento, destinatario, guion, 0, ejecucion)
+        return ejecucion
+
+    def reanudar(self, destinatario, guion, paso, vence, gracia=0.0):
+        """Retoma `guion` en `paso`, que vencía en `vence` (time.time(), p. ej. de antes de un reinicio).
+
+        Los pasos vencidos hace más de `gracia` segundos se saltean sin
+        enviarse; los siguientes mantienen su cronograma. Si no queda
+        ninguno se llama a `al_terminar`. Devuelve el id de la ejecución, o
+        None si no quedó nada por enviar.
+        """
+        self.cancelar(destinatario)
+        ahora = time.time()
+        while paso < len(guion.pasos) and vence < ahora - gracia:
+            self.pasos_saltados += 1
+            paso += 1
+            if paso < len(guion.pasos):
+                vence += guion.pasos[paso][0] * self.escala
+        if paso >= len(guion.pasos):
+            self._anotar_fin(destinatario)
+            if guion.al_terminar:
+                guion.al_terminar(destinatario)
+            return None
+        ejecucion = next(self._ejecuciones)
+        self._vigentes[destinatario] = [ejecucion, guion, paso]
+        self._empujar(time.monotonic() + max(0.0, vence - ahora), destinatario, guion, paso, ejecucion)
+        return ejecucion
+
+    def cancelar(self, destinatario, ejecucion=None):
+        """Cancela el guion en curso del destinatario. Devuelve los pasos que ya no se enviarán.
+
+        Con `ejecucion`, solo cancela si esa sigue siendo la ejecución en curso.
+        """
+        vigente = self._vigentes.get(destinatario)
+        if vigente is None or (ejecucion is not None and vigente[0] != ejecucion):
+            return 0
+        del self._vigentes[destinatario]
+        self._anotar_fin(destinatario)
+        self._obsoletas += 1
+        _, guion, paso = vigente
+        evitados = len(guion.pasos) - paso
+        self.cancelaciones += 1
+        self.pasos_evitados += evitados
+        return evitados
+
+    def activos_por_guion(self):
+        """Ejecuciones en curso agrupadas por nombre de guion (el ejercicio)."""
+        activos = {}
+        for _, guion, _ in self._vigentes.values():
+            activos[guion.nombre] = activos.get(guion.nombre, 0) + 1
+        return activos
+
+    def ejecucion_actual(self, destinatario):
+        vigente = self._vigentes.get(destinatario)
+        return vigente[0] if vigente else None
+
+    def _empujar(self, momento, destinatario, guion, paso, ejecucion):
+        entrada = (momento, next(self._secuencia), destinatario, guion, paso, ejecucion)
+        primera = not self._heap or momento < self._heap[0][0]
+        heapq.heappush(self._heap, entrada)
+        if primera and self._despertar is not None:
+            self._despertar.set()
+        if self.diario is not None and guion.ref is not None:
+            self.diario.registrar_paso(destinatario, guion.ref, paso, momento - time.monotonic() + time.time())
+
+    def _anotar_fin(self, destinatario):
+        if self.diario is not None:
+            self.diario.registrar_fin(destinatario)
+
+    def _compactar(self):
+        # Demasiadas entradas canceladas: reconstruir el heap solo con las vigentes
+        self._heap = [
+            entrada for entrada in self._heap
+            if self._vigentes.get(entrada[2], (None,))[0] == entrada[5]
+        ]
+        heapq.heapify(self._heap)
+        self._obsoletas = 0
+
+    def _vencidas(self, ahora):
+        lote = []
+        heap = self._heap
+        while heap and heap[0][0] <= ahora:
+            momento, _, destinatario, guion, paso, ejecucion = heapq.heappop(heap)
+            vigente = self._vigentes.get(destinatario)
+            if vigente is None or vigente[0] != ejecucion:
+                self._obsoletas = max(0, self._obsoletas - 1)
+                continue
+            lote.append((momento, destinatario, guion, paso, ejecucion))
+        return lote
+
+    async def _bucle(self):
+        while True:
+            self._despertar.clear()
+            if not self._heap:
+                await self._despertar.wait()
+                continue
+            espera = self._heap[0][0] - time.monotonic()
+            if espera > 0:
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), timeout=espera)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            lote = self._vencidas(time.monotonic())
+            if lote:
+                self.lotes += 1
+                self.max_lote = max(self.max_lote, len(lote))
+            for momento, destinatario, guion, paso, ejecucion in lote:
+                abierta = self.trazas.iniciar("paso", destino=destinatario, guion=guion.nombre, paso=paso)
+                try:
+                    await self._despachar(momento, destinatario, guion, paso, ejecucion)
+                finally:
+                    self.trazas.terminar(abierta)
+            if self._obsoletas > 1000 and self._obsoletas > len(self._heap) // 2:
+                self._compactar()
+
+    async def _despachar(self, momento, destinatario, guion, paso, ejecucion):
+        vigente = self._vigentes.get(destinatario)
+        if vigente is None or vigente[0] != ejecucion:
+            return  # cancelado por un paso anterior del mismo lote
+        pasos = guion.pasos
+        texto = pasos[paso][1]
+        # Pasos que vienen casi enseguida: un solo mensaje, sin correr el cronograma del resto
+        while (paso + 1 < len(pasos) and pasos[paso + 1][0] <= self.ventana_agrupar
+               and len(texto) + 2 + len(pasos[paso + 1][1]) <= self.max_caracteres):
+            paso += 1
+            momento += pasos[paso][0] * self.escala
+            texto += "\n\n" + pasos[paso][1]
+            self.pasos_agrupados += 1
+        vigente[2] = paso + 1
+        try:
+            await self.enviar(destinatario, texto)
+            self.pasos_enviados += 1
+        except Exception as e:
+            registro.error("paso_fallido", destino=destinatario, guion=guion.nombre, paso=paso, error=str(e))
+
+        vigente = self._vigentes.get(destinatario)
+        if vigente is None or vigente[0] != ejecucion:
+            return  # cancelado mientras se enviaba
+        siguiente = paso + 1
+        if siguiente < len(guion.pasos):
+            # Se programa desde el momento previsto, no desde ahora: sin deriva
+            self._empujar(momento + guion.pasos[siguiente][0] * self.escala, destinatario, guion, siguiente, ejecucion)
+            return
+
+        del self._vigentes[destinatario]
+        self._anotar_fin(destinatario)
+        self.ejecuciones_completadas += 1
+        if guion.al_terminar:
+            try:
+                guion.al_terminar(destinatario)
+            except Exception as e:
+                registro.error("cierre_fallido", destino=destinatario, guion=guion.nombre, exc_info=True)
+
+    def estadisticas(self):
+        return {
+            "ejecuciones_activas": len(self._vigentes),
+            "entradas_en_heap": len(self._heap),
+            "pasos_pendientes": sum(len(g.pasos) - p for _, g, p in self._vigentes.values()),
+            "pasos_enviados": self.pasos_enviados,
+            "pasos_agrupados": self.pasos_agrupados,
+            "pasos_saltados": self.pasos_saltados,
+            "lotes": self.lotes,
+            "max_lote": self.max_lote,
+            "ejecuciones_completadas": self.ejecuciones_completadas,
+            "cancelaciones": self.cancelaciones,
+            "pasos_evitados": self.pasos_evitados,
+        }
@@ -0,0 +1,254 @@
+"""Registro estructurado, asíncrono y muestreado.
+
+- El hilo del event loop solo decide si el evento se registra (nivel y
+  muestreo, antes de crear nada), arma un LogRecord mínimo (sin buscar el
+  llamador en la pila ni datos de hilo o proceso) y lo deja en una cola acotada.
+  Si la cola está llena el evento se descarta y se cuenta: nunca bloquea.
+- Un hilo aparte da formato (una línea JSON por evento), redacta datos
+  personales y escribe en stdout.
+- Los teléfonos se reemplazan por un hash corto (se pueden correlacionar
+  sin exponer el número) y los textos de los usuarios por su largo.
+
+Configuración con la variable REGISTRO_CONFIG (JSON), por ejemplo:
+
+    {"nivel": "INFO", "muestreo": {"DEBUG": 0.01},
+     "por_ruta": {"/whatsapp": {"muestreo": {"INFO": 0.1}},
+                  "envios": {"nivel": "WARNING"}},
+     "mostrar_textos": false, "capacidad": 10000}
+
+Nombres de registro usados: "/whatsapp", "/test", "envios",
+"planificador", "deduplicacion", "diario", "ingesta", "firma", "difusion",
+"reparto", "lanzador", "analitica", "perfilado", "contenido".
+
+El hilo escritor no sobrevive a fork() (lanzador.py): antes de cada fork se
+vacía la cola y se detiene, y se vuelve a arrancar en ambos procesos.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+import traceback
+from logging.handlers import QueueHandler, QueueListener
+
+CAMPOS_TELEFONO = frozenset(("de", "destino", "usuario"))
+CAMPOS_TEXTO = frozenset(("texto", "respuesta", "mensaje", "perfil"))
+PATRON_TELEFONO = re.compile(r"(?<![\w+])\+?\d[\d -]{6,14}\d(?!\w)")
+
+CONFIG_POR_DEFECTO = {
+    "nivel": "INFO",
+    "muestreo": {},
+    "por_ruta": {},
+    "mostrar_textos": False,
+    "capacidad": 10000,
+    "sal": "aiuda",
+}
+
+
+def redactar_telefono(valor, sal):
+    if not valor:
+        return valor
+    digest = hashlib.blake2s(f"{sal}{valor}".encode(), digest_size=6).hexdigest()
+    return f"tel_{digest}"
+
+
+class Evento(logging.LogRecord):
+    """LogRecord con solo lo que usa FormatoJSON; mucho más barato de crear."""
+
+    def __init__(self, nombre, nivel, evento, campos, exc_info=None):
+        self.name = nombre
+        self.levelno = nivel
+        self.levelname = logging.getLevelName(nivel)
+        self.msg = evento
+        self.args = None
+        self.campos = campos
+        self.exc_info = exc_info
+        self.exc_text = None
+        self.stack_info = None
+        self.created = time.time()
+        self.msecs = (self.created - int(self.created)) * 1000
+
+    def getMessage(self):
+        return self.msg
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por evento, con los datos personales ya redactados."""
+
+    def __init__(self, mostrar_textos=False, sal="aiuda"):
+        super().__init__()
+        self.mostrar_textos = mostrar_textos
+        self.sal = sal
+        self._segundo = None
+        self._prefijo_tiempo = ""
+        self._telefonos = {}  # número -> hash, acotado
+
+    def _tiempo(self, creado):
+        segundo = int(creado)
+        if segundo != self._segundo:
+            self._segundo = segundo
+            self._prefijo_tiempo = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(segundo))
+        return f"{self._prefijo_tiempo}.{int((creado - segundo) * 1000):03d}Z"
+
+    def _telefono(self, valor):
+        redactado = self._telefonos.get(valor)
+        if redactado is None:
+            if len(self._telefonos) >= 10000:
+                self._telefonos.clear()
+            redactado = self._telefonos[valor] = redactar_telefono(valor, self.sal)
+        return redactado
+
+    def format(self, record):
+        datos = {
+            "t": self._tiempo(record.created),
+            "nivel": record.levelname,
+            "origen": record.name.removeprefix("aiuda."),
+            "evento": record.msg,
+        }
+        for clave, valor in getattr(record, "campos", {}).items():
+            if clave in CAMPOS_TELEFONO:
+                valor = self._telefono(valor)
+            elif clave in CAMPOS_TEXTO and not self.mostrar_textos:
+                valor = len(valor) if isinstance(valor, str) else valor
+                clave = f"{clave}_largo"
+            elif isinstance(valor, str):
+                valor = PATRON_TELEFONO.sub("***", valor)
+            datos[clave] = valor
+        if record.exc_info:
+            texto = "".join(traceback.format_exception(*record.exc_info))
+            datos["excepcion"] = PATRON_TELEFONO.sub("***", texto)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class ManejadorCola(QueueHandler):
+    """QueueHandler que no da formato en el hilo que registra y descarta si la cola está llena."""
+
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def prepare(self, record):
+        return record  # el formato lo hace el hilo del listener
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+class Registro:
+    """Fachada sobre un logging.Logger con muestreo por nivel."""
+
+    __slots__ = ("_logger", "_tasas")
+
+    def __init__(self, logger, tasas):
+        self._logger = logger
+        self._tasas = tasas
+
+    def _emitir(self, nivel, evento, campos, exc_info=False):
+        if not self._logger.isEnabledFor(nivel):
+            return
+        tasa = self._tasas.get(nivel, 1.0)
+        if tasa < 1.0 and random.random() >= tasa:
+            return
+        if exc_info:
+            exc_info = sys.exc_info()
+        self._logger.handle(Evento(self._logger.name, nivel, evento, campos, exc_info or None))
+
+    def activo(self, nivel=logging.INFO):
+        return self._logger.isEnabledFor(nivel)
+
+    def debug(self, evento, **campos):
+        self._emitir(logging.DEBUG, evento, campos)
+
+    def info(self, evento, **campos):
+        self._emitir(logging.INFO, evento, campos)
+
+    def warning(self, evento, **campos):
+        self._emitir(logging.WARNING, evento, campos)
+
+    def error(self, evento, exc_info=False, **campos):
+        self._emitir(logging.ERROR, evento, campos, exc_info)
+
+
+_config = None
+_manejador = None
+_listener = None
+_registros = {}
+
+
+def _tasas(muestreo):
+    return {logging.getLevelName(nivel.upper()): float(tasa) for nivel, tasa in muestreo.items()}
+
+
+def configurar_registro(config=None, destino=None):
+    """Arranca el listener. Sin `config` usa REGISTRO_CONFIG o los valores por defecto."""
+    global _config, _manejador, _listener
+    if config is None:
+        config = json.loads(os.getenv("REGISTRO_CONFIG", "{}") or "{}")
+    _config = dict(CONFIG_POR_DEFECTO, **config)
+    detener_registro()
+
+    salida = logging.StreamHandler(destino or sys.stdout)
+    salida.setFormatter(FormatoJSON(_config["mostrar_textos"], _config["sal"]))
+    cola = queue.Queue(maxsize=_config["capacidad"])
+    _manejador = ManejadorCola(cola)
+    _listener = QueueListener(cola, salida, respect_handler_level=False)
+    _listener.start()
+
+    raiz = logging.getLogger("aiuda")
+    raiz.handlers[:] = [_manejador]
+    raiz.propagate = False
+    raiz.setLevel(_config["nivel"])
+    for nombre, registro in _registros.items():
+        _aplicar(nombre, registro)
+
+
+def _aplicar(nombre, registro):
+    propio = _config["por_ruta"].get(nombre, {})
+    logger = logging.getLogger(f"aiuda.{nombre}")
+    logger.setLevel(propio.get("nivel", _config["nivel"]))
+    tasas = _tasas(_config["muestreo"])
+    tasas.update(_tasas(propio.get("muestreo", {})))
+    registro._logger = logger
+    registro._tasas = tasas
+
+
+def obtener_registro(nombre):
+    """Devuelve (y recuerda) el Registro de una ruta o componente."""
+    registro = _registros.get(nombre)
+    if registro is None:
+        if _config is None:
+            configurar_registro()
+        registro = _registros[nombre] = Registro(None, {})
+        _aplicar(nombre, registro)
+    return registro
+
+
+def detener_registro():
+    """Vacía la cola y detiene el hilo escritor."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def descartados():
+    return _manejador.descartados if _manejador else 0
+
+
+def _reanudar_registro():
+    if _config is not None:
+        configurar_registro(_config)
+
+
+atexit.register(detener_registro)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=detener_registro, after_in_parent=_reanudar_registro,
+                        after_in_child=_reanudar_registro)
@@ -0,0 +1,276 @@
+"""Reparto de los usuarios entre los workers del lanzador, por hash del remitente.
+
+Con más de un worker (lanzador.py) cada usuario tiene un dueño: el worker
+`particion(From, workers)`. Su sesión en memoria, su lock, sus pasos
+programados, su diario, la deduplicación de sus mensajes y su cubeta de
+admisión viven en ese worker, así que todo se comporta como con un solo
+proceso.
+
+El kernel reparte las conexiones del puerto público sin mirar el cuerpo.
+RepartirWebhook lee el cuerpo del POST al webhook, busca el From y, si el
+dueño es otro worker, le pasa la petición tal cual (mismas cabeceras y
+mismo cuerpo: la firma de Twilio sigue valiendo) por el socket unix de ese
+worker y devuelve su respuesta. Lo que llega por un socket unix ya está
+repartido: nunca se reenvía, y solo ahí se atienden las rutas /interno/*.
+
+El hash es blake2b y no crc32: PipelineEnvios y ColaIngesta reparten sus
+colas con crc32 y, con el mismo hash, cada worker usaría solo algunas.
+"""
+import asyncio
+import hashlib
+import json
+from urllib.parse import unquote_plus
+
+from firma import CAMPO_FROM
+from registro import obtener_registro
+
+registro = obtener_registro("reparto")
+
+CABECERA_CLIENTE = b"x-aiuda-cliente"
+# Cabeceras de un solo salto: no se copian al reenviar
+NO_REENVIAR = frozenset((b"connection", b"keep-alive", b"transfer-encoding", b"content-length", b"te",
+                         b"upgrade", b"expect"))
+# Las pone el servidor que responde al cliente
+NO_DEVOLVER = frozenset((b"connection", b"keep-alive", b"transfer-encoding", b"date", b"server"))
+
+
+class ErrorReparto(Exception):
+    """El worker dueño no respondió o respondió con un error."""
+
+
+def particion(numero, workers):
+    return int.from_bytes(hashlib.blake2b(numero.encode(), digest_size=8).digest(), "big") % workers
+
+
+def remitente(cuerpo):
+    """El From decodificado de un formulario de Twilio, o None."""
+    campo = CAMPO_FROM.search(cuerpo.decode("latin-1"))
+    return unquote_plus(campo.group(1)) if campo else None
+
+
+def _armar_peticion(metodo, ruta, cabeceras, cuerpo):
+    lineas = [b"%s %s HTTP/1.1" % (metodo.encode(), ruta)]
+    lineas += [nombre + b": " + valor for nombre, valor in cabeceras if nombre not in NO_REENVIAR]
+    lineas.append(b"content-length: %d" % len(cuerpo))
+    return b"\r\n".join(lineas) + b"\r\n\r\n" + cuerpo
+
+
+async def _leer_respuesta(lector):
+    """(estado, cabeceras, cuerpo, cerrar) de una respuesta HTTP/1.1."""
+    inicio, *lineas = (await lector.readuntil(b"\r\n\r\n"))[:-4].split(b"\r\n")
+    estado = int(inicio.split(b" ", 2)[1])
+    cabeceras = []
+    largo = None
+    fragmentada = cerrar = False
+    for linea in lineas:
+        nombre, _, valor = linea.partition(b":")
+        nombre = nombre.strip().lower()
+        valor = valor.strip()
+        if nombre == b"content-length":
+            largo = int(valor)
+        elif nombre == b"transfer-encoding":
+            fragmentada = b"chunked" in valor.lower()
+        elif nombre == b"connection":
+            cerrar = valor.lower() == b"close"
+        if nombre not in NO_DEVOLVER:
+            cabeceras.append((nombre, valor))
+    if fragmentada:
+        partes = []
+        while True:
+            tamano = int((await lector.readuntil(b"\r\n")).split(b";", 1)[0], 16)
+            if tamano == 0:
+                await lector.readuntil(b"\r\n")  # sin trailers: solo el CRLF final
+                return estado, cabeceras, b"".join(partes), cerrar
+            partes.append((await lector.readexactly(tamano + 2))[:-2])
+    if largo is not None:
+        return estado, cabeceras, await lector.readexactly(largo), cerrar
+    return estado, cabeceras, await lector.read(), True
+
+
+class Reparto:
+    """A qué worker pertenece cada usuario y cómo hablarle.
+
+    Con un solo worker está inactivo: todos los usuarios son propios.
+    `espera` acota cada petición a otro worker; alcanza para que un worker
+    que se reinicia (lanzador.py, SIGHUP) vuelva a atender su socket.
+    """
+
+    def __init__(self, espera=30.0, max_libres=64):
+        self.indice = 0
+        self.workers = 1
+        self.sockets = []
+        self.espera = espera
+        self.max_libres = max_libres  # conexiones ociosas que se guardan por worker
+        self._libres = {}  # indice -> [(lector, escritor)]
+
+        # Métricas (solo se modifican desde el hilo del event loop)
+        self.reenviados = 0
+        self.recibidos = 0
+        self.errores = 0
+
+    def configurar(self, indice, sockets):
+        """Lo llama el lanzador en cada worker después del fork: su índice y el socket de cada worker."""
+        self.indice = indice
+        self.sockets = list(sockets)
+        self.workers = len(self.sockets)
+        self._libres = {}
+
+    @property
+    def activo(self):
+        return self.workers > 1
+
+    def dueno(self, numero):
+        return particion(numero, self.workers) if self.workers > 1 else 0
+
+    def propio(self, numero):
+        return self.workers == 1 or particion(numero, self.workers) == self.indice
+
+    def otros(self):
+        return [i for i in range(self.workers) if i != self.indice]
+
+    def es_interno(self, scope):
+        # uvicorn pone en "server" la ruta del socket unix por el que llegó la petición
+        servidor = scope.get("server")
+        return bool(self.sockets) and servidor is not None and servidor[0] == self.sockets[self.indice]
+
+    async def _conexion(self, indice):
+        libres = self._libres.get(indice)
+        while libres:
+            lector, escritor = libres.pop()
+            if not lector.at_eof():
+                return lector, escritor, True
+            escritor.close()  # uvicorn cierra las conexiones ociosas (timeout_keep_alive)
+        lector, escritor = await asyncio.wait_for(asyncio.open_unix_connection(self.sockets[indice]), self.espera)
+        return lector, escritor, False
+
+    def _devolver(self, indice, lector, escritor):
+        libres = self._libres.setdefault(indice, [])
+        if len(libres) < self.max_libres:
+            libres.append((lector, escritor))
+        else:
+            escritor.close()
+
+    async def pedir(self, indice, metodo, ruta, cabeceras, cuerpo=b""):
+        """Una petición HTTP/1.1 al worker `indice` por su socket unix. Devuelve (estado, cabeceras, cuerpo)."""
+        peticion = _armar_peticion(metodo, ruta, cabeceras, cuerpo)
+        for intento in range(2):
+            try:
+                lector, escritor, reusada = await self._conexion(indice)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.errores += 1
+                raise ErrorReparto(f"worker {indice}: no se pudo conectar ({e!r})") from e
+            try:
+                escritor.write(peticion)
+                await escritor.drain()
+                estado, cabeceras_respuesta, cuerpo_respuesta, cerrar = await asyncio.wait_for(
+                    _leer_respuesta(lector), self.espera)
+            except (OSError, EOFError, ValueError, IndexError, asyncio.LimitOverrunError, asyncio.TimeoutError) as e:
+                escritor.close()
+                # Una conexión guardada que el otro cerró sin que se notara: se prueba una vez con otra nueva
+                if reusada and intento == 0 and isinstance(e, (ConnectionError, asyncio.IncompleteReadError)):
+                    continue
+                self.errores += 1
+                raise ErrorReparto(f"worker {indice}: {e!r}") from e
+            except BaseException:
+                # Cancelada a mitad de la respuesta: la conexión queda en un estado desconocido
+                escritor.close()
+                raise
+            if cerrar:
+                escritor.close()
+            else:
+                self._devolver(indice, lector, escritor)
+            return estado, cabeceras_respuesta, cuerpo_respuesta
+
+    async def llamar(self, indice, ruta, datos):
+        """POST JSON a una ruta /interno/* del worker `indice`; devuelve el JSON de la respuesta."""
+        estado, _, cuerpo = await self.pedir(
+            indice, "POST", ruta.encode(), [(b"host", b"interno"), (b"content-type", b"application/json")],
+            json.dumps(datos, separators=(",", ":")).encode())
+        if estado != 200:
+            raise ErrorReparto(f"worker {indice} respondió {estado} a {ruta}")
+        return json.loads(cuerpo)
+
+    def estadisticas(self):
+        return {
+            "worker": self.indice,
+            "workers": self.workers,
+            "reenviados": self.reenviados,
+            "recibidos": self.recibidos,
+            "errores": self.errores,
+            "conexiones_libres": sum(map(len, self._libres.values())),
+        }
+
+
+class RepartirWebhook:
+    """Middleware ASGI: el POST al webhook lo atiende el worker dueño del From.
+
+    Va por fuera de todos los demás: lo que se reenvía se mide, se admite y
+    se procesa solo en el dueño. Un cuerpo de más de `max_bytes` o sin From
+    se atiende aquí (la admisión lo rechaza).
+    """
+
+    def __init__(self, app, reparto, ruta="/whatsapp", max_bytes=65536):
+        self.app = app
+        self.reparto = reparto
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        reparto = self.reparto
+        if scope["type"] != "http" or not reparto.activo:
+            return await self.app(scope, receive, send)
+        if reparto.es_interno(scope):
+            return await self.app(self._con_cliente(scope), receive, send)
+        if scope["path"] != self.ruta or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+
+        mensajes = []
+        largo = 0
+        mas = True
+        while mas and largo <= self.max_bytes:
+            mensaje = await receive()
+            if mensaje["type"] != "http.request":
+                return  # el cliente se fue
+            mensajes.append(mensaje)
+            largo += len(mensaje.get("body", b""))
+            mas = mensaje.get("more_body", False)
+        if not mas:
+            cuerpo = b"".join(m.get("body", b"") for m in mensajes)
+            numero = remitente(cuerpo)
+            if numero is not None and not reparto.propio(numero):
+                return await self._reenviar(scope, send, reparto.dueno(numero), cuerpo)
+
+        pendientes = iter(mensajes)
+
+        async def repetir_cuerpo():
+            return next(pendientes, None) or await receive()
+
+        await self.app(scope, repetir_cuerpo, send)
+
+    def _con_cliente(self, scope):
+        # La IP del cliente original, para los límites de admisión del dueño
+        self.reparto.recibidos += 1
+        for nombre, valor in scope["headers"]:
+            if nombre == CABECERA_CLIENTE:
+                return dict(scope, client=(valor.decode("latin-1"), 0))
+        return scope
+
+    async def _reenviar(self, scope, send, indice, cuerpo):
+        # La del cliente solo la pone este worker: una que venga de afuera se descarta
+        cabeceras = [(nombre, valor) for nombre, valor in scope["headers"] if nombre != CABECERA_CLIENTE]
+        cliente = scope.get("client")
+        if cliente:
+            cabeceras.append((CABECERA_CLIENTE, cliente[0].encode("latin-1")))
+        ruta = scope.get("raw_path") or scope["path"].encode()
+        if scope.get("query_string"):
+            ruta += b"?" + scope["query_string"]
+        try:
+            estado, cabeceras_respuesta, cuerpo_respuesta = await self.reparto.pedir(
+                indice, scope["method"], ruta, cabeceras, cuerpo)
+            self.reparto.reenviados += 1
+        except ErrorReparto as e:
+            # Twilio reintenta más tarde; el dueño lo atiende cuando vuelva
+            registro.warning("reenvio_fallido", worker=indice, error=str(e))
+            estado, cabeceras_respuesta, cuerpo_respuesta = 503, [(b"retry-after", b"1"), (b"content-length", b"0")], b""
+        await send({"type": "http.response.start", "status": estado, "headers": cabeceras_respuesta})
+        await send({"type": "http.response.body", "body": cuerpo_respuesta})
@@ -0,0 +1,108 @@
+"""Render de respuestas TwiML con caché de los textos estáticos.
+
+Casi todas las respuestas del bot son uno de unos pocos textos fijos (el
+menú, la ayuda urgente, "opción no válida", las técnicas pendientes...).
+Cuando se carga el contenido se arman esos textos una vez y se guarda el
+TwiML completo en bytes, indexado por el propio texto. Las respuestas
+dinámicas solo escapan el texto y lo insertan entre un prefijo y un sufijo
+fijos, sin crear un MessagingResponse por mensaje.
+
+El XML es idéntico al que genera twilio.twiml.MessagingResponse.
+"""
+PREFIJO_MENSAJE = '<?xml version="1.0" encoding="UTF-8"?><Response><Message>'
+SUFIJO_MENSAJE = "</Message></Response>"
+TWIML_VACIO = b'<?xml version="1.0" encoding="UTF-8"?><Response />'
+
+# Textos fijos que no dependen de menu.json
+OPCION_NO_VALIDA = "❌ Opción no válida. Escribe *menu* para ver las opciones."
+NO_ENTENDI = "No entendí tu mensaje. 🤔\n\nEscribe *menu* para ver las opciones."
+ERROR_TECNICO = "Error técnico. Escribe *menu* para reintentar."
+ERROR_SISTEMA = "Error del sistema. Por favor intenta más tarde."
+EJERCICIO_NO_DISPONIBLE = "Lo siento, ese ejercicio no está disponible."
+
+
+def escape(texto):
+    # Igual que xml.sax.saxutils.escape, sin importar xml.sax (que arrastra urllib.request al arrancar)
+    return texto.replace("&", "&amp;").replace(">", "&gt;").replace("<", "&lt;")
+
+
+def twiml_mensaje(texto):
+    """TwiML con un único <Message>, en bytes."""
+    return (PREFIJO_MENSAJE + escape(texto) + SUFIJO_MENSAJE).encode()
+
+
+def armar_menu(menu):
+    partes = [menu["bienvenida"], "\n\n", menu["menu_principal"]["titulo"], "\n\n"]
+    for opcion in menu["menu_principal"]["opciones"]:
+        partes.append(f"{opcion['emoji']} *{opcion['id']}*. {opcion['nombre']}\n")
+    partes.append("\n_Escribe el número de la opción que prefieras._")
+    return "".join(partes)
+
+
+def armar_tecnica_pendiente(opcion):
+    return (
+        f"{opcion['emoji']} *{opcion['nombre']}*\n\n"
+        f"{opcion['descripcion']}\n\n"
+        "_Esta técnica estará disponible próximamente._\n\n"
+        "Escribe *menu* para volver al inicio."
+    )
+
+
+class CacheRespuestas:
+    """Textos y TwiML precalculados del contenido vigente."""
+
+    def __init__(self):
+        self.menu = ""
+        self.urgente = ""
+        self.feedback = ""
+        self.tecnicas_pendientes = {}  # id de opción -> texto
+        self._twiml = {}  # texto -> bytes
+        self.aciertos = 0
+        self.renderizados = 0
+
+    def construir(self, contenido):
+        self.preparar(contenido)()
+
+    def preparar(self, contenido):
+        """Suscriptor de AlmacenContenido: arma todo con el contenido nuevo y devuelve cómo publicarlo."""
+        menu = contenido.menu
+        texto_menu = armar_menu(menu)
+        urgente = menu["ayuda_urgente"]["mensaje"]
+        feedback = f"Me alegra que hayas compartido eso. 💚\n\n{texto_menu}"
+        pendientes = {
+            opcion["id"]: armar_tecnica_pendiente(opcion)
+            for opcion in menu["menu_principal"]["opciones"]
+        }
+        estaticos = [texto_menu, urgente, feedback, OPCION_NO_VALIDA, NO_ENTENDI,
+                     ERROR_TECNICO, ERROR_SISTEMA, EJERCICIO_NO_DISPONIBLE]
+        estaticos.extend(pendientes.values())
+        estaticos.extend(e["introduccion"] for e in (contenido.ejercicios or {}).values())
+
+        twiml = {texto: twiml_mensaje(texto) for texto in estaticos}
+
+        def publicar():
+            # Cada atributo cambia con una sola asignación
+            self._twiml = twiml
+            self.tecnicas_pendientes = pendientes
+            self.feedback = feedback
+            self.urgente = urgente
+            self.menu = texto_menu
+        return publicar
+
+    def twiml(self, texto):
+        """TwiML de la respuesta: del caché si es un texto fijo, o armado al vuelo."""
+        if texto is None:
+            return TWIML_VACIO
+        cacheado = self._twiml.get(texto)
+        if cacheado is not None:
+            self.aciertos += 1
+            return cacheado
+        self.renderizados += 1
+        return twiml_mensaje(texto)
+
+    def estadisticas(self):
+        return {
+            "textos_precalculados": len(self._twiml),
+            "aciertos": self.aciertos,
+            "renderizados": self.renderizados,
+        }
@@ -0,0 +1,367 @@
+"""Almacenes de sesiones de usuario.
+
+`Sesion` usa __slots__ y se serializa como una lista JSON corta, así que
+ocupa mucho menos que el dict de cuatro claves que usábamos antes. Hay tres
+almacenes con la misma interfaz (obtener / guardar / eliminar, y `usuarios`
+para recorrerlas):
+
+- AlmacenMemoria: LRU + TTL dentro del proceso (un solo worker).
+- AlmacenSQLite: archivo local en modo WAL, compartido por los workers de
+  una misma máquina.
+- AlmacenRedis: cualquier servidor que hable el protocolo de Redis,
+  compartido entre réplicas (ver benchmarks/redis_falso.py para pruebas).
+
+Los tres son síncronos y el bot los llama desde el event loop. Con memoria
+y SQLite eso es un acceso local; con Redis cada obtener/guardar es una ida
+y vuelta por la red que bloquea el loop mientras dura, y si la conexión se
+cae puede bloquearlo hasta el timeout del cliente (2 s por intento). Está
+pensado para un Redis local o en la misma red, con latencias de menos de
+un milisegundo, no para uno remoto.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+
+class Sesion:
+    __slots__ = ("estado", "ejercicio_actual", "paso_actual", "esperando_respuesta", "ejecucion")
+
+    def __init__(self, estado="menu", ejercicio_actual=None, paso_actual=0,
+                 esperando_respuesta=False, ejecucion=None):
+        self.estado = estado
+        self.ejercicio_actual = ejercicio_actual
+        self.paso_actual = paso_actual
+        self.esperando_respuesta = esperando_respuesta
+        self.ejecucion = ejecucion
+
+    def a_tupla(self):
+        return (self.estado, self.ejercicio_actual, self.paso_actual,
+                self.esperando_respuesta, self.ejecucion)
+
+    def serializar(self):
+        return json.dumps(self.a_tupla(), separators=(",", ":"))
+
+    @classmethod
+    def deserializar(cls, datos):
+        return cls(*json.loads(datos))
+
+    def a_dict(self):
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+    def __repr__(self):
+        return f"Sesion{self.a_tupla()!r}"
+
+
+class AlmacenSesiones:
+    """Interfaz común. `obtener` devuelve None si la sesión no existe o expiró."""
+
+    def obtener(self, user_id):
+        raise NotImplementedError
+
+    def guardar(self, user_id, sesion):
+        raise NotImplementedError
+
+    def eliminar(self, user_id):
+        raise NotImplementedError
+
+    def usuarios(self):
+        """Lista de (user_id, sesion) con todas las sesiones vigentes."""
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def cerrar(self):
+        pass
+
+
+class AlmacenMemoria(AlmacenSesiones):
+    """LRU con TTL: como máximo `max_sesiones`, cada una vive `ttl` segundos sin escribirse."""
+
+    def __init__(self, max_sesiones=100_000, ttl=86400):
+        self.max_sesiones = max_sesiones
+        self.ttl = ttl
+        self._datos = OrderedDict()  # user_id -> (sesion, expira)
+        self.expiradas = 0
+        self.desalojadas = 0
+
+    def obtener(self, user_id):
+        entrada = self._datos.get(user_id)
+        if entrada is None:
+            return None
+        sesion, expira = entrada
+        if expira < time.monotonic():
+            del self._datos[user_id]
+            self.expiradas += 1
+            return None
+        self._datos.move_to_end(user_id)
+        return sesion
+
+    def guardar(self, user_id, sesion):
+        ahora = time.monotonic()
+        self._datos[user_id] = (sesion, ahora + self.ttl)
+        self._datos.move_to_end(user_id)
+        # Las más antiguas están al principio: purgar expiradas y exceso
+        while self._datos:
+            primera, (_, expira) = next(iter(self._datos.items()))
+            if expira < ahora:
+                self.expiradas += 1
+            elif len(self._datos) > self.max_sesiones:
+                self.desalojadas += 1
+            else:
+                break
+            del self._datos[primera]
+
+    def eliminar(self, user_id):
+        self._datos.pop(user_id, None)
+
+    def usuarios(self):
+        # Sin tocar el orden LRU: recorrer no cuenta como uso. list() copia de una vez,
+        # así que se puede llamar desde un hilo mientras el event loop sigue guardando
+        ahora = time.monotonic()
+        return [(user_id, sesion) for user_id, (sesion, expira) in list(self._datos.items()) if expira >= ahora]
+
+    def __len__(self):
+        ahora = time.monotonic()
+        return sum(1 for _, expira in list(self._datos.values()) if expira >= ahora)
+
+
+class AlmacenSQLite(AlmacenSesiones):
+    """Sesiones en un archivo SQLite en modo WAL, compartible entre procesos."""
+
+    def __init__(self, ruta="sesiones.db", ttl=86400, purgar_cada=1000):
+        self.ruta = ruta
+        self.ttl = ttl
+        self.purgar_cada = purgar_cada
+        self._escrituras = 0
+        self._lock = threading.Lock()
+        self._conexion = None
+        self._pid = None
+
+    def _conectar(self):
+        # Una conexión por proceso: no se comparte a través de fork()
+        if self._conexion is None or self._pid != os.getpid():
+            import sqlite3
+            conexion = sqlite3.connect(self.ruta, timeout=5, check_same_thread=False, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS sesiones ("
+                "user_id TEXT PRIMARY KEY, datos TEXT NOT NULL, expira REAL NOT NULL)"
+            )
+            self._conexion = conexion
+            self._pid = os.getpid()
+        return self._conexion
+
+    def obtener(self, user_id):
+        with self._lock:
+            fila = self._conectar().execute(
+                "SELECT datos FROM sesiones WHERE user_id = ? AND expira > ?",
+                (user_id, time.time()),
+            ).fetchone()
+        return Sesion.deserializar(fila[0]) if fila else None
+
+    def guardar(self, user_id, sesion):
+        ahora = time.time()
+        with self._lock:
+            conexion = self._conectar()
+            conexion.execute(
+                "INSERT OR REPLACE INTO sesiones (user_id, datos, expira) VALUES (?, ?, ?)",
+                (user_id, sesion.serializar(), ahora + self.ttl),
+            )
+            self._escrituras += 1
+            if self._escrituras % self.purgar_cada == 0:
+                conexion.execute("DELETE FROM sesiones WHERE expira <= ?", (ahora,))
+
+    def eliminar(self, user_id):
+        with self._lock:
+            self._conectar().execute("DELETE FROM sesiones WHERE user_id = ?", (user_id,))
+
+    def usuarios(self):
+        with self._lock:
+            filas = self._conectar().execute(
+                "SELECT user_id, datos FROM sesiones WHERE expira > ?", (time.time(),)
+            ).fetchall()
+        return [(user_id, Sesion.deserializar(datos)) for user_id, datos in filas]
+
+    def __len__(self):
+        with self._lock:
+            return self._conectar().execute(
+                "SELECT COUNT(*) FROM sesiones WHERE expira > ?", (time.time(),)
+            ).fetchone()[0]
+
+    def cerrar(self):
+        if self._conexion is not None:
+            self._conexion.close()
+            self._conexion = None
+
+
+class ErrorRedis(Exception):
+    """El servidor respondió con un error o cerró la conexión."""
+
+
+class ClienteRESP:
+    """Cliente mínimo y bloqueante del protocolo de Redis (RESP2).
+
+    Solo lo que necesitan los almacenes: un comando por vez sobre una
+    conexión persistente por proceso. Cualquier falla de red llega como
+    ErrorRedis; si no se pudo conectar, durante `espera_reconexion` segundos
+    los comandos fallan enseguida en vez de esperar otro timeout.
+    """
+
+    def __init__(self, url="redis://127.0.0.1:6379/0", timeout=2.0, espera_reconexion=1.0):
+        partes = urlsplit(url)
+        self.host = partes.hostname or "127.0.0.1"
+        self.puerto = partes.port or 6379
+        self.password = partes.password
+        self.db = int(partes.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.espera_reconexion = espera_reconexion
+        self._lock = threading.Lock()
+        self._socket = None
+        self._lector = None
+        self._pid = None
+        self._ultimo_error = None  # (monotonic, mensaje) de la última conexión fallida
+
+    def _conectar(self):
+        if self._ultimo_error is not None and time.monotonic() - self._ultimo_error[0] < self.espera_reconexion:
+            raise ErrorRedis(self._ultimo_error[1])
+        try:
+            self._socket = socket.create_connection((self.host, self.puerto), timeout=self.timeout)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._lector = self._socket.makefile("rb")
+            self._pid = os.getpid()
+            if self.password:
+                self._ejecutar(("AUTH", self.password))
+            if self.db:
+                self._ejecutar(("SELECT", self.db))
+        except (OSError, ErrorRedis) as e:
+            self._cerrar()
+            self._ultimo_error = (time.monotonic(), f"no se pudo conectar a Redis en {self.host}:{self.puerto}: {e}")
+            raise ErrorRedis(self._ultimo_error[1]) from e
+        self._ultimo_error = None
+
+    def _cerrar(self):
+        if self._socket is not None:
+            try:
+                if self._lector is not None:
+                    self._lector.close()
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+        self._lector = None
+
+    def _leer(self):
+        linea = self._lector.readline()
+        if not linea:
+            raise ErrorRedis("conexión cerrada por el servidor")
+        tipo, resto = linea[:1], linea[1:-2]
+        if tipo == b"+":
+            return resto.decode()
+        if tipo == b"-":
+            raise ErrorRedis(resto.decode())
+        if tipo == b":":
+            return int(resto)
+        if tipo == b"$":
+            largo = int(resto)
+            if largo < 0:
+                return None
+            datos = self._lector.read(largo + 2)
+            return datos[:-2].decode()
+        if tipo == b"*":
+            largo = int(resto)
+            if largo < 0:
+                return None
+            return [self._leer() for _ in range(largo)]
+        raise ErrorRedis(f"respuesta desconocida: {linea!r}")
+
+    def _ejecutar(self, argumentos):
+        partes = [f"*{len(argumentos)}\r\n".encode()]
+        for argumento in argumentos:
+            datos = argumento if isinstance(argumento, bytes) else str(argumento).encode()
+            partes.append(b"$%d\r\n%s\r\n" % (len(datos), datos))
+        self._socket.sendall(b"".join(partes))
+        return self._leer()
+
+    def comando(self, *argumentos):
+        with self._lock:
+            for intento in range(2):
+                try:
+                    if self._socket is None or self._pid != os.getpid():
+                        self._conectar()  # si falla cierra el socket y lanza ErrorRedis
+                    return self._ejecutar(argumentos)
+                except (OSError, ErrorRedis) as e:
+                    if isinstance(e, ErrorRedis) and "conexión cerrada" not in str(e):
+                        raise
+                    # Conexión rota: se descarta y se reintenta una vez con una nueva
+                    self._cerrar()
+                    if intento == 1:
+                        raise ErrorRedis(f"no se pudo hablar con Redis: {e}") from e
+
+    def cerrar(self):
+        with self._lock:
+            self._cerrar()
+
+
+class AlmacenRedis(AlmacenSesiones):
+    """Sesiones en Redis con expiración nativa (SET ... EX).
+
+    Bloqueante, como ClienteRESP: cada operación espera la respuesta del
+    servidor en el event loop (ver la nota al principio del módulo).
+    """
+
+    def __init__(self, url="redis://127.0.0.1:6379/0", ttl=86400, prefijo="aiuda:sesion:"):
+        self.cliente = ClienteRESP(url)
+        self.ttl = ttl
+        self.prefijo = prefijo
+
+    def obtener(self, user_id):
+        datos = self.cliente.comando("GET", self.prefijo + user_id)
+        return Sesion.deserializar(datos) if datos else None
+
+    def guardar(self, user_id, sesion):
+        self.cliente.comando("SET", self.prefijo + user_id, sesion.serializar(), "EX", int(self.ttl))
+
+    def eliminar(self, user_id):
+        self.cliente.comando("DEL", self.prefijo + user_id)
+
+    def usuarios(self):
+        resultado = []
+        cursor = "0"
+        while True:
+            cursor, claves = self.cliente.comando("SCAN", cursor, "MATCH", self.prefijo + "*", "COUNT", 1000)
+            if claves:
+                # Una que expiró entre el SCAN y el MGET llega como None
+                for clave, datos in zip(claves, self.cliente.comando("MGET", *claves)):
+                    if datos:
+                        resultado.append((clave[len(self.prefijo):], Sesion.deserializar(datos)))
+            if cursor == "0":
+                return resultado
+
+    def __len__(self):
+        total = 0
+        cursor = "0"
+        while True:
+            cursor, claves = self.cliente.comando("SCAN", cursor, "MATCH", self.prefijo + "*", "COUNT", 1000)
+            total += len(claves)
+            if cursor == "0":
+                return total
+
+    def cerrar(self):
+        self.cliente.cerrar()
+
+
+def crear_almacen_sesiones(backend="memoria", ttl=86400, max_sesiones=100_000,
+                           ruta_sqlite="sesiones.db", url_redis="redis://127.0.0.1:6379/0"):
+    if backend == "memoria":
+        return AlmacenMemoria(max_sesiones=max_sesiones, ttl=ttl)
+    if backend == "sqlite":
+        return AlmacenSQLite(ruta_sqlite, ttl=ttl)
+    if backend == "redis":
+        return AlmacenRedis(url_redis, ttl=ttl)
+    raise ValueError(f"Backend de sesiones desconocido: {backend}")
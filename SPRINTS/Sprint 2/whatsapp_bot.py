@@ -1,308 +1,585 @@
-from fastapi import FastAPI, Form, Request, BackgroundTasks
-from fastapi.responses import Response
-from twilio.twiml.messaging_response import MessagingResponse
-from twilio.rest import Client
-import json
-import uvicorn
+# Primero que todo: mide cuánto tarda en importarse el resto (ver arranque.py)
+from arranque import Arranque
+arranque = Arranque()
+
+from fastapi import Body, Depends, FastAPI, Form, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
+import hmac
 import asyncio
 import os
+import threading
+import time
+from analitica import Analitica
+from contenido import AlmacenContenido
+from crisis import DetectorCrisis
+from envios import ClienteTwilio, PipelineEnvios
+from planificador import Planificador
+from diario import Diario, repartir as repartir_diario, ruta_particion
+from ingesta import ColaIngesta
+from difusion import BaseDifusiones, Difusor, ErrorDifusion, Omitido, filtrar_sesiones, redactar
+from reparto import ErrorReparto, Reparto, RepartirWebhook, particion
+from firma import AdmisionWebhook, FiltrarWebhook, ValidadorFirma
+from motor_ejercicios import MotorEjercicios
+import respuestas
+from respuestas import CacheRespuestas
+import intenciones
+from intenciones import ClasificadorIntenciones
+from sesiones import Sesion, crear_almacen_sesiones
+from concurrencia import CerrojosPorUsuario, MonitorEventLoop
+from deduplicacion import CacheDeduplicacion, RespaldoRedis
+from registro import obtener_registro, descartados as registros_descartados
+from metricas import TIPO_CONTENIDO, MedirRutas, RegistroMetricas
+from perfilado import ErrorPerfil, Perfilador, TrazarPeticiones, Trazas
 
 app = FastAPI(title="AIuda WhatsApp Bot", version="2.1.0")
 
+# Registro JSON asíncrono y muestreado; nivel y muestreo por ruta en REGISTRO_CONFIG
+registro_webhook = obtener_registro("/whatsapp")
+
+# Métricas para /metrics (Prometheus); solo se actualizan desde el event loop
+metricas = RegistroMetricas()
+app.add_middleware(MedirRutas, histograma=metricas.histograma(
+    "aiuda_http_segundos", "Latencia de las peticiones HTTP por ruta y estado de la sesión", ("ruta", "estado")))
+ramas_mensajes = metricas.contador(
+    "aiuda_mensajes_total", "Mensajes procesados por rama de procesar_mensaje", ("rama",))
+
+# Perfilado bajo demanda (/admin/perfil) y trazas por petición con las pilas de las lentas (/admin/trazas)
+# Apagadas no cuestan nada; PERFIL_TRAZAS=1 las enciende al arrancar, POST /admin/trazas en caliente
+trazas = Trazas(
+    activo=os.getenv("PERFIL_TRAZAS", "0") == "1",
+    umbral=float(os.getenv("PERFIL_UMBRAL_MS", "1000")) / 1000,
+    capacidad=int(os.getenv("PERFIL_LENTAS", "50")),
+)
+perfilador = Perfilador(max_segundos=float(os.getenv("PERFIL_MAX_SEGUNDOS", "60")))
+
+def contar_rama(rama):
+    ramas_mensajes.inc(rama)
+    trazas.anotar(rama=rama)
+
 # Configuración de Twilio (necesaria para enviar mensajes automáticos)
 # IMPORTANTE: Agrega estas variables de entorno o configúralas directamente
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
 TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER", "whatsapp:+14155238886")
+TWILIO_API_URL = os.getenv("TWILIO_API_URL", "https://api.twilio.com")
 
 # Cliente de Twilio para enviar mensajes proactivos
 twilio_client = None
 if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
-    twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    twilio_client = ClienteTwilio(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, url_base=TWILIO_API_URL)
 
-# Almacenamiento de sesiones en memoria
-sesiones_usuario = {}
+# Envíos salientes: colas + trabajadores, sin bloquear el event loop
+# Límites en mensajes por segundo del número remitente y de cada destinatario (0 = sin límite)
+pipeline_envios = PipelineEnvios(
+    twilio_client,
+    TWILIO_WHATSAPP_NUMBER,
+    trabajadores=int(os.getenv("ENVIOS_TRABAJADORES", "8")),
+    capacidad=int(os.getenv("ENVIOS_CAPACIDAD", "1000")),
+    histograma_envio=metricas.histograma("aiuda_envio_segundos", "Duración de cada envío a Twilio"),
+    tasa_remitente=float(os.getenv("ENVIOS_TASA_REMITENTE", "80")) or None,
+    tasa_destino=float(os.getenv("ENVIOS_TASA_DESTINO", "1")) or None,
+    rafaga_destino=float(os.getenv("ENVIOS_RAFAGA_DESTINO", "3")),
+    trazas=trazas,
+)
 
-# Cargar configuraciones
-def cargar_json(archivo):
-    try:
-        with open(archivo, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print(f"❌ ERROR: No se encuentra {archivo}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"❌ ERROR en {archivo}: {e}")
-        return None
+# Diario de sesiones y pasos programados: los ejercicios en curso sobreviven a reinicios y deploys
+# (DIARIO_RUTA vacío lo desactiva; al reanudar se saltean los pasos vencidos hace más de DIARIO_GRACIA s)
+DIARIO_RUTA = os.getenv("DIARIO_RUTA", "diario.jsonl")
+DIARIO_GRACIA = float(os.getenv("DIARIO_GRACIA", "10"))
+registro_diario = obtener_registro("diario")
+diario = None
+if DIARIO_RUTA:
+    diario = Diario(
+        DIARIO_RUTA,
+        intervalo=float(os.getenv("DIARIO_INTERVALO", "0.05")),
+        ttl=int(os.getenv("SESIONES_TTL", "86400")),
+        histograma_fsync=metricas.histograma("aiuda_diario_fsync_segundos", "Duración de cada write + fsync del diario"),
+    )
+
+# Eventos de los ejercicios para los embudos de /admin/analitica/embudo (ANALITICA_SQLITE vacío lo desactiva)
+ANALITICA_SQLITE = os.getenv("ANALITICA_SQLITE", "analitica.db")
+analitica = None
+if ANALITICA_SQLITE:
+    analitica = Analitica(
+        ANALITICA_SQLITE,
+        intervalo=float(os.getenv("ANALITICA_INTERVALO", "1")),
+        capacidad=int(os.getenv("ANALITICA_CAPACIDAD", "100000")),
+        sal=os.getenv("ANALITICA_SAL", "aiuda"),
+    )
+
+# Pasos temporizados de todos los ejercicios en curso: un heap y una sola tarea
+# (EJERCICIOS_ESCALA_TIEMPO < 1 acorta las esperas, solo para pruebas de carga)
+planificador = Planificador(
+    pipeline_envios.encolar,
+    escala=float(os.getenv("EJERCICIOS_ESCALA_TIEMPO", "1")),
+    ventana_agrupar=float(os.getenv("ENVIOS_VENTANA_AGRUPAR", "1")),
+    diario=diario,
+    trazas=trazas,
+)
+
+# Almacenamiento de sesiones: memoria (LRU + TTL), sqlite o redis para varios workers
+# (redis bloquea el event loop en cada acceso: solo con un servidor local o de baja latencia)
+almacen_sesiones = crear_almacen_sesiones(
+    os.getenv("SESIONES_BACKEND", "memoria"),
+    ttl=int(os.getenv("SESIONES_TTL", "86400")),
+    max_sesiones=int(os.getenv("SESIONES_MAX", "100000")),
+    ruta_sqlite=os.getenv("SESIONES_SQLITE", "sesiones.db"),
+    url_redis=os.getenv("SESIONES_REDIS_URL", "redis://127.0.0.1:6379/0"),
+)
+
+# Un lock por usuario: sus mensajes se procesan en orden, los de otros en paralelo
+cerrojos_usuarios = CerrojosPorUsuario()
+
+# Retraso del event loop y tareas vivas, para /test y las pruebas de carga
+monitor_loop = MonitorEventLoop(histograma=metricas.histograma(
+    "aiuda_event_loop_retraso_segundos", "Retraso del event loop en cada muestra del monitor"))
+
+# Respuestas por MessageSid: los reintentos de Twilio no se procesan dos veces
+DEDUP_REDIS_URL = os.getenv("DEDUP_REDIS_URL", "")
+cache_dedup = CacheDeduplicacion(
+    max_entradas=int(os.getenv("DEDUP_MAX", "50000")),
+    ventana=int(os.getenv("DEDUP_VENTANA", "600")),
+    respaldo=RespaldoRedis(DEDUP_REDIS_URL) if DEDUP_REDIS_URL else None,
+)
+
+# Firma X-Twilio-Signature y límites de admisión, antes de parsear el formulario
+# Sin auth token (desarrollo local) solo se aplican los límites; el de remitente, solo ahí
+validar_firma = TWILIO_AUTH_TOKEN and os.getenv("TWILIO_VALIDAR_FIRMA", "1") == "1"
+admision_webhook = AdmisionWebhook(
+    validador=ValidadorFirma(TWILIO_AUTH_TOKEN) if validar_firma else None,
+    url_publica=os.getenv("WEBHOOK_URL_PUBLICA", ""),
+    fallos_ip=float(os.getenv("ADMISION_FALLOS_IP", "1")),
+    rafaga_ip=float(os.getenv("ADMISION_RAFAGA_IP", "20")),
+    tasa_remitente=float(os.getenv("ADMISION_TASA_REMITENTE", "5")),
+    rafaga_remitente=float(os.getenv("ADMISION_RAFAGA_REMITENTE", "30")),
+    ventana_reintentos=cache_dedup.ventana,
+    encabezado_ip=os.getenv("ADMISION_CABECERA_IP", ""),
+)
+app.add_middleware(FiltrarWebhook, admision=admision_webhook)
+app.add_middleware(TrazarPeticiones, trazas=trazas)  # incluye la admisión, no el reenvío a otro worker
+if not validar_firma:
+    registro_webhook.warning("firma_sin_validar", motivo="sin auth token" if not TWILIO_AUTH_TOKEN else "desactivada")
+
+# Con varios workers (lanzador.py) cada usuario lo atiende el worker dueño de su From;
+# el webhook que llega a otro se le reenvía antes de medirlo, admitirlo o procesarlo
+reparto = Reparto()
+app.add_middleware(RepartirWebhook, reparto=reparto, max_bytes=admision_webhook.max_bytes)
+
+# Contenido (menu.json y ejercicios.json) cargado una vez y recargado al cambiar
+almacen_contenido = AlmacenContenido(
+    {"menu": "menu.json", "ejercicios": "ejercicios.json"},
+    intervalo=float(os.getenv("CONTENIDO_INTERVALO", "2")),
+)
 
 def cargar_menu():
-    return cargar_json("menu.json")
+    return almacen_contenido.actual().menu
 
 def cargar_ejercicios():
-    return cargar_json("ejercicios.json")
+    return almacen_contenido.actual().ejercicios
+
+# Textos fijos y su TwiML, armados una vez por cada carga del contenido
+cache_respuestas = CacheRespuestas()
+almacen_contenido.suscribir(cache_respuestas.preparar)
+
+# Intención de cada mensaje (comando, saludo, urgencia, opción) en una sola búsqueda
+clasificador = ClasificadorIntenciones()
+almacen_contenido.suscribir(clasificador.preparar)
+
+# Frases de crisis (palabras_crisis de menu.json) en cualquier parte del texto, en cualquier estado
+detector_crisis = DetectorCrisis()
+almacen_contenido.suscribir(detector_crisis.preparar)
 
 # Formatear menú para WhatsApp
 def formatear_menu_whatsapp():
-    menu = cargar_menu()
-    if not menu:
-        return "Error al cargar el menú. Por favor contacta al administrador."
-    
-    mensaje = menu["bienvenida"] + "\n\n"
-    mensaje += menu["menu_principal"]["titulo"] + "\n\n"
-    
-    for opcion in menu["menu_principal"]["opciones"]:
-        mensaje += f"{opcion['emoji']} *{opcion['id']}*. {opcion['nombre']}\n"
-    
-    mensaje += "\n_Escribe el número de la opción que prefieras._"
-    return mensaje
+    almacen_contenido.actual()
+    return cache_respuestas.menu
 
 # Gestión de sesiones
 def obtener_sesion(user_id):
-    if user_id not in sesiones_usuario:
-        sesiones_usuario[user_id] = {
-            "estado": "menu",
-            "ejercicio_actual": None,
-            "paso_actual": 0,
-            "esperando_respuesta": False
-        }
-    return sesiones_usuario[user_id]
-
-def actualizar_sesion(user_id, estado=None, ejercicio=None, paso=None, esperando=None):
+    # Una sesión que no existe equivale a una nueva en el menú; no se guarda hasta que cambie
+    sesion = almacen_sesiones.obtener(user_id)
+    return sesion if sesion is not None else Sesion()
+
+def actualizar_sesion(user_id, estado=None, ejercicio=None, paso=None, esperando=None, ejecucion=None):
     sesion = obtener_sesion(user_id)
     if estado is not None:
-        sesion["estado"] = estado
+        sesion.estado = estado
     if ejercicio is not None:
-        sesion["ejercicio_actual"] = ejercicio
+        sesion.ejercicio_actual = ejercicio
     if paso is not None:
-        sesion["paso_actual"] = paso
+        sesion.paso_actual = paso
     if esperando is not None:
-        sesion["esperando_respuesta"] = esperando
+        sesion.esperando_respuesta = esperando
+    if ejecucion is not None:
+        sesion.ejecucion = ejecucion
+    almacen_sesiones.guardar(user_id, sesion)
+    if diario is not None:
+        diario.registrar_sesion(user_id, sesion.a_tupla())
     return sesion
 
 def reiniciar_sesion(user_id):
-    sesiones_usuario[user_id] = {
-        "estado": "menu",
-        "ejercicio_actual": None,
-        "paso_actual": 0,
-        "esperando_respuesta": False
-    }
+    # Lo que quede pendiente del ejercicio anterior ya no debe enviarse
+    cancelar_ejercicio(user_id)
+    almacen_sesiones.eliminar(user_id)
+    if diario is not None:
+        diario.registrar_sesion(user_id, None)
 
-# Enviar mensaje de WhatsApp proactivo
-async def enviar_mensaje_whatsapp(destinatario, mensaje, delay=0):
-    """Envía un mensaje de WhatsApp con un delay opcional"""
-    if delay > 0:
-        await asyncio.sleep(delay)
-    
-    if not twilio_client:
-        print(f"⚠️ Twilio no configurado. Mensaje simulado: {mensaje[:50]}...")
-        return
-    
-    try:
-        message = twilio_client.messages.create(
-            from_=TWILIO_WHATSAPP_NUMBER,
-            body=mensaje,
-            to=destinatario
-        )
-        print(f"✉️ Mensaje automático enviado a {destinatario}: {mensaje[:50]}...")
-        return message
-    except Exception as e:
-        print(f"❌ Error al enviar mensaje: {e}")
-        return None
-
-# Ejecutar ejercicio de respiración automático
-async def ejecutar_respiracion_automatica(destinatario):
-    """Ejecuta el ejercicio de respiración con mensajes automáticos"""
-    ejercicios = cargar_ejercicios()
-    if not ejercicios or "respiracion" not in ejercicios:
-        return
-    
-    pasos_respiracion = [
-        (0, "Vamos a comenzar. Prepárate..."),
-        (2, "Inhala profundamente por la nariz... 🌬️\n1... 2... 3... 4..."),
-        (5, "Mantén el aire... ⏸️\n1... 2... 3... 4..."),
-        (5, "Exhala lentamente por la boca... 💨\n1... 2... 3... 4... 5... 6..."),
-        (3, "Muy bien 👏 Vamos con el segundo ciclo..."),
-        (2, "Inhala profundamente... 🌬️\n1... 2... 3... 4..."),
-        (5, "Mantén... ⏸️\n1... 2... 3... 4..."),
-        (5, "Exhala... 💨\n1... 2... 3... 4... 5... 6..."),
-        (3, "Último ciclo, lo estás haciendo genial..."),
-        (2, "Inhala... 🌬️"),
-        (5, "Mantén... ⏸️"),
-        (5, "Exhala... 💨"),
-        (3, "✨ Excelente trabajo ✨\n\n¿Cómo te sientes ahora?\n\nPuedes escribir cómo te sientes o escribe *menu* para volver.")
-    ]
-    
-    for delay, mensaje in pasos_respiracion:
-        await enviar_mensaje_whatsapp(destinatario, mensaje, delay)
-    
-    # Marcar ejercicio como completado
-    actualizar_sesion(destinatario, estado="esperando_feedback", esperando=True)
-
-# Ejecutar ejercicio de grounding interactivo
-async def ejecutar_grounding_interactivo(destinatario):
-    """Inicia el ejercicio de grounding que requiere respuestas del usuario"""
-    ejercicios = cargar_ejercicios()
-    if not ejercicios or "grounding" not in ejercicios:
+# Ejercicio en curso de cada sesión
+def programar_ejercicio(user_id, guion):
+    """Programa el guion (reemplazando cualquier otro en curso) y guarda su id en la sesión"""
+    ejecucion = planificador.programar(user_id, guion)
+    actualizar_sesion(user_id, ejecucion=ejecucion)
+    return ejecucion
+
+def cancelar_ejercicio(user_id):
+    """Cancela los pasos pendientes del ejercicio en curso. Devuelve cuántos envíos se evitaron"""
+    sesion = almacen_sesiones.obtener(user_id)
+    if sesion is None:
+        return 0
+    anotar_abandono(user_id, sesion)
+    if sesion.ejecucion is None:
+        return 0
+    return planificador.cancelar(user_id, sesion.ejecucion)
+
+# Estados de una sesión con un ejercicio sin terminar
+ESTADOS_EJERCICIO = ("iniciando_ejercicio", "en_ejercicio", "en_ejercicio_auto")
+
+def anotar_abandono(user_id, sesion):
+    """Evento de analítica si la sesión deja un ejercicio a medias"""
+    if analitica is None or sesion.estado not in ESTADOS_EJERCICIO:
         return
-    
-    await enviar_mensaje_whatsapp(
-        destinatario,
-        "Perfecto 🌍\n\nVamos a hacer el ejercicio de grounding paso a paso.\n\nTe iré guiando con cada sentido.",
-        0
-    )
-    
-    await enviar_mensaje_whatsapp(
-        destinatario,
-        "👀 Paso 1: VISTA\n\nMira a tu alrededor y dime:\n¿Qué 5 cosas puedes ver?\n\nPueden ser objetos, colores, formas... Tómate tu tiempo.",
-        3
-    )
-    
-    actualizar_sesion(destinatario, estado="en_ejercicio", ejercicio="grounding", paso=1, esperando=True)
+    # Pasos interactivos respondidos: si espera la respuesta del paso N, respondió hasta N - 1
+    respondidos = 0
+    if sesion.estado == "en_ejercicio":
+        respondidos = sesion.paso_actual - 1 if sesion.esperando_respuesta else sesion.paso_actual
+    analitica.registrar("cancelado", user_id, sesion.ejercicio_actual, respondidos)
 
-# Continuar grounding según el paso
-async def continuar_grounding(destinatario, respuesta_usuario, paso):
-    """Continúa el ejercicio de grounding según el paso actual"""
-    
-    respuestas_empaticas = [
-        f"Muy bien 👍\n\n{respuesta_usuario}\n\nGracias por compartir.",
-        f"Excelente observación 🎵\n\n{respuesta_usuario}",
-        f"Perfecto 👃\n\n{respuesta_usuario}",
-        f"Genial 😊\n\n{respuesta_usuario}"
-    ]
-    
-    proximos_pasos = [
-        (2, "✋ Paso 2: TACTO\n\nAhora identifica:\n¿Qué 4 cosas puedes tocar?\n\nPuede ser la textura de tu ropa, una superficie, el aire..."),
-        (2, "👂 Paso 3: OÍDO\n\nConcentra tu atención:\n¿Qué 3 sonidos puedes escuchar?\n\nPueden ser cercanos o lejanos, fuertes o sutiles."),
-        (2, "👃 Paso 4: OLFATO\n\nAhora nota:\n¿Qué 2 aromas puedes percibir?\n\nPuede ser el aire, tu perfume, cualquier olor sutil."),
-        (2, "👅 Paso 5: GUSTO\n\nFinalmente:\n¿Qué 1 sabor percibes o recuerdas?\n\nPuede ser el sabor en tu boca o un sabor que te guste.")
-    ]
-    
-    if paso <= len(respuestas_empaticas):
-        # Responder empáticamente
-        await enviar_mensaje_whatsapp(destinatario, respuestas_empaticas[paso - 1], 1)
-        
-        # Dar el siguiente paso
-        if paso < len(proximos_pasos):
-            delay, siguiente_instruccion = proximos_pasos[paso - 1]
-            await enviar_mensaje_whatsapp(destinatario, siguiente_instruccion, delay)
-            actualizar_sesion(destinatario, paso=paso + 1, esperando=True)
+# Cierre de cada tramo de un ejercicio (lo llama el planificador tras su último paso)
+def terminar_tramo(user_id, programa, indice):
+    if indice < len(programa.respuestas):
+        # El tramo terminó en un paso interactivo: esperar la respuesta número indice + 1
+        actualizar_sesion(user_id, estado="en_ejercicio", ejercicio=programa.nombre, paso=indice + 1, esperando=True)
+    else:
+        if analitica is not None:
+            analitica.registrar("completado", user_id, programa.nombre)
+        if programa.estado_final == "esperando_feedback":
+            actualizar_sesion(user_id, estado="esperando_feedback", esperando=True)
         else:
-            # Finalizar
-            await enviar_mensaje_whatsapp(
-                destinatario,
-                "🎉 ¡Lo lograste! 🎉\n\nHas completado el ejercicio de grounding.\n\n¿Te sientes más conectado con el presente?\n\nEscribe *menu* para volver al inicio.",
-                2
-            )
-            actualizar_sesion(destinatario, estado="esperando_feedback", esperando=True)
-
-# Ejecutar mindfulness automático
-async def ejecutar_mindfulness_automatico(destinatario):
-    """Ejecuta mindfulness con mensajes automáticos"""
-    
-    pasos_mindfulness = [
-        (0, "🧘 Vamos a practicar un momento de mindfulness..."),
-        (3, "Siéntate cómodamente.\n\nCierra los ojos si te sientes seguro haciéndolo.\n\nRespira naturalmente."),
-        (8, "Observa tu respiración...\n\n¿Cómo entra el aire?\n¿Cómo sale?\n\nSolo observa, sin juzgar."),
-        (10, "Ahora lleva tu atención a tu cuerpo.\n\n¿Sientes tensión en algún lugar?\n\nHombros... Mandíbula... Frente..."),
-        (8, "No intentes cambiar nada.\n\nSolo observa con curiosidad y amabilidad hacia ti mismo."),
-        (10, "Si tu mente divaga, está bien.\n\nEs completamente normal.\n\nSimplemente nota que estás pensando..."),
-        (5, "Y con suavidad, vuelve tu atención a tu respiración."),
-        (8, "✨ Muy bien hecho ✨\n\nCada vez que practicas, fortaleces tu capacidad de estar presente.\n\nEscribe *menu* cuando quieras volver al inicio.")
-    ]
-    
-    for delay, mensaje in pasos_mindfulness:
-        await enviar_mensaje_whatsapp(destinatario, mensaje, delay)
-    
-    actualizar_sesion(destinatario, estado="menu", esperando=False)
+            actualizar_sesion(user_id, estado="menu", esperando=False)
+
+# Ejercicios compilados desde ejercicios.json (se recompilan al recargar el contenido)
+motor_ejercicios = MotorEjercicios(terminar_tramo)
+almacen_contenido.suscribir(motor_ejercicios.preparar)
+
+# Estado anterior a un reinicio
+def restaurar_estado():
+    """Reconstruye sesiones y ejercicios en curso desde el diario"""
+    sesiones, pasos = diario.cargar()
+    for user_id, tupla in sesiones.items():
+        # Con sqlite o redis la sesión ya está guardada (y es igual o más nueva)
+        if almacen_sesiones.obtener(user_id) is None:
+            almacen_sesiones.guardar(user_id, Sesion(*tupla))
+    rearmados = 0
+    for user_id, (ref, paso, vence) in pasos.items():
+        guion = motor_ejercicios.reconstruir(ref)
+        if guion is None or paso >= len(guion.pasos):
+            diario.registrar_fin(user_id)  # el contenido cambió y ese tramo ya no existe
+            continue
+        ejecucion = planificador.reanudar(user_id, guion, paso, vence, gracia=DIARIO_GRACIA)
+        sesion = almacen_sesiones.obtener(user_id)
+        if ejecucion is not None and sesion is not None:
+            # Los ids de ejecución son del proceso: no hace falta anotarlos de nuevo
+            sesion.ejecucion = ejecucion
+            almacen_sesiones.guardar(user_id, sesion)
+            rearmados += 1
+    registro_diario.info("estado_restaurado", sesiones=len(sesiones), ejercicios=rearmados,
+                          pasos_saltados=planificador.pasos_saltados,
+                          segundos=round(diario.segundos_carga, 3))
 
 # Iniciar ejercicio
-def iniciar_ejercicio(user_id, tipo_ejercicio, background_tasks: BackgroundTasks):
-    ejercicios = cargar_ejercicios()
-    if not ejercicios or tipo_ejercicio not in ejercicios:
-        return "Lo siento, ese ejercicio no está disponible."
-    
-    if tipo_ejercicio == "respiracion":
-        # Ejercicio automático
-        background_tasks.add_task(ejecutar_respiracion_automatica, user_id)
-        actualizar_sesion(user_id, estado="en_ejercicio_auto", ejercicio=tipo_ejercicio)
-        return ejercicios[tipo_ejercicio]["introduccion"]
-    
-    elif tipo_ejercicio == "grounding":
-        # Ejercicio interactivo
-        background_tasks.add_task(ejecutar_grounding_interactivo, user_id)
-        actualizar_sesion(user_id, estado="iniciando_ejercicio", ejercicio=tipo_ejercicio)
-        return "Preparando el ejercicio de grounding... 🌍"
-    
-    elif tipo_ejercicio == "mindfulness":
-        # Ejercicio automático
-        background_tasks.add_task(ejecutar_mindfulness_automatico, user_id)
-        actualizar_sesion(user_id, estado="en_ejercicio_auto", ejercicio=tipo_ejercicio)
-        return ejercicios[tipo_ejercicio]["introduccion"]
+def iniciar_ejercicio(user_id, tipo_ejercicio):
+    programa = motor_ejercicios.obtener(tipo_ejercicio)
+    if programa is None:
+        return respuestas.EJERCICIO_NO_DISPONIBLE
+    
+    # Empezar otro ejercicio deja el anterior a medias
+    anotar_abandono(user_id, obtener_sesion(user_id))
+    programar_ejercicio(user_id, programa.guiones[0])
+    estado = "iniciando_ejercicio" if programa.interactivo else "en_ejercicio_auto"
+    actualizar_sesion(user_id, estado=estado, ejercicio=tipo_ejercicio)
+    if analitica is not None:
+        analitica.registrar("inicio", user_id, tipo_ejercicio)
+    return programa.introduccion
+
+# Continuar un ejercicio interactivo con la respuesta del usuario
+def continuar_ejercicio(user_id, sesion, texto):
+    programa = motor_ejercicios.obtener(sesion.ejercicio_actual)
+    if programa is None or not 1 <= sesion.paso_actual <= len(programa.respuestas):
+        reiniciar_sesion(user_id)
+        return "Lo siento, ese ejercicio ya no está disponible.\n\nEscribe *menu* para ver las opciones."
     
-    return "Ejercicio no implementado aún."
+    actualizar_sesion(user_id, esperando=False)
+    programar_ejercicio(user_id, programa.guion_respuesta(sesion.paso_actual, texto))
+    if analitica is not None:
+        analitica.registrar("paso", user_id, programa.nombre, sesion.paso_actual)
+    return None  # No responder inmediatamente, lo hará el planificador
 
 # Procesar mensaje del usuario
-def procesar_mensaje(user_id, texto_usuario, background_tasks: BackgroundTasks):
-    menu = cargar_menu()
-    if not menu:
-        return "Error del sistema. Por favor intenta más tarde."
+def procesar_mensaje(user_id, texto_usuario):
+    contenido = almacen_contenido.actual()
+    if not contenido.menu:
+        contar_rama("error_sistema")
+        return respuestas.ERROR_SISTEMA
     
     sesion = obtener_sesion(user_id)
     texto = texto_usuario.strip()
+    intencion, valor = clasificador.clasificar(texto)
+    
+    # Ayuda urgente: antes que todo, también en medio de un ejercicio o como feedback
+    frase = detector_crisis.buscar(texto) if intencion == intenciones.OTRO else None
+    if intencion == intenciones.URGENTE or frase is not None:
+        contar_rama("urgente")
+        registro_webhook.warning("ayuda_urgente", de=user_id, frase=frase, estado=sesion.estado,
+                                 ejercicio=sesion.ejercicio_actual)
+        reiniciar_sesion(user_id)  # cancela los pasos pendientes del ejercicio
+        return cache_respuestas.urgente
     
     # Comandos globales
-    if texto.lower() in ["menu", "salir", "cancelar", "stop"]:
+    if intencion == intenciones.COMANDO:
+        contar_rama("menu")
         reiniciar_sesion(user_id)
         return formatear_menu_whatsapp()
     
     # Si está esperando feedback después de un ejercicio
-    if sesion["estado"] == "esperando_feedback":
+    if sesion.estado == "esperando_feedback":
+        contar_rama("feedback")
+        if analitica is not None:
+            # Sin ejercicio, la respuesta es a un check-in de una difusión
+            analitica.registrar("feedback", user_id, sesion.ejercicio_actual or "difusion", texto=texto)
         reiniciar_sesion(user_id)
-        return f"Me alegra que hayas compartido eso. 💚\n\n{formatear_menu_whatsapp()}"
+        return cache_respuestas.feedback
     
-    # Si está en grounding interactivo
-    if sesion["estado"] == "en_ejercicio" and sesion["ejercicio_actual"] == "grounding":
-        if sesion["esperando_respuesta"]:
-            paso = sesion["paso_actual"]
-            background_tasks.add_task(continuar_grounding, user_id, texto, paso)
-            actualizar_sesion(user_id, esperando=False)
-            return None  # No responder inmediatamente, lo hará la tarea en background
+    # Si está en un ejercicio interactivo esperando respuesta
+    if sesion.estado == "en_ejercicio" and sesion.esperando_respuesta:
+        contar_rama("paso_interactivo")
+        return continuar_ejercicio(user_id, sesion, texto)
     
     # Menú principal
-    if texto.lower() in ["hola", "inicio", "start", "hi", "hello"]:
+    if intencion == intenciones.SALUDO:
+        contar_rama("menu")
         reiniciar_sesion(user_id)
         return formatear_menu_whatsapp()
     
-    # Ayuda urgente
-    if texto.lower() in ["urgente", "ayuda", "sos", "emergency", "emergencia", "auxilio"]:
-        return menu["ayuda_urgente"]["mensaje"]
-    
-    # Selección por número
-    try:
-        opcion_num = int(texto)
-        opciones = menu["menu_principal"]["opciones"]
+    # Selección de una opción del menú (por número, palabra o nombre)
+    if intencion == intenciones.OPCION:
+        opcion = contenido.opciones_por_id[valor]
+        categoria = opcion["categoria"]
+        
+        if categoria == "urgente":
+            contar_rama("urgente")
+            return cache_respuestas.urgente
         
-        for opcion in opciones:
-            if opcion["id"] == opcion_num:
-                categoria = opcion["categoria"]
-                
-                if categoria == "urgente":
-                    return menu["ayuda_urgente"]["mensaje"]
-                
-                if categoria in ["respiracion", "grounding", "mindfulness"]:
-                    return iniciar_ejercicio(user_id, categoria, background_tasks)
-                
-                # Técnicas pendientes
-                respuesta = f"{opcion['emoji']} *{opcion['nombre']}*\n\n"
-                respuesta += f"{opcion['descripcion']}\n\n"
-                respuesta += "_Esta técnica estará disponible próximamente._\n\n"
-                respuesta += "Escribe *menu* para volver al inicio."
-                return respuesta
+        contar_rama("opcion")
+        if motor_ejercicios.obtener(categoria):
+            return iniciar_ejercicio(user_id, categoria)
         
-        return "❌ Opción no válida. Escribe *menu* para ver las opciones."
+        # Técnicas pendientes
+        return cache_respuestas.tecnicas_pendientes[valor]
+    
+    if intencion == intenciones.NUMERO:
+        contar_rama("opcion_invalida")
+        return respuestas.OPCION_NO_VALIDA
+    
+    contar_rama("desconocido")
+    return respuestas.NO_ENTENDI
+
+def registrar_mensaje(From, ProfileName, Body, estado_previo, sesion, respuesta_texto, inicio):
+    registro_webhook.info(
+        "mensaje",
+        de=From,
+        perfil=ProfileName,
+        texto=Body,
+        estado=estado_previo,
+        ejercicio=sesion.ejercicio_actual,
+        paso=sesion.paso_actual,
+        respuesta=respuesta_texto,
+        ms=round((time.perf_counter() - inicio) * 1000, 2),
+    )
+    arranque.primera_respuesta(registro_webhook, inicio)
+
+# Modo ingesta: el webhook solo encola y responde; estos trabajadores procesan y responden por la API
+async def procesar_ingresado(From, Body, ProfileName, recibido):
+    """Procesa un mensaje encolado por el webhook y envía la respuesta como mensaje saliente"""
+    try:
+        async with cerrojos_usuarios.de(From):
+            sesion = obtener_sesion(From)
+            estado_previo = sesion.estado
+            with trazas.tramo("procesar_mensaje"):
+                respuesta_texto = procesar_mensaje(From, Body)
+    except Exception:
+        registro_webhook.error("error_webhook", exc_info=True, de=From)
+        await pipeline_envios.encolar(From, respuestas.ERROR_TECNICO)
+        return
     
-    except ValueError:
-        return "No entendí tu mensaje. 🤔\n\nEscribe *menu* para ver las opciones."
+    if respuesta_texto is not None:
+        await pipeline_envios.encolar(From, respuesta_texto)
+    registrar_mensaje(From, ProfileName, Body, estado_previo, sesion, respuesta_texto, recibido)
+
+# MODO_INGESTA=1 lo activa; con la cola del remitente llena el webhook responde 503 + Retry-After
+MODO_INGESTA = os.getenv("MODO_INGESTA", "0") == "1"
+INGESTA_RETRY_AFTER = os.getenv("INGESTA_RETRY_AFTER", "2")
+INGESTA_DRENAJE = float(os.getenv("INGESTA_DRENAJE", "10"))
+cola_ingesta = None
+if MODO_INGESTA:
+    cola_ingesta = ColaIngesta(
+        procesar_ingresado,
+        trabajadores=int(os.getenv("INGESTA_TRABAJADORES", "8")),
+        capacidad=int(os.getenv("INGESTA_CAPACIDAD", "1000")),
+        histograma_espera=metricas.histograma(
+            "aiuda_ingesta_espera_segundos", "Tiempo de cada mensaje en la cola de ingesta"),
+        trazas=trazas,
+    )
+
+# Difusiones: check-ins y ejercicios para cohortes, desde /admin/difusiones o la CLI de difusion.py
+# (DIFUSION_SQLITE vacío las desactiva; DIFUSION_TASA por debajo de ENVIOS_TASA_REMITENTE deja lugar al webhook)
+async def preparar_difusion(numero, definicion, variables):
+    """Deja la sesión lista para la difusión. Devuelve (texto, None) o (None, motivo para omitir)"""
+    if not reparto.propio(numero):
+        # La sesión es de otro worker: allí se prepara y se encola; aquí se espera el resultado
+        return asyncio.ensure_future(difundir_en_dueno(numero, definicion, variables)), None
+    async with cerrojos_usuarios.de(numero):
+        sesion = obtener_sesion(numero)
+        if definicion["omitir_ocupados"] and sesion.estado in ESTADOS_EJERCICIO:
+            return None, "en_ejercicio"
+        if definicion["ejercicio"]:
+            if motor_ejercicios.obtener(definicion["ejercicio"]) is None:
+                return None, "ejercicio_no_disponible"
+            # La introducción sale por la difusión; los pasos, por el planificador como siempre
+            return iniciar_ejercicio(numero, definicion["ejercicio"]), None
+        if definicion["esperar_respuesta"]:
+            actualizar_sesion(numero, estado="esperando_feedback", esperando=True)
+        return redactar(definicion, numero, variables), None
+
+async def difundir_en_dueno(numero, definicion, variables):
+    respuesta = await reparto.llamar(reparto.dueno(numero), "/interno/difusion",
+                                     {"numero": numero, "definicion": definicion, "variables": variables})
+    if "omitido" in respuesta:
+        raise Omitido(respuesta["omitido"])
+    return respuesta["envio"]
+
+def sesiones_propias(filtro):
+    # Con sqlite o redis todos ven todas las sesiones: cada worker aporta solo las de sus usuarios.
+    # Recorre el almacén entero (SCAN + MGET con redis): se llama con asyncio.to_thread
+    return [numero for numero in filtrar_sesiones(almacen_sesiones.usuarios(), filtro) if reparto.propio(numero)]
+
+async def filtrar_cohorte(filtro):
+    """Números de las sesiones que cumplen el filtro, en todos los workers"""
+    numeros = await asyncio.to_thread(sesiones_propias, filtro)
+    otros = await asyncio.gather(*(reparto.llamar(i, "/interno/sesiones", filtro) for i in reparto.otros()))
+    for lista in otros:
+        numeros += lista
+    return numeros
+
+DIFUSION_SQLITE = os.getenv("DIFUSION_SQLITE", "difusiones.db")
+base_difusiones = None
+difusor = None
+if DIFUSION_SQLITE:
+    base_difusiones = BaseDifusiones(DIFUSION_SQLITE)
+    difusor = Difusor(
+        base_difusiones,
+        pipeline_envios.encolar,
+        preparar_difusion,
+        tasa=float(os.getenv("DIFUSION_TASA", "20")),
+        lote=int(os.getenv("DIFUSION_LOTE", "100")),
+        max_destinatarios=int(os.getenv("DIFUSION_MAX_DESTINATARIOS", "100000")),
+        simulado=twilio_client is None,
+    )
+
+# Endpoints de administración: Authorization: Bearer <ADMIN_TOKEN> (sin ADMIN_TOKEN quedan cerrados)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+async def exigir_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN no configurado")
+    recibido = request.headers.get("authorization", "").encode()
+    if not hmac.compare_digest(recibido, f"Bearer {ADMIN_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Token de administración inválido")
+
+async def exigir_difusor():
+    if difusor is None:
+        raise HTTPException(status_code=503, detail="Difusiones desactivadas (DIFUSION_SQLITE vacío)")
+    return difusor
+
+# Rutas entre workers del lanzador: solo por los sockets unix, por el puerto público no existen
+async def exigir_interno(request: Request):
+    if not reparto.es_interno(request.scope):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+# Lanzador: el maestro precarga antes del fork y cada worker se configura después
+def precargar(workers, en_caliente=False):
+    """En el maestro, antes de crear los workers: heredan el contenido ya cargado (copy-on-write)"""
+    if almacen_contenido.recargas == 0:
+        almacen_contenido.actual()  # contenido inválido: falla aquí una vez y no en cada worker
+    else:
+        almacen_contenido.recargar()
+    # Los diarios se reparten solo sin workers vivos que los estén escribiendo
+    if diario is not None and not en_caliente:
+        repartir_diario(DIARIO_RUTA, workers, particion, ttl=diario.ttl)
+
+def configurar_worker(indice, sockets):
+    """En cada worker, después del fork: su partición de usuarios y su diario"""
+    reparto.configurar(indice, sockets)
+    if diario is not None:
+        diario.ruta = ruta_particion(DIARIO_RUTA, indice, len(sockets))
+
+# Listo para recibir tráfico: desde que terminó el startup hasta que empieza el apagado
+servicio_listo = False
+
+# Ciclo de vida
+@app.on_event("startup")
+async def iniciar_servicios():
+    global servicio_listo
+    arranque.marcar("servidor")
+    almacen_contenido.iniciar()
+    if diario is not None:
+        restaurar_estado()
+        await diario.iniciar()
+    await pipeline_envios.iniciar()
+    await planificador.iniciar()
+    if cola_ingesta is not None:
+        await cola_ingesta.iniciar()
+    if difusor is not None:
+        await difusor.iniciar()
+    if analitica is not None:
+        await analitica.iniciar()
+    await monitor_loop.iniciar()
+    trazas.iniciar_vigia()
+    arranque.marcar("startup")
+    servicio_listo = True
+
+@app.on_event("shutdown")
+async def detener_servicios():
+    global servicio_listo
+    servicio_listo = False
+    await monitor_loop.detener()
+    trazas.detener_vigia()
+    if cola_ingesta is not None:
+        # Lo ya aceptado se procesa (y sus respuestas se encolan) antes de parar lo demás
+        await cola_ingesta.detener(limite=INGESTA_DRENAJE)
+    if difusor is not None:
+        # El lote en curso se envía y se anota: al reanudar no se repite
+        await difusor.detener()
+    await planificador.detener()
+    if analitica is not None:
+        # Después del planificador: los últimos pasos también anotan sus eventos
+        await analitica.detener()
+    if diario is not None:
+        await diario.detener()
+    await pipeline_envios.detener()
+    almacen_sesiones.cerrar()
+    if base_difusiones is not None:
+        base_difusiones.cerrar()
+    almacen_contenido.detener()
 
 # Endpoints
 @app.get("/")
@@ -311,73 +588,260 @@ def root():
         "status": "✅ AIuda WhatsApp Bot funcionando",
         "version": "2.1.0 - Ejercicios Automáticos",
         "webhook": "/whatsapp",
-        "ejercicios_automaticos": ["respiracion", "mindfulness"],
-        "ejercicios_interactivos": ["grounding"],
+        "ejercicios_automaticos": [n for n, p in motor_ejercicios.programas.items() if not p.interactivo],
+        "ejercicios_interactivos": [n for n, p in motor_ejercicios.programas.items() if p.interactivo],
         "twilio_configurado": twilio_client is not None
     }
 
+@app.get("/listo")
+async def listo():
+    """Readiness para el balanceador y el lanzador: 503 mientras arranca o se apaga"""
+    if not servicio_listo:
+        return Response(status_code=503, headers={"Retry-After": "1"})
+    return {"listo": True, "worker": reparto.indice, "workers": reparto.workers, "pid": os.getpid()}
+
 @app.post("/whatsapp")
 async def whatsapp_webhook(
-    background_tasks: BackgroundTasks,
+    request: Request,
     Body: str = Form(...),
     From: str = Form(...),
-    ProfileName: str = Form(None)
+    ProfileName: str = Form(None),
+    MessageSid: str = Form(None)
 ):
     """Recibe mensajes de WhatsApp vía Twilio y responde"""
     
+    inicio = time.perf_counter()
+    if cola_ingesta is not None:
+        return aceptar_mensaje(From, Body, ProfileName, MessageSid, inicio)
     try:
-        print(f"\n{'='*60}")
-        print(f"📩 Mensaje recibido")
-        print(f"   De: {ProfileName} ({From})")
-        print(f"   Texto: {Body}")
-        
-        sesion = obtener_sesion(From)
-        print(f"   Estado: {sesion['estado']}")
-        if sesion['ejercicio_actual']:
-            print(f"   Ejercicio: {sesion['ejercicio_actual']} - Paso: {sesion['paso_actual']}")
-        print(f"{'='*60}")
-        
-        # Procesar mensaje
-        respuesta_texto = procesar_mensaje(From, Body, background_tasks)
-        
-        # Si no hay respuesta inmediata (ej: grounding procesándose)
-        if respuesta_texto is None:
-            resp = MessagingResponse()
-            return Response(content=str(resp), media_type="application/xml")
+        async with cerrojos_usuarios.de(From):
+            # Reintento de Twilio: devolver lo mismo que la primera vez
+            xml_cacheado = cache_dedup.obtener(MessageSid)
+            if xml_cacheado is not None:
+                registro_webhook.info("reintento", de=From, sid=MessageSid)
+                return Response(content=xml_cacheado, media_type="application/xml")
+            
+            sesion = obtener_sesion(From)
+            estado_previo = sesion.estado
+            request.state.estado_sesion = estado_previo
+            
+            # Procesar mensaje
+            with trazas.tramo("procesar_mensaje"):
+                respuesta_texto = procesar_mensaje(From, Body)
+            
+            # Si no hay respuesta inmediata (ej: grounding procesándose) el TwiML va vacío
+            with trazas.tramo("twiml"):
+                xml_response = cache_respuestas.twiml(respuesta_texto)
+            cache_dedup.guardar(MessageSid, xml_response)
         
-        print(f"📤 Respuesta: {respuesta_texto[:100]}...")
-        print(f"{'='*60}\n")
-        
-        resp = MessagingResponse()
-        resp.message(respuesta_texto)
-        
-        return Response(content=str(resp), media_type="application/xml")
+        with trazas.tramo("registro"):
+            registrar_mensaje(From, ProfileName, Body, estado_previo, sesion, respuesta_texto, inicio)
+        return Response(content=xml_response, media_type="application/xml")
     
-    except Exception as e:
-        print(f"\n{'='*60}")
-        print(f"❌ ERROR: {e}")
-        print(f"{'='*60}")
-        import traceback
-        traceback.print_exc()
-        print(f"{'='*60}\n")
-        
-        resp = MessagingResponse()
-        resp.message("Error técnico. Escribe *menu* para reintentar.")
-        return Response(content=str(resp), media_type="application/xml")
+    except Exception:
+        registro_webhook.error("error_webhook", exc_info=True, de=From, sid=MessageSid)
+        return Response(content=cache_respuestas.twiml(respuestas.ERROR_TECNICO), media_type="application/xml")
+
+def aceptar_mensaje(From, Body, ProfileName, MessageSid, inicio):
+    """Webhook en modo ingesta: encolar y responder con TwiML vacío sin procesar nada"""
+    # Reintento de Twilio de un mensaje ya aceptado: no encolarlo otra vez
+    xml_cacheado = cache_dedup.obtener(MessageSid)
+    if xml_cacheado is not None:
+        registro_webhook.info("reintento", de=From, sid=MessageSid)
+        return Response(content=xml_cacheado, media_type="application/xml")
+    
+    if not cola_ingesta.encolar(From, Body, ProfileName, inicio):
+        registro_webhook.warning("ingesta_llena", de=From, sid=MessageSid)
+        return Response(status_code=503, headers={"Retry-After": INGESTA_RETRY_AFTER})
+    cache_dedup.guardar(MessageSid, respuestas.TWIML_VACIO)
+    arranque.primera_respuesta(registro_webhook, inicio)
+    return Response(content=respuestas.TWIML_VACIO, media_type="application/xml")
+
+@app.post("/admin/difusiones", status_code=202, dependencies=[Depends(exigir_admin)])
+async def crear_difusion(datos: dict = Body(...), difusor: Difusor = Depends(exigir_difusor)):
+    """Crea una difusión: {"mensaje" o "ejercicio", "destinatarios" y/o "filtro", "tasa", "id"}"""
+    if datos.get("ejercicio") and motor_ejercicios.obtener(datos["ejercicio"]) is None:
+        raise HTTPException(status_code=400, detail=f"Ejercicio desconocido: {datos['ejercicio']}")
+    try:
+        destinatarios = list(datos.get("destinatarios") or [])
+        filtro = datos.get("filtro")
+        if filtro is not None:
+            if not isinstance(filtro, dict):
+                raise ErrorDifusion("el filtro es un objeto {estado, ejercicio}")
+            destinatarios += await filtrar_cohorte(filtro)
+        id_difusion, creada = await difusor.crear(datos, destinatarios)
+    except (ErrorDifusion, ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ErrorReparto as e:
+        raise HTTPException(status_code=503, detail=f"No se pudo consultar a los demás workers: {e}")
+    progreso, = await asyncio.to_thread(base_difusiones.progreso, id_difusion)
+    return {"id": id_difusion, "creada": creada, "total": progreso["total"], "estado": progreso["estado"]}
+
+@app.get("/admin/difusiones", dependencies=[Depends(exigir_admin), Depends(exigir_difusor)])
+async def listar_difusiones():
+    return await asyncio.to_thread(base_difusiones.progreso)
+
+@app.get("/admin/difusiones/{id_difusion}", dependencies=[Depends(exigir_admin), Depends(exigir_difusor)])
+async def progreso_difusion(id_difusion: str):
+    progreso = await asyncio.to_thread(base_difusiones.progreso, id_difusion)
+    if not progreso:
+        raise HTTPException(status_code=404, detail="Difusión no encontrada")
+    return progreso[0]
+
+@app.get("/admin/difusiones/{id_difusion}/destinatarios", dependencies=[Depends(exigir_admin), Depends(exigir_difusor)])
+async def resultados_difusion(id_difusion: str, estado: str = None, limite: int = 1000, desde: int = 0):
+    """Resultado por destinatario, en el orden de la cohorte (paginar con `desde` = último orden + 1)"""
+    return await asyncio.to_thread(base_difusiones.resultados, id_difusion, estado, min(limite, 10000), desde)
+
+@app.post("/admin/difusiones/{id_difusion}/{accion}", dependencies=[Depends(exigir_admin)])
+async def cambiar_difusion(id_difusion: str, accion: str, difusor: Difusor = Depends(exigir_difusor)):
+    if accion not in ("pausar", "reanudar"):
+        raise HTTPException(status_code=404, detail="Acción desconocida")
+    cambiada = await (difusor.pausar(id_difusion) if accion == "pausar" else difusor.reanudar(id_difusion))
+    if not cambiada:
+        raise HTTPException(status_code=409, detail=f"La difusión no existe o no se puede {accion}")
+    return {"id": id_difusion, "estado": "pausada" if accion == "pausar" else "en_curso"}
+
+@app.get("/admin/analitica/embudo", dependencies=[Depends(exigir_admin)])
+async def embudo_analitica():
+    """Por ejercicio: iniciados, respuestas por paso, completados, cancelados (por último paso) y feedback"""
+    if analitica is None:
+        raise HTTPException(status_code=404, detail="Analítica desactivada (ANALITICA_SQLITE vacío)")
+    return await asyncio.to_thread(analitica.embudo)
+
+@app.get("/admin/perfil", dependencies=[Depends(exigir_admin)])
+async def perfil(segundos: float = 10, intervalo_ms: float = 5, todos_los_hilos: bool = False):
+    """Perfil de muestreo en formato collapsed (flamegraph.pl, speedscope): solo el event loop, o todos los hilos"""
+    hilo = None if todos_los_hilos else threading.get_ident()
+    try:
+        texto, muestras = await asyncio.to_thread(perfilador.muestrear, segundos, intervalo_ms / 1000, hilo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ErrorPerfil as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(texto, headers={"X-Aiuda-Worker": str(reparto.indice), "X-Aiuda-Muestras": str(muestras)})
+
+@app.get("/admin/trazas", dependencies=[Depends(exigir_admin)])
+async def ver_trazas():
+    """Las últimas peticiones y tareas lentas, de la más nueva a la más vieja, con sus tramos y pilas"""
+    lentas = [traza.como_dict() for traza in reversed(trazas.lentas)]
+    return {**trazas.estadisticas(), "worker": reparto.indice, "lentas": lentas}
+
+@app.post("/admin/trazas", dependencies=[Depends(exigir_admin)])
+async def configurar_trazas(datos: dict = Body(...)):
+    """{"activo": true | false, "umbral_ms": 500}; solo en el worker que recibe la petición"""
+    activo, umbral_ms = datos.get("activo"), datos.get("umbral_ms")
+    if activo is not None and not isinstance(activo, bool):
+        raise HTTPException(status_code=400, detail="activo es true o false")
+    if umbral_ms is not None and (not isinstance(umbral_ms, (int, float)) or umbral_ms <= 0):
+        raise HTTPException(status_code=400, detail="umbral_ms es un número positivo")
+    trazas.configurar(activo=activo, umbral=umbral_ms / 1000 if umbral_ms is not None else None)
+    return {**trazas.estadisticas(), "worker": reparto.indice}
+
+@app.post("/interno/difusion", dependencies=[Depends(exigir_interno)])
+async def difusion_interna(datos: dict = Body(...)):
+    """Un destinatario propio de una difusión que corre otro worker"""
+    texto, motivo = await preparar_difusion(datos["numero"], datos["definicion"], datos["variables"])
+    if texto is None:
+        return {"omitido": motivo}
+    return {"envio": await (await pipeline_envios.encolar(datos["numero"], texto))}
+
+@app.post("/interno/sesiones", dependencies=[Depends(exigir_interno)])
+async def sesiones_internas(filtro: dict = Body(...)):
+    return await asyncio.to_thread(sesiones_propias, filtro)
 
 @app.get("/test")
 def test_bot():
     return {
         "menu": formatear_menu_whatsapp(),
-        "sesiones_activas": len(sesiones_usuario),
-        "twilio_configurado": twilio_client is not None
+        "sesiones_activas": len(almacen_sesiones),
+        "twilio_configurado": twilio_client is not None,
+        "envios": pipeline_envios.estadisticas(),
+        "planificador": planificador.estadisticas(),
+        "concurrencia": cerrojos_usuarios.estadisticas(),
+        "event_loop": monitor_loop.estadisticas(),
+        "deduplicacion": cache_dedup.estadisticas(),
+        "admision": admision_webhook.estadisticas(),
+        "respuestas": cache_respuestas.estadisticas(),
+        "intenciones": clasificador.estadisticas(),
+        "crisis": detector_crisis.estadisticas(),
+        "diario": diario.estadisticas() if diario is not None else None,
+        "ingesta": cola_ingesta.estadisticas() if cola_ingesta is not None else None,
+        "difusion": difusor.estadisticas() if difusor is not None else None,
+        "reparto": reparto.estadisticas(),
+        "analitica": analitica.estadisticas() if analitica is not None else None,
+        "registros_descartados": registros_descartados(),
+        "perfilado": {"trazas": trazas.estadisticas(), "perfilador": perfilador.estadisticas()},
+        "arranque": arranque.estadisticas()
     }
 
+# Lo que ya cuentan los demás módulos se lee recién al exponer /metrics
+metricas.medidor("aiuda_ejercicios_activos", "Ejercicios en curso por tipo",
+                 planificador.activos_por_guion, ("ejercicio",))
+metricas.medidor("aiuda_pasos_pendientes", "Pasos programados que aún no se enviaron",
+                 lambda: planificador.estadisticas()["pasos_pendientes"])
+metricas.medidor("aiuda_envios_total", "Mensajes enviados a Twilio",
+                 lambda: pipeline_envios.enviados, tipo="counter")
+metricas.medidor("aiuda_envios_errores_total", "Envíos a Twilio que fallaron",
+                 lambda: pipeline_envios.errores, tipo="counter")
+metricas.medidor("aiuda_envios_reintentos_total", "Envíos reintentados tras un 429",
+                 lambda: pipeline_envios.reintentos, tipo="counter")
+metricas.medidor("aiuda_envios_agrupados_total", "Mensajes que salieron dentro de otro envío",
+                 lambda: pipeline_envios.agrupados + planificador.pasos_agrupados, tipo="counter")
+metricas.medidor("aiuda_envios_en_cola", "Mensajes esperando en las colas de envío",
+                 lambda: pipeline_envios.estadisticas()["en_cola"])
+metricas.medidor("aiuda_contenido_recargas_total", "Recargas de menu.json y ejercicios.json",
+                 lambda: almacen_contenido.recargas, tipo="counter")
+metricas.medidor("aiuda_contenido_errores_recarga_total", "Recargas rechazadas por contenido inválido",
+                 lambda: almacen_contenido.errores_recarga, tipo="counter")
+metricas.medidor("aiuda_event_loop_retraso_actual_segundos", "Último retraso medido del event loop",
+                 lambda: monitor_loop.retraso)
+metricas.medidor("aiuda_event_loop_tareas", "Tareas asyncio vivas",
+                 lambda: monitor_loop.tareas)
+metricas.medidor("aiuda_deduplicacion_aciertos_total", "Webhooks reentregados respondidos desde la caché",
+                 lambda: cache_dedup.aciertos + cache_dedup.aciertos_respaldo, tipo="counter")
+metricas.medidor("aiuda_reparto_reenviados_total", "Webhooks reenviados al worker dueño del remitente",
+                 lambda: reparto.reenviados, tipo="counter")
+metricas.medidor("aiuda_reparto_errores_total", "Peticiones a otro worker que fallaron",
+                 lambda: reparto.errores, tipo="counter")
+if analitica is not None:
+    metricas.medidor("aiuda_analitica_eventos_total", "Eventos de ejercicios anotados",
+                     lambda: analitica.registrados, tipo="counter")
+    metricas.medidor("aiuda_analitica_descartados_total", "Eventos perdidos con el buffer lleno",
+                     lambda: analitica.descartados, tipo="counter")
+metricas.medidor("aiuda_trazas_lentas_total", "Peticiones y tareas trazadas que superaron PERFIL_UMBRAL_MS",
+                 lambda: trazas.lentas_total, tipo="counter")
+metricas.medidor("aiuda_webhook_rechazados_total", "Webhooks rechazados antes de procesar, por motivo",
+                 lambda: admision_webhook.rechazados, ("motivo",), tipo="counter")
+
+if cola_ingesta is not None:
+    metricas.medidor("aiuda_ingesta_en_cola", "Mensajes aceptados que esperan a un trabajador",
+                     lambda: cola_ingesta.estadisticas()["en_cola"])
+    metricas.medidor("aiuda_ingesta_rechazados_total", "Webhooks respondidos con 503 por la cola llena",
+                     lambda: cola_ingesta.rechazados, tipo="counter")
+
+if difusor is not None:
+    metricas.medidor("aiuda_difusion_destinatarios_total", "Destinatarios de difusiones atendidos, por resultado",
+                     lambda: difusor.resultados, ("resultado",), tipo="counter")
+    metricas.medidor("aiuda_difusiones_en_curso", "Difusiones que este worker está enviando",
+                     lambda: difusor.estadisticas()["en_curso"])
+
+@app.get("/metrics")
+async def metrics():
+    # async: corre en el event loop, igual que quien modifica las métricas
+    return PlainTextResponse(metricas.exponer(), media_type=TIPO_CONTENIDO)
+
+arranque.marcar("modulo")
+
 if __name__ == "__main__":
+    # Un solo proceso (desarrollo, o Windows); en producción: python lanzador.py --workers N
+    import uvicorn
+    HOST = os.getenv("HOST", "0.0.0.0")
+    PORT = int(os.getenv("PORT", "8000"))
     print("\n" + "="*60)
     print("🚀 AIuda WhatsApp Bot v2.1 - Ejercicios Automáticos")
     print("="*60)
-    print("📍 Servidor: http://0.0.0.0:5000")
+    print(f"📍 Servidor: http://{HOST}:{PORT}")
     print("✨ Funcionalidades:")
     print("   🫁 Respiración: Automática con pausas reales")
     print("   🌍 Grounding: Interactiva con respuestas empáticas")
@@ -394,4 +858,4 @@ if __name__ == "__main__":
         print("="*60)
     
     print()
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host=HOST, port=PORT)
\ No newline at end of file